@@ -496,7 +496,10 @@ class AbstractCollect(object):
                 lims_image['jpegThumbnailFileFullPath'] = jpeg_thumbnail_full_path
             if motor_position_id:
                 lims_image['motorPositionId'] = motor_position_id
-            image_id = self.lims_client_hwobj.store_image(lims_image) 
+            # the id of images stored with a motor position is needed now,
+            # the other images are queued by the lims client
+            image_id = self.lims_client_hwobj.store_image(lims_image,
+                wait=motor_position_id is not None)
             return image_id
 
     def get_sample_info(self):
@@ -2,9 +2,99 @@ import os
 import time
 import abc
 import logging
+import numpy
 from HardwareRepository.TaskUtils import *
 
 
+def rebin_continuous_scan(scan_data, start_energy, end_energy, num_points):
+    """
+    Descript. : rebins the time stamped frames of a continuous scan
+                into num_points energy points. The energy of each
+                frame is interpolated from the monochromator readings
+                at the frame time, counts are normalised by the monitor
+    Return    : (energies, values) numpy arrays, empty bins are dropped
+    """
+    frame_energy = numpy.interp(scan_data["frame_time"],
+                                scan_data["mono_time"],
+                                scan_data["mono_energy"])
+    edges = numpy.linspace(min(start_energy, end_energy),
+                           max(start_energy, end_energy),
+                           num_points + 1)
+    counts = numpy.histogram(frame_energy, edges,
+                             weights=scan_data["counts"])[0]
+    monitor = numpy.histogram(frame_energy, edges,
+                              weights=scan_data["monitor"])[0]
+
+    valid = monitor > 0
+    energies = ((edges[:-1] + edges[1:]) / 2.0)[valid]
+    values = counts[valid] / monitor[valid]
+    return energies, values
+
+
+class ContinuousScanSimulator(object):
+    """
+    Descript. : stand-in for the monochromator and the gated MCA
+                of a continuous scan. The mono sweeps at constant speed,
+                the fluorescence follows an absorption edge with a
+                white line and counting noise
+    """
+    def __init__(self, edge_energy, mono_period=0.005, frame_time=0.01):
+        self.edge_energy = edge_energy
+        self.mono_period = mono_period
+        self.frame_time = frame_time
+        self.start_energy = None
+        self.end_energy = None
+        self.duration = None
+        self.start_time = None
+
+    def start(self, start_energy, end_energy, duration):
+        self.start_energy = start_energy
+        self.end_energy = end_energy
+        self.duration = duration
+        self.start_time = time.time()
+
+    def energy_at(self, timestamp):
+        fraction = numpy.clip((timestamp - self.start_time) / self.duration,
+                              0, 1)
+        return self.start_energy + \
+               (self.end_energy - self.start_energy) * fraction
+
+    def fluorescence(self, energy):
+        width = 0.002
+        step = 0.5 + numpy.arctan((energy - self.edge_energy) / width) / \
+               numpy.pi
+        white_line = numpy.exp(-((energy - self.edge_energy - width) / \
+                                 width) ** 2)
+        return 100 + 1000 * step + 600 * white_line
+
+    def read_data(self):
+        """
+        Descript. : waits for the end of the sweep and returns the
+                    mono readings and the gated detector frames
+        """
+        gevent.sleep(max(0, self.start_time + self.duration - time.time()))
+
+        mono_time = numpy.arange(self.start_time,
+                                 self.start_time + self.duration + \
+                                 self.mono_period, self.mono_period)
+        mono_energy = self.energy_at(mono_time) + \
+                      numpy.random.normal(0, 1e-5, mono_time.size)
+        frame_start = numpy.arange(self.start_time,
+                                   self.start_time + self.duration,
+                                   self.frame_time)
+        frame_time = frame_start + self.frame_time / 2.0
+        monitor = numpy.random.normal(1, 1e-3, frame_time.size)
+        counts = numpy.random.poisson(
+            self.fluorescence(self.energy_at(frame_time)) * \
+            self.frame_time * 100) * monitor
+
+        return {"mono_time": mono_time,
+                "mono_energy": mono_energy,
+                "frame_time": frame_time,
+                "counts": counts,
+                "monitor": monitor}
+
+
 class AbstractEnergyScan(object):
     __metaclass__ = abc.ABCMeta
 
@@ -12,6 +102,8 @@ class AbstractEnergyScan(object):
         self.data_collect_task = None
         self._egyscan_task = None
         self.scanning = False
+        self.continuous_scan_simulator = None
+        self.continuous_scan_data = None
 
     def open_safety_shutter(self, timeout):
         """
@@ -53,6 +145,62 @@ class AbstractEnergyScan(object):
         """       
         pass
 
+    def start_continuous_scan(self, start_energy, end_energy, duration):
+        """
+        Start the continuous scan: sweep the monochromator from start to
+        end energy [keV] at constant speed in duration [s], with the
+        fluorescence detector and the monitor gated and time stamped.
+        Beamline HOs supporting the continuous mode override this and
+        read_continuous_scan_data. Otherwise a simulated mono and MCA are
+        used if simulate_continuous_scan is set.
+        """
+        if not self.getProperty("simulate_continuous_scan"):
+            raise NotImplementedError("Continuous energy scan not supported")
+
+        self.continuous_scan_simulator = ContinuousScanSimulator(
+            self.energy_scan_parameters["edgeEnergy"])
+        self.continuous_scan_simulator.start(start_energy, end_energy,
+                                             duration)
+
+    def read_continuous_scan_data(self):
+        """
+        Wait for the end of the sweep and return a dictionary of numpy
+        arrays: mono_time, mono_energy (monochromator readings) and
+        frame_time, counts, monitor (one entry per detector frame).
+        """
+        return self.continuous_scan_simulator.read_data()
+
+    def store_continuous_scan_data(self, energies, values):
+        """
+        Store the rebinned scan (energy [keV], normalised counts), where
+        the beamline specific doChooch expects to find the scan data.
+        """
+        pass
+
+    def execute_continuous_energy_scan(self, energy_scan_parameters):
+        """
+        Execute the scan with the monochromator moving continuously and
+        rebin the time stamped detector frames into energy points.
+        """
+        start_energy = energy_scan_parameters["startEnergy"]
+        end_energy = energy_scan_parameters["endEnergy"]
+        duration = self.getProperty("continuous_scan_duration") or 10
+        num_points = self.getProperty("continuous_scan_points") or 100
+
+        self.open_fast_shutter()
+        try:
+            self.start_continuous_scan(start_energy, end_energy, duration)
+            scan_data = self.read_continuous_scan_data()
+        finally:
+            self.close_fast_shutter()
+
+        energies, values = rebin_continuous_scan(scan_data, start_energy,
+                                                 end_energy, num_points)
+        self.continuous_scan_data = (energies, values)
+        for energy, value in zip(energies, values):
+            self.emit('scanNewPoint', (energy * 1000.0, value))
+        self.store_continuous_scan_data(energies, values)
+
     def get_static_parameters(self, config_file, element, edge):
         """
         Get any parameters, which are known before hand. Some of them are
@@ -129,7 +277,10 @@ class AbstractEnergyScan(object):
             self.choose_attenuation()
             self.close_fast_shutter()
             logging.getLogger("HWR").debug("Doing the scan, please wait...")
-            self.execute_energy_scan(self.energy_scan_parameters)
+            if self.energy_scan_parameters.get("continuous"):
+                self.execute_continuous_energy_scan(self.energy_scan_parameters)
+            else:
+                self.execute_energy_scan(self.energy_scan_parameters)
             self.escan_postscan()
             self.close_fast_shutter()
             self.close_safety_shutter(timeout=10)
@@ -137,7 +288,7 @@ class AbstractEnergyScan(object):
             self.emit('energyScanFinished', (self.energy_scan_parameters,))
             self.ready_event.set()
            
-    def startEnergyScan(self,element,edge,directory,prefix,session_id=None,blsample_id=None):
+    def startEnergyScan(self,element,edge,directory,prefix,session_id=None,blsample_id=None,continuous=None):
         if self._egyscan_task and not self._egyscan_task.ready():
             raise RuntimeError("Scan already started.")
 
@@ -150,6 +301,9 @@ class AbstractEnergyScan(object):
         self.energy_scan_parameters["element"] = element
         self.energy_scan_parameters["edge"] = edge
         self.energy_scan_parameters["directory"] = directory
+        if continuous is None:
+            continuous = self.getProperty("continuous_scan") or False
+        self.energy_scan_parameters["continuous"] = continuous
 
         #Calculate the MCA ROI (if needed)
         try:
@@ -0,0 +1,147 @@
+"""
+Archiving of the energy scan and Chooch results, done off the scan task.
+
+Energy scan HOs emit the Chooch numbers as soon as PyChooch returns and
+submit an ArchiveJob to a small pool of worker threads. The job writes
+the raw scan file, copies the efs file and renders the scan and Chooch
+graphs to PNG. Every file is written once, then copied to the other
+locations. The copies are never hard linked: the process directory files
+are rewritten in place by the next scan, which would overwrite the
+archived ones through a shared inode.
+
+submit() takes a callback, called in a new greenlet with the job once it
+is done, so that the scan is stored in ISPyB only when its files exist.
+The callback should get its own copy of the scan parameters: a new scan
+may have started by the time the job is done.
+"""
+
+import os
+import shutil
+import logging
+
+import gevent
+import gevent.threadpool
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+WORKERS_NUM = 2
+
+__pool = None
+
+
+def get_pool():
+    """
+    Descript. : returns the worker pool, created on first use
+    """
+    global __pool
+    if __pool is None:
+        __pool = gevent.threadpool.ThreadPool(WORKERS_NUM)
+    return __pool
+
+
+def copy_file(source, destination):
+    """
+    Descript. : copies source to destination, replacing the destination
+    """
+    if os.path.abspath(source) == os.path.abspath(destination):
+        return
+    dirname = os.path.dirname(destination)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    if os.path.exists(destination):
+        os.remove(destination)
+    shutil.copyfile(source, destination)
+
+
+class ArchiveJob(object):
+    """
+    Descript. : writes raw, efs and png files of one energy scan
+    """
+    def __init__(self, scan_data, chooch_graph_x, chooch_graph_y1,
+                 chooch_graph_y2, title, efs_filename):
+        self.scan_data = scan_data
+        self.chooch_graph_x = chooch_graph_x
+        self.chooch_graph_y1 = chooch_graph_y1
+        self.chooch_graph_y2 = chooch_graph_y2
+        self.title = title
+        self.efs_filename = efs_filename
+        self.raw_filenames = []
+        self.efs_copies = []
+        self.png_filenames = []
+        self.written = set()
+        self.failed_steps = []
+
+    def write_raw_files(self):
+        if not self.raw_filenames:
+            return
+        raw_file = open(self.raw_filenames[0], "w")
+        raw_file.write("".join(["%f,%f\r\n" % (x, y) for x, y in \
+                                self.scan_data]))
+        raw_file.close()
+        self.written.add(self.raw_filenames[0])
+        for filename in self.raw_filenames[1:]:
+            copy_file(self.raw_filenames[0], filename)
+            self.written.add(filename)
+
+    def copy_efs_files(self):
+        for filename in self.efs_copies:
+            copy_file(self.efs_filename, filename)
+            self.written.add(filename)
+
+    def render_png_files(self):
+        if not self.png_filenames:
+            return
+        fig = Figure(figsize=(15, 11))
+        ax = fig.add_subplot(211)
+        ax.set_title("%s\n%s" % (self.efs_filename, self.title))
+        ax.grid(True)
+        ax.plot(*(zip(*self.scan_data)), **{"color": 'black'})
+        ax.set_xlabel("Energy")
+        ax.set_ylabel("MCA counts")
+        ax2 = fig.add_subplot(212)
+        ax2.grid(True)
+        ax2.set_xlabel("Energy")
+        ax2.set_ylabel("")
+        ax2.plot(self.chooch_graph_x, self.chooch_graph_y1, color='blue')
+        ax2.plot(self.chooch_graph_x, self.chooch_graph_y2, color='red')
+        canvas = FigureCanvasAgg(fig)
+
+        logging.getLogger("HWR").info("Rendering energy scan and Chooch " + \
+             "graphs to PNG file : %s", self.png_filenames[0])
+        canvas.print_figure(self.png_filenames[0], dpi=80)
+        self.written.add(self.png_filenames[0])
+        for filename in self.png_filenames[1:]:
+            logging.getLogger("HWR").info("Saving energy scan to " + \
+                 "archive directory for ISPyB : %s", filename)
+            copy_file(self.png_filenames[0], filename)
+            self.written.add(filename)
+
+    def run(self):
+        for step in (self.write_raw_files, self.copy_efs_files,
+                     self.render_png_files):
+            try:
+                step()
+            except:
+                logging.getLogger("HWR").exception(\
+                    "Energy scan archiving: %s failed" % step.__name__)
+                self.failed_steps.append(step.__name__)
+
+    def is_written(self, filename):
+        """
+        Descript. : True if the job has written filename
+        """
+        return filename in self.written
+
+    def submit(self, callback=None):
+        """
+        Descript. : runs the job in the worker pool
+        Args.     : callback, called in a new greenlet with the job
+                    once it is done
+        Return    : AsyncResult of the job
+        """
+        task = get_pool().spawn(self.run)
+        if callback is not None:
+            task.rawlink(lambda result: gevent.spawn(callback, self))
+        return task
@@ -25,8 +25,11 @@ __license__ = "GPL"
 
 
 import gevent
+import gevent.event
+import gevent.lock
 import httplib
 import json
+import logging
 
 from PyQt4 import QtGui
 from PyQt4 import QtCore
@@ -260,6 +263,12 @@ class Qt4_MjpgStreamVideo(Device):
         self.plugin = 0
         self.updateControls = None
         self.inputAvt = None
+        self.stream = None
+        self.image_streaming = None
+        self.control_connection = None
+        self.control_lock = gevent.lock.Semaphore()
+        self.latest_jpeg = None
+        self.new_jpeg_event = gevent.event.Event()
 
     def init(self):
         """
@@ -275,6 +284,7 @@ class Qt4_MjpgStreamVideo(Device):
         self.port = int(self.getProperty("port"))
         self.path = "/"
         self.plugin = 0
+        self.stream = bool(self.getProperty("stream"))
         self.updateControls = self.hasUpdateControls()
         self.inputAvt = self.isInputAvt()
         self.image = self.get_new_image()
@@ -296,20 +306,39 @@ class Qt4_MjpgStreamVideo(Device):
         if(host is None): host = self.host
         if(port is None): port = self.port
         if(path is None): path = self.path
-        # send get request and return response
-        http = httplib.HTTPConnection(host, port, timeout=3)
-        try:
-            http.request("GET", path+query)
-            response = http.getresponse()
-        except:
-            logging.getLogger().error("MjpgStreamVideo: Connection to http://{0}:{1}{2}{3} refused".format(host, port, path, query))
-            return None
-        if response.status != 200:
-            logging.getLogger().error("MjpgStreamVideo: Error {0}, {1}".format(response.status, response.reason))
-            return None
-        data = response.read()
-        http.close()
-        return data
+        # requests to the default server reuse one keep-alive connection
+        pooled = (host == self.host and port == self.port)
+        # the pooled connection is shared by the polling greenlet and the
+        # control calls, requests on it are sent one at a time
+        with (self.control_lock if pooled else gevent.lock.DummySemaphore()):
+            for attempt in range(2):
+                if pooled:
+                    if self.control_connection is None:
+                        self.control_connection = httplib.HTTPConnection(host, port, timeout=3)
+                    http = self.control_connection
+                else:
+                    http = httplib.HTTPConnection(host, port, timeout=3)
+                try:
+                    http.request("GET", path+query)
+                    response = http.getresponse()
+                    data = response.read()
+                    break
+                except Exception:
+                    http.close()
+                    if pooled:
+                        self.control_connection = None
+                    # a pooled connection may have been closed by the server
+                    if not pooled or attempt > 0:
+                        logging.getLogger().error("MjpgStreamVideo: Connection to http://{0}:{1}{2}{3} refused".format(host, port, path, query))
+                        return None
+            if not pooled or response.will_close:
+                http.close()
+                if pooled:
+                    self.control_connection = None
+            if response.status != 200:
+                logging.getLogger().error("MjpgStreamVideo: Error {0}, {1}".format(response.status, response.reason))
+                return None
+            return data
 
     def sendCmd(self, value, cmd, group=None, plugin=None, dest=None):
         """Sends a command to mjpg-streamer.
@@ -479,6 +508,9 @@ class Qt4_MjpgStreamVideo(Device):
         return False
 
     def start_camera(self):
+        if self.stream:
+            if self.image_streaming is None:
+                self.image_streaming = gevent.spawn(self._do_imageStreaming)
         if self.image_polling is None:
             self.image_polling = gevent.spawn(self._do_imagePolling, 1.0 / self.sleep_time)
 
@@ -613,7 +645,15 @@ class Qt4_MjpgStreamVideo(Device):
         return self.image_dimensions[1]
 
     def get_new_image(self):
-        image = self.httpGet("?action=snapshot")
+        """
+        Descript. : returns mirrored QImage of the newest frame. In stream
+                    mode the frame comes from the persistent stream, 
+                    otherwise a snapshot is requested
+        """
+        if self.stream and self.image_streaming is not None:
+            image = self.latest_jpeg
+        else:
+            image = self.httpGet("?action=snapshot")
         if image is not None:
             return QtGui.QImage.fromData(image).mirrored(self.flip["h"], self.flip["v"])
         return None
@@ -633,11 +673,52 @@ class Qt4_MjpgStreamVideo(Device):
 
     def _do_imagePolling(self, sleep_time):
         """
-        Descript. :
+        Descript. : emits new frames at most every sleep_time seconds.
+                    In stream mode waits for a frame newer than the last
+                    emitted one, stale frames are dropped by the reader
         """ 
         while True:
+            if self.stream:
+                self.new_jpeg_event.wait()
+                self.new_jpeg_event.clear()
             image = self.get_new_image()
             if image is not None:
-                self.image = QtGui.QPixmap.fromImage(image.scaled(self.width, self.height))
+                if image.width() != self.getWidth() or \
+                   image.height() != self.getHeight():
+                    image = image.scaled(self.getWidth(), self.getHeight())
+                self.image = QtGui.QPixmap.fromImage(image)
                 self.emit("imageReceived", self.image)
             gevent.sleep(sleep_time)
+
+    def _do_imageStreaming(self):
+        """
+        Descript. : reads multipart ?action=stream feed over one persistent
+                    connection. Only the newest jpeg frame is kept
+        """
+        while True:
+            http = httplib.HTTPConnection(self.host, self.port, timeout=3)
+            try:
+                http.request("GET", self.path + "?action=stream")
+                response = http.getresponse()
+                if response.status != 200:
+                    raise RuntimeError("Error {0}, {1}".format(response.status,
+                                                               response.reason))
+                while True:
+                    content_length = None
+                    # part headers end with an empty line
+                    while True:
+                        line = response.fp.readline()
+                        if not line:
+                            raise RuntimeError("Stream closed by server")
+                        line = line.strip()
+                        if line.lower().startswith("content-length:"):
+                            content_length = int(line.split(":")[1])
+                        elif not line and content_length is not None:
+                            break
+                    self.latest_jpeg = response.fp.read(content_length)
+                    self.new_jpeg_event.set()
+            except Exception:
+                logging.getLogger().exception("MjpgStreamVideo: stream from http://{0}:{1}{2} interrupted, reconnecting".format(self.host, self.port, self.path))
+            finally:
+                http.close()
+            gevent.sleep(1)
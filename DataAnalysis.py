@@ -1,9 +1,10 @@
 import os
+import shlex
 import logging
 import gevent.event
-import threading
-import subprocess
 import AbstractDataAnalysis
+import JobScheduler
+import XSDataFastParser
 
 import queue_model_enumerables_v1 as qme
 
@@ -30,38 +31,17 @@ from XSDataCommon import XSDataString
 #from edna_test_data import EDNA_TEST_DATA
 
 
-class EdnaProcessingThread(threading.Thread):
-    def __init__(self, edna_cmd, edna_input_file, edna_output_file, base_dir):
-        threading.Thread.__init__(self)
-
-        self.edna_cmd = edna_cmd
-        self.edna_input_file = edna_input_file
-        self.edna_output_file = edna_output_file
-        self.base_dir = base_dir
-
-    def start(self):
-        self.edna_processing_watcher = gevent.get_hub().loop.async()
-        self.edna_processing_done = gevent.event.Event()
-        threading.Thread.start(self)
-        return self.edna_processing_done
-
-    def run(self):
-        self.edna_processing_watcher.start(self.edna_processing_done.set)
-        args = (self.edna_cmd, self.edna_input_file,
-                self.edna_output_file, self.base_dir)
-        subprocess.call("%s %s %s %s" % args, shell=True)
-        self.edna_processing_watcher.send()
-
-
 class DataAnalysis(AbstractDataAnalysis.AbstractDataAnalysis, HardwareObject):
     def __init__(self, name):
         HardwareObject.__init__(self, name)
         self.collect_obj = None
+        self.job_scheduler = None
         self.result = None
         self.processing_done_event = gevent.event.Event()
 
     def init(self):
         self.collect_obj = self.getObjectByRole("collect")
+        self.job_scheduler = self.getObjectByRole("job_scheduler")
         self.start_edna_command = self.getProperty("edna_command")
         self.edna_default_file = self.getProperty("edna_default_file")
         hwr_dir = HardwareRepository().getHardwareRepositoryPath()
@@ -252,13 +232,15 @@ class DataAnalysis(AbstractDataAnalysis.AbstractDataAnalysis, HardwareObject):
         msg = "Starting EDNA using xml file %r", edna_input_file
         logging.getLogger("queue_exec").info(msg)
 
-        edna_processing_thread = \
-          EdnaProcessingThread(self.start_edna_command, edna_input_file,
-                               edna_results_file, edna_directory)
+        job_scheduler = self.job_scheduler or JobScheduler.get_scheduler()
+        edna_job = job_scheduler.submit(shlex.split(self.start_edna_command) + \
+            [edna_input_file, edna_results_file, edna_directory],
+            "characterisation")
 
-        self.processing_done_event = edna_processing_thread.start()
-        self.processing_done_event.wait()
-        self.result = XSDataResultMXCuBE.parseFile(edna_results_file)
+        self.processing_done_event = edna_job.done_event
+        edna_job.wait()
+        self.result = XSDataFastParser.parse_file(XSDataResultMXCuBE,
+                                                  edna_results_file)
 
         return self.result
 
@@ -25,7 +25,7 @@ import os
 import time
 import logging
 import gevent 
-import subprocess
+import JobScheduler
 
 from XSDataAutoprocv1_0 import XSDataAutoprocInput
 
@@ -54,12 +54,14 @@ class EMBLAutoProcessing(HardwareObject):
         self.result = None
         self.autoproc_programs = None
         self.current_autoproc_procedure = None
+        self.job_scheduler = None
 
     def init(self):
         """
         Descript. :
         """
         self.autoproc_programs = self["programs"]
+        self.job_scheduler = self.getObjectByRole("job_scheduler")
 
     def execute_autoprocessing(self, process_event, params_dict, 
                                frame_number, run_processing=True):
@@ -100,30 +102,32 @@ class EMBLAutoProcessing(HardwareObject):
                 executable = program.getProperty("executable")
                 if os.path.isfile(executable):	
                     will_execute = False
+                    job_program = "autoprocessing"
                     if process_event == "after": 
                         input_filename, will_execute = self.\
                             create_autoproc_input(process_event, params_dict)
                         if will_execute:
-                            endOfLineToExecute = ' ' + input_filename + ' ' + str(run_processing)
+                            arguments = [input_filename, str(run_processing)]
                     elif process_event == "after_queued":
                         will_execute = run_processing
-                        endOfLineToExecute = " " + params_dict["xds_dir"]
+                        arguments = [params_dict["xds_dir"]]
                     elif process_event == 'image':
                         if frame_number == 1 or frame_number == \
                             params_dict['oscillation_sequence'][0]['number_of_images']:
-                            endOfLineToExecute = " %s %s/%s_%d_%05d.cbf" % \
-                               (params_dict["fileinfo"]["directory"],
-                                params_dict["fileinfo"]["directory"], 
+                            arguments = [params_dict["fileinfo"]["directory"],
+                                         "%s/%s_%d_%05d.cbf" % \
+                               (params_dict["fileinfo"]["directory"], 
                                 params_dict["fileinfo"]["prefix"],
                                 params_dict["fileinfo"]["run_number"], 
-                                frame_number)
+                                frame_number)]
+                            job_program = "thumbnails"
                             will_execute = True 	
 
                     if will_execute:	
-                        lineToExecute = executable + endOfLineToExecute
-                        subprocess.Popen(str(lineToExecute), shell = True, 
-                                    stdin = None, stdout = None, stderr = None, 
-                                    close_fds = True)	
+                        job_scheduler = self.job_scheduler or \
+                            JobScheduler.get_scheduler()
+                        job_scheduler.submit([executable] + arguments,
+                                             job_program)
                 else:
                     logging.getLogger().error("EMBLAutoprocessing: No program to execute found (%s)", executable)
 
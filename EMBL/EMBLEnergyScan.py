@@ -25,10 +25,10 @@ import os
 import math
 import time
 import gevent
+import functools
 import logging
 import PyChooch
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_agg import FigureCanvasAgg
+import ChoochArchive
 
 from AbstractEnergyScan import AbstractEnergyScan
 from HardwareRepository.TaskUtils import *
@@ -306,25 +306,22 @@ class EMBLEnergyScan(AbstractEnergyScan, HardwareObject):
             return
 
         try:
-            scan_file_raw = open(scan_file_raw_filename, "w")
-            archive_file_raw = open(archive_file_raw_filename, "w")
+            # reserve the file names, files are written by the archive workers
+            open(scan_file_raw_filename, "w").close()
+            open(archive_file_raw_filename, "w").close()
         except:
             logging.getLogger("HWR").exception("EMBLEnergyScan: could not create energy scan result raw file")
             self.store_energy_scan()
             self.emit("energyScanFailed", ())
             return
-        else:
-            scanData = []
-            for i in range(len(self.scanData)):
-                x = float(self.scanData[i][0])
-                x = x < 1000 and x * 1000.0 or x 
-                y = float(self.scanData[i][1])
-                scanData.append((x, y))
-                scan_file_raw.write("%f,%f\r\n" % (x, y))
-                archive_file_raw.write("%f,%f\r\n" % (x, y)) 
-            scan_file_raw.close()
-            archive_file_raw.close()
-            self.scanInfo["scanFileFullPath"] = str(scan_file_raw_filename)
+
+        scanData = []
+        for i in range(len(self.scanData)):
+            x = float(self.scanData[i][0])
+            x = x < 1000 and x * 1000.0 or x 
+            y = float(self.scanData[i][1])
+            scanData.append((x, y))
+        self.scanInfo["scanFileFullPath"] = str(scan_file_raw_filename)
 
         pk, fppPeak, fpPeak, ip, fppInfl, fpInfl, chooch_graph_data = \
              PyChooch.calc(scanData, elt, edge, scan_file_efs_filename)
@@ -356,18 +353,6 @@ class EMBLEnergyScan(AbstractEnergyScan, HardwareObject):
                    (savpk, (self.thEdge - ip) > 0.02 and "below" or "above", self.thEdge))
         """
 
-        try:
-            fi = open(scan_file_efs_filename)
-            fo = open(archive_file_efs_filename, "w")
-        except:
-            self.store_energy_scan()
-            self.emit("energyScanFailed", ())
-            return
-        else:
-            fo.write(fi.read())
-            fi.close()
-            fo.close()
-
         self.scanInfo["peakEnergy"] = pk
         self.scanInfo["inflectionEnergy"] = ip
         self.scanInfo["remoteEnergy"] = rm
@@ -382,45 +367,25 @@ class EMBLEnergyScan(AbstractEnergyScan, HardwareObject):
         for i in range(len(chooch_graph_x)):
             chooch_graph_x[i] = chooch_graph_x[i] / 1000.0
 
-        #logging.getLogger("HWR").info("EMBLEnergyScan: Saving png" )
-        # prepare to save png files
         title = "%s  %s  %s\n%.4f  %.2f  %.2f\n%.4f  %.2f  %.2f" % \
               ("energy", "f'", "f''", pk, fpPeak, fppPeak, ip, fpInfl, fppInfl) 
-        fig = Figure(figsize = (15, 11))
-        ax = fig.add_subplot(211)
-        ax.set_title("%s\n%s" % (scan_file_efs_filename, title))
-        ax.grid(True)
-        ax.plot(*(zip(*scanData)), **{"color": 'black'})
-        ax.set_xlabel("Energy")
-        ax.set_ylabel("MCA counts")
-        ax2 = fig.add_subplot(212)
-        ax2.grid(True)
-        ax2.set_xlabel("Energy")
-        ax2.set_ylabel("")
-        handles = []
-        handles.append(ax2.plot(chooch_graph_x, chooch_graph_y1, color = 'blue'))
-        handles.append(ax2.plot(chooch_graph_x, chooch_graph_y2, color = 'red'))
-        canvas = FigureCanvasAgg(fig)
-
         self.scanInfo["jpegChoochFileFullPath"] = str(archive_file_png_filename)
-        try:
-            logging.getLogger("HWR").info("Rendering energy scan and Chooch " + \
-                 "graphs to PNG file : %s", scan_file_png_filename)
-            canvas.print_figure(scan_file_png_filename, dpi = 80)
-        except:
-            logging.getLogger("HWR").exception("could not print figure")
-        try:
-            logging.getLogger("HWR").info("Saving energy scan to archive " +\
-                 "directory for ISPyB : %s", archive_file_png_filename)
-            canvas.print_figure(archive_file_png_filename, dpi = 80)
-        except:
-            logging.getLogger("HWR").exception("could not save figure")
-
-        self.store_energy_scan()
 
         logging.getLogger("HWR").info("<chooch> returning" )
         self.emit('choochFinished', (pk, fppPeak, fpPeak, ip, fppInfl, fpInfl, 
                  rm, chooch_graph_x, chooch_graph_y1, chooch_graph_y2, title))
+
+        # raw, efs and png files are written by the archive workers
+        archive_job = ChoochArchive.ArchiveJob(scanData, chooch_graph_x,
+             chooch_graph_y1, chooch_graph_y2, title, scan_file_efs_filename)
+        archive_job.raw_filenames = [scan_file_raw_filename,
+                                     archive_file_raw_filename]
+        archive_job.efs_copies = [archive_file_efs_filename]
+        archive_job.png_filenames = [scan_file_png_filename,
+                                     archive_file_png_filename]
+        self.archive_task = archive_job.submit(functools.partial(\
+             self.store_archived_energy_scan, scan_info=dict(self.scanInfo)))
+
         return pk, fppPeak, fpPeak, ip, fppInfl, fpInfl, rm, chooch_graph_x, \
                  chooch_graph_y1, chooch_graph_y2, title
 
@@ -468,9 +433,26 @@ class EMBLEnergyScan(AbstractEnergyScan, HardwareObject):
         """
         return self.scanData 
 
-    def store_energy_scan(self):
+    def store_archived_energy_scan(self, archive_job, scan_info):
+        """
+        Descript. : stores scan_info, the copy taken by doChooch, once the
+                    archive workers are done, without the files they could
+                    not write
+        """
+        for key in ("scanFileFullPath", "jpegChoochFileFullPath"):
+            if not archive_job.is_written(scan_info.get(key)):
+                scan_info.pop(key, None)
+        self.store_energy_scan(scan_info)
+        if archive_job.failed_steps:
+            logging.getLogger("HWR").error("EMBLEnergyScan: could not " + \
+                "archive the scan files (%s)" % ", ".join(archive_job.failed_steps))
+            self.emit("energyScanFailed", ())
+
+    def store_energy_scan(self, scan_info=None):
         """
         Descript. :
         """
+        if scan_info is None:
+            scan_info = self.scanInfo
         if self.db_connection_hwobj:
-            db_status = self.db_connection_hwobj.storeEnergyScan(self.scanInfo)
+            db_status = self.db_connection_hwobj.storeEnergyScan(scan_info)
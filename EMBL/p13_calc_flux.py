@@ -5,50 +5,97 @@ import sys
 from csv import reader
 import numpy as np
 from scipy.interpolate import interp1d
- 
+
 flux_table_filename = "/opt/embl-hh/etc/p13/app/mxcube/HardwareObjects.xml/p13_flux_table.csv"
+apertures = ['Out', 100, 70, 50, 30, 15, 10, 5]
+
+flux_tables = {}
+
 
 def read_file(file_name):
     flux_values = {}
     if os.path.exists(file_name):
         with open(file_name, 'rb') as csv_file:
             csv_reader = reader(csv_file, delimiter = ',')
-            row = 0
-            flux_values = {}
+            rows = {}
             for csv_line in csv_reader:
                 if len(csv_line) == 1:
-                    energy_arr = np.array([])
-                    values_arr = np.array([])
                     mode_name = csv_line[0]
-                else:
-                    energy_arr = np.append(energy_arr, float(csv_line[0]))
-                    for col in range(1, len(csv_line)):
-                        values_arr = np.append(values_arr, float(csv_line[col]))
-                flux_values[mode_name] = {'energy': energy_arr,
-                                          'values' : values_arr}
+                    rows[mode_name] = []
+                elif csv_line:
+                    rows[mode_name].append([float(value) for value in csv_line])
+            for mode_name, mode_rows in rows.items():
+                table = np.array(mode_rows, float).reshape(len(mode_rows), -1)
+                flux_values[mode_name] = {'energy': table[:, 0].copy(),
+                                          'values' : table[:, 1:].ravel()}
             return flux_values
     else:
         print "File %s does not exist!" % file_name
 
 
-def calculate_flux(aperture, energy, mode):
-    values = read_file(flux_table_filename)
-    if values:
-        apertures = ['Out', 100, 70, 50, 30, 15, 10, 5]
+class FluxTable:
+    """
+    Flux table read once from the csv file, with one cubic interpolator
+    per mode and aperture. The file is read again when it is modified.
+    """
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.interpolators = {}
+        self.modes = []
+        self.mtime = None
+
+    def reload(self):
         try:
-           aperture_index = apertures.index(aperture)
-        except ValueError:
-           print "Aperture value %s is not in the list of apertures: %s.'" %(str(aperture), str(apertures))
-           print "Out position will be used"
-           aperture_index = 0
-
-        if mode in values:
-            x_arr = np.flipud(values[mode]['energy'])
-            y_arr = np.flipud(values[mode]['values'].reshape(x_arr.size, len(apertures))[:,aperture_index])
-            f = interp1d(x_arr, y_arr, kind='cubic')
-            return float(f(energy))
-        else:
-            print "Mode %s not in the list of available modes: %s" %(mode, str(values.keys()))
+            mtime = os.path.getmtime(self.file_name)
+        except OSError:
+            mtime = None
+        if mtime is not None and mtime == self.mtime:
+            return
+
+        values = read_file(self.file_name) or {}
+        self.interpolators = {}
+        for mode, mode_values in values.items():
+            x_arr = mode_values['energy']
+            y_arr = mode_values['values'].reshape(x_arr.size, len(apertures))
+            order = np.argsort(x_arr)
+            for aperture_index in range(len(apertures)):
+                self.interpolators[(mode, aperture_index)] = \
+                    interp1d(x_arr[order], y_arr[order, aperture_index],
+                             kind='cubic', assume_sorted=True)
+        self.modes = values.keys()
+        self.mtime = mtime
+
+    def get_flux(self, aperture_index, energy, mode):
+        self.reload()
+        interpolator = self.interpolators.get((mode, aperture_index))
+        if interpolator is None:
+            if self.modes:
+                print "Mode %s not in the list of available modes: %s" %(mode, str(self.modes))
+            return None
+        if np.isscalar(energy):
+            return float(interpolator(energy))
+        return interpolator(np.asarray(energy, float))
+
+
+def get_flux_table(file_name=flux_table_filename):
+    if file_name not in flux_tables:
+        flux_tables[file_name] = FluxTable(file_name)
+    return flux_tables[file_name]
+
+
+def calculate_flux(aperture, energy, mode):
+    """
+    Flux for the energy (scalar or array), the interpolators are built
+    when the flux table is read
+    """
+    try:
+       aperture_index = apertures.index(aperture)
+    except ValueError:
+       print "Aperture value %s is not in the list of apertures: %s.'" %(str(aperture), str(apertures))
+       print "Out position will be used"
+       aperture_index = 0
+
+    return get_flux_table().get_flux(aperture_index, energy, mode)
 
 if __name__ == '__main__' :
    if len(sys.argv) < 3:
@@ -63,4 +110,4 @@ if __name__ == '__main__' :
            print "Input: aperture %s, energy %.4f, mode: %s. " %(aper, energy, mode)
            print "---------------------------------------------"
            print "Output: calculated flux = %f" %(flux)
-            
+
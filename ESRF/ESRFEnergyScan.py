@@ -6,9 +6,11 @@ import time
 import os
 import httplib
 import math
+import itertools
+import functools
 import PyChooch
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_agg import FigureCanvasAgg
+import ChoochArchive
+import ElementDatabase
 
 
 class FixedEnergy:
@@ -37,50 +39,9 @@ class GetStaticParameters:
         self.STATICPARS_DICT = self._readParamsFromFile(config_file)
 
     def _readParamsFromFile(self, config_file):
-        static_pars = {}
-
-        try:
-            f = open(config_file)
-            array = []
-            for line in f:
-                if not line.startswith('#'):
-                    array.append(line.split())
-                else:
-                    pass
-        except:
-            return {}
-        else:
-            larr = []
-            for k in range(len(array)):
-                if self.element == array[k][1] and self.edge[0] == array[k][2]:
-                    larr = map(float,array[k][3:13])
-                    larr.append(float(array[k][17]))
-                    static_pars["atomic_nb"] = int(array[k][0])
-            if self.edge == "K":
-                to_delete = [1,2,3,4,5,6,7]
-            else:
-                try:
-                    if int(self.edge[1]) == 1:
-                        to_delete = [0,1,2,4,5,6,7]
-                    elif int(self.edge[1]) == 2:
-                        to_delete = [0,1,2,3,5,6,7]
-                    else:
-                        to_delete = [0,1,2,3,4,6,7]
-                except:
-                    to_delete = [0,1,2,3,4,6,7]
-            for ii in sorted(to_delete, reverse=True):
-                del larr[ii]
-
-            larr[0] /= 1000
-            static_pars["edgeEnergy"] = larr[0]
-            static_pars["startEnergy"] = larr[0] - 0.05
-            static_pars["endEnergy"] = larr[0] + 0.05
-            static_pars["findattEnergy"] = larr[0] + 0.03
-            static_pars["remoteEnergy"] = larr[0] + 1
-            static_pars["eroi_min"] = larr[1]
-            static_pars["eroi_max"] = larr[2]
-            
-            return static_pars
+        # the file is parsed and indexed once per modification
+        return ElementDatabase.get_static_parameters(config_file,
+                                                     self.element, self.edge)
         
 class ESRFEnergyScan(AbstractEnergyScan, HardwareObject):
     def __init__(self, name, tunable_bl):
@@ -180,6 +141,21 @@ class ESRFEnergyScan(AbstractEnergyScan, HardwareObject):
             self.emit("energyScanFailed", ())
             raise RuntimeError("Cannot move energy")
 
+    def store_continuous_scan_data(self, energies, values):
+        # same format as the data.raw file written by the step scan
+        raw_data_file = os.path.join(self.energy_scan_parameters["directory"],
+                                     'data.raw')
+        try:
+            raw_file = open(raw_data_file, 'w')
+            raw_file.write("# Continuous energy scan\n")
+            raw_file.write("%d\n" % len(energies))
+            for energy, value in zip(energies, values):
+                raw_file.write("%f\t%f\n" % (energy * 1000.0, value))
+            raw_file.close()
+        except:
+            logging.getLogger("HWR").exception("could not write %s" % raw_data_file)
+            raise
+
     # Elements commands
     def getElements(self):
         elements=[]
@@ -191,24 +167,40 @@ class ESRFEnergyScan(AbstractEnergyScan, HardwareObject):
 
         return elements
 
-    def storeEnergyScan(self):
+    def storeEnergyScan(self, scan_parameters=None):
+        if scan_parameters is None:
+            scan_parameters = self.energy_scan_parameters
         if self.dbConnection is None:
             return
         try:
-            session_id=int(self.energy_scan_parameters['sessionId'])
+            session_id=int(scan_parameters['sessionId'])
         except Exception:
             return
 
         #remove unnecessary for ISPyB fields:
-        self.energy_scan_parameters.pop('prefix')
-        self.energy_scan_parameters.pop('eroi_min')
-        self.energy_scan_parameters.pop('eroi_max')
-        self.energy_scan_parameters.pop('findattEnergy')
-        self.energy_scan_parameters.pop('edge')
-        self.energy_scan_parameters.pop('directory')
-        self.energy_scan_parameters.pop('atomic_nb')
-
-        gevent.spawn(StoreEnergyScanThread, self.dbConnection,self.energy_scan_parameters)
+        scan_parameters.pop('prefix')
+        scan_parameters.pop('eroi_min')
+        scan_parameters.pop('eroi_max')
+        scan_parameters.pop('findattEnergy')
+        scan_parameters.pop('edge')
+        scan_parameters.pop('directory')
+        scan_parameters.pop('atomic_nb')
+        scan_parameters.pop('continuous', None)
+
+        gevent.spawn(StoreEnergyScanThread, self.dbConnection,scan_parameters)
+
+    def storeArchivedEnergyScan(self, archive_job, scan_parameters):
+        # scan_parameters is the copy taken by doChooch, a new scan may
+        # have started since. Only give ISPyB the files the archive
+        # workers could write
+        for key in ("scanFileFullPath", "jpegChoochFileFullPath"):
+            if not archive_job.is_written(scan_parameters.get(key)):
+                scan_parameters.pop(key, None)
+        self.storeEnergyScan(scan_parameters)
+        if archive_job.failed_steps:
+            logging.getLogger("HWR").error("EnergyScan: could not archive " \
+                "the scan files (%s)" % ", ".join(archive_job.failed_steps))
+            self.emit("energyScanFailed", ())
 
     def doChooch(self, elt, edge, scanArchiveFilePrefix, scanFilePrefix):
         self.energy_scan_parameters['endTime']=time.strftime("%Y-%m-%d %H:%M:%S")
@@ -227,42 +219,35 @@ class ESRFEnergyScan(AbstractEnergyScan, HardwareObject):
 
         if not os.path.exists(os.path.dirname(scanArchiveFilePrefix)):
             os.makedirs(os.path.dirname(scanArchiveFilePrefix))
-        
         try:
-            f=open(rawScanFile, "w")
-            pyarch_f=open(archiveRawScanFile, "w")
+            # reserve the archive name, the file is written by the archive workers
+            open(archiveRawScanFile, "w").close()
         except:
             logging.getLogger("HWR").exception("could not create raw scan files")
             self.storeEnergyScan()
             self.emit("energyScanFailed", ())
             return
-        else:
-            scanData = []
-            
-            raw_data_file = os.path.join(os.path.dirname(scanFilePrefix), 'data.raw')
 
+        scanData = []
+        raw_data_file = os.path.join(os.path.dirname(scanFilePrefix), 'data.raw')
+        try:
+            raw_file = open(raw_data_file, 'r')
+        except:
+            self.storeEnergyScan()
+            self.emit("energyScanFailed", ())
+            return
+        for line in itertools.islice(raw_file, 2, None):
             try:
-                raw_file = open(raw_data_file, 'r')
+                (x, y) = line.split('\t')
             except:
-                self.storeEnergyScan()
-                self.emit("energyScanFailed", ())
-                return
-            for line in raw_file.readlines()[2:]:
-                try:
-                    (x, y) = line.split('\t')
-                except:
-                    (x, y) = line.split()
-                x = float(x.strip())
-                y = float(y.strip())
-                #x = x < 1000 and x*1000.0 or x
-                scanData.append((x, y))
-                f.write("%f,%f\r\n" % (x, y))
-                pyarch_f.write("%f,%f\r\n"% (x, y))
-
-
-            f.close()
-            pyarch_f.close()
-            self.energy_scan_parameters["scanFileFullPath"]=str(archiveRawScanFile)
+                (x, y) = line.split()
+            x = float(x.strip())
+            y = float(y.strip())
+            #x = x < 1000 and x*1000.0 or x
+            scanData.append((x, y))
+        raw_file.close()
+        self.energy_scan_parameters["scanFileFullPath"]=str(archiveRawScanFile)
+
         pk, fppPeak, fpPeak, ip, fppInfl, fpInfl, chooch_graph_data = PyChooch.calc(scanData, elt, edge, scanFile)
         rm=(pk+30)/1000.0
         pk=pk/1000.0
@@ -283,17 +268,6 @@ class ESRFEnergyScan(AbstractEnergyScan, HardwareObject):
           logging.getLogger("user_level_log").warning('EnergyScan: calculated peak (%f) is more that 20eV %s the theoretical value (%f). Please check your scan and choose the energies manually' % (savpk, (self.thEdge - ip) > 0.02 and "below" or "above", self.thEdge))
 
         archiveEfsFile=os.path.extsep.join((scanArchiveFilePrefix, "efs"))
-        try:
-          fi=open(scanFile)
-          fo=open(archiveEfsFile, "w")
-        except:
-          self.storeEnergyScan()
-          self.emit("energyScanFailed", ())
-          return
-        else:
-          fo.write(fi.read())
-          fi.close()
-          fo.close()
 
         self.energy_scan_parameters["peakEnergy"]=pk
         self.energy_scan_parameters["inflectionEnergy"]=ip
@@ -309,43 +283,26 @@ class ESRFEnergyScan(AbstractEnergyScan, HardwareObject):
         for i in range(len(chooch_graph_x)):
           chooch_graph_x[i]=chooch_graph_x[i]/1000.0
 
-        logging.getLogger("HWR").info("<chooch> Saving png" )
-        # prepare to save png files
         title="%10s  %6s  %6s\n%10s  %6.2f  %6.2f\n%10s  %6.2f  %6.2f" % ("energy", "f'", "f''", pk, fpPeak, fppPeak, ip, fpInfl, fppInfl) 
-        fig=Figure(figsize=(15, 11))
-        ax=fig.add_subplot(211)
-        ax.set_title("%s\n%s" % (scanFile, title))
-        ax.grid(True)
-        ax.plot(*(zip(*scanData)), **{"color":'black'})
-        ax.set_xlabel("Energy")
-        ax.set_ylabel("MCA counts")
-        ax2=fig.add_subplot(212)
-        ax2.grid(True)
-        ax2.set_xlabel("Energy")
-        ax2.set_ylabel("")
-        handles = []
-        handles.append(ax2.plot(chooch_graph_x, chooch_graph_y1, color='blue'))
-        handles.append(ax2.plot(chooch_graph_x, chooch_graph_y2, color='red'))
-        canvas=FigureCanvasAgg(fig)
 
         escan_png = os.path.extsep.join((scanFilePrefix, "png"))
         escan_archivepng = os.path.extsep.join((scanArchiveFilePrefix, "png")) 
         self.energy_scan_parameters["jpegChoochFileFullPath"]=str(escan_archivepng)
-        try:
-          logging.getLogger("HWR").info("Rendering energy scan and Chooch graphs to PNG file : %s", escan_png)
-          canvas.print_figure(escan_png, dpi=80)
-        except:
-          logging.getLogger("HWR").exception("could not print figure")
-        try:
-          logging.getLogger("HWR").info("Saving energy scan to archive directory for ISPyB : %s", escan_archivepng)
-          canvas.print_figure(escan_archivepng, dpi=80)
-        except:
-          logging.getLogger("HWR").exception("could not save figure")
-
-        self.storeEnergyScan()
 
         logging.getLogger("HWR").info("<chooch> returning" )
         self.emit('chooch_finished', (pk, fppPeak, fpPeak, ip, fppInfl, fpInfl, rm, chooch_graph_x, chooch_graph_y1, chooch_graph_y2, title))
+
+        # raw, efs and png files are written by the archive workers
+        archive_job = ChoochArchive.ArchiveJob(scanData, chooch_graph_x,
+                                               chooch_graph_y1, chooch_graph_y2,
+                                               title, scanFile)
+        archive_job.raw_filenames = [rawScanFile, archiveRawScanFile]
+        archive_job.efs_copies = [archiveEfsFile]
+        archive_job.png_filenames = [escan_png, escan_archivepng]
+        self.archive_task = archive_job.submit(functools.partial(\
+            self.storeArchivedEnergyScan,
+            scan_parameters=dict(self.energy_scan_parameters)))
+
         return pk, fppPeak, fpPeak, ip, fppInfl, fpInfl, rm, chooch_graph_x, chooch_graph_y1, chooch_graph_y2, title
 
 def StoreEnergyScanThread(db_conn, scan_info):
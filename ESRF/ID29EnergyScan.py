@@ -29,6 +29,15 @@ class ID29EnergyScan(ESRFEnergyScan):
         GAPS = cg._calc_gaps(energy,undulator)
         return GAPS
 
+    def calculate_und_gap_table(self, energies, undulator="u21d"):
+        """
+        Descript. : gaps for all the energies of a planned scan, computed
+                    in one call
+        Return    : list of dictionaries undulator:gap, one per energy
+        """
+        cg = calc_gaps.CalculateGaps()
+        return cg.calc_gap_table(energies, undulator)
+
     @task
     def set_mca_roi(self, eroi_min, eroi_max):
         self.mca = self.getObjectByRole("MCA")
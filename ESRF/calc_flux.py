@@ -1,37 +1,96 @@
+import os
 import logging
 import sys
 
-class CalculateFlux:
+import numpy
 
-    def __init__(self, fname=None):
-        self.FLUX = {}
+__calibrations = {}
 
-    def init(self, fname="/users/blissadm/local/beamline_control/configuration/calibrated_diodes.dat"):
-        self.calib_array=self._load_flux_calibration(fname)
 
-    def _load_flux_calibration(self, fname):
+class FluxCalibration:
+    """
+    Descript. : calibrated diodes table, energies [eV] and one column of
+                coefficients per diode. The file is read once and read
+                again only when it has been modified.
+    """
+    def __init__(self, fname):
+        self.fname = fname
+        self.labels = []
+        self.energies = numpy.zeros(0)
+        self.values = numpy.zeros((0, 0))
+        self.__mtime = None
+
+    def reload(self):
         try:
-            f = open(fname)
-            array = []
-            nb_line = 0
-            for line in f:  
-                if not line.startswith('#') and line.strip() :
-                    array.append(map(float,line.split()))
-                    nb_line += 1
-                else:
-                    if line.startswith('#'):
-                        #line = line[1:]
-                        ll = line[1:].split()
-                        self.labels=[]
-                        idx = []
-                        for i in ll:
-                            self.labels.append(i.lower())
-                            idx.append(0)
+            mtime = os.path.getmtime(self.fname)
+            if mtime == self.__mtime:
+                return
+            labels = []
+            rows = []
+            f = open(self.fname)
+            for line in f:
+                if line.startswith('#'):
+                    labels = [label.lower() for label in line[1:].split()]
+                elif line.strip():
+                    rows.append(map(float, line.split()))
             f.close()
-        except IOError:
+        except (IOError, OSError):
             logging.exception("Cannot read calibrated diodes file")
-        self.FLUX = dict(zip(self.labels, idx))
-        return array
+            return
+
+        table = numpy.array(rows, float)
+        # energies in increasing order for the interpolation
+        order = numpy.argsort(table[:, 0], kind="mergesort")
+        self.labels = labels
+        self.energies = numpy.ascontiguousarray(table[order, 0])
+        self.values = numpy.ascontiguousarray(table[order, 1:])
+        self.__mtime = mtime
+
+    def get_coefficients(self, energies):
+        """
+        Descript. : diode coefficients for the energies [eV], linearly
+                    interpolated between the calibrated energies. Rows
+                    closer than 10 eV are used as they are and energies out
+                    of the table get the coefficients of the nearest end.
+        Return    : array (energies x diodes)
+        """
+        self.reload()
+        energies = numpy.atleast_1d(numpy.asarray(energies, float))
+        result = numpy.empty((energies.size, self.values.shape[1]))
+        for column in range(self.values.shape[1]):
+            result[:, column] = numpy.interp(energies, self.energies,
+                                             self.values[:, column])
+
+        index = numpy.clip(numpy.searchsorted(self.energies, energies),
+                           1, self.energies.size - 1)
+        nearest = numpy.where(energies - self.energies[index - 1] < \
+                              self.energies[index] - energies,
+                              index - 1, index)
+        close = numpy.abs(self.energies[nearest] - energies) < 10
+        result[close] = self.values[nearest[close]]
+        return result
+
+
+def get_flux_calibration(fname):
+    """
+    Descript. : returns the calibration of the file fname, shared by all
+                CalculateFlux objects
+    """
+    if fname not in __calibrations:
+        __calibrations[fname] = FluxCalibration(fname)
+    __calibrations[fname].reload()
+    return __calibrations[fname]
+
+
+class CalculateFlux:
+
+    def __init__(self, fname=None):
+        self.FLUX = {}
+
+    def init(self, fname="/users/blissadm/local/beamline_control/configuration/calibrated_diodes.dat"):
+        self.calibration = get_flux_calibration(fname)
+        self.labels = self.calibration.labels
+        self.FLUX = dict.fromkeys(self.labels, 0)
 
     def calc_flux_coef(self, en):
         if en < 4:
@@ -41,59 +100,22 @@ class CalculateFlux:
         if en < 1000:
             en *= 1000
 
-        self.FLUX[self.labels[0]] = int(en)
-
-        if en >= self.calib_array[0][0]:
-            calib = self.calib_array[0][1:]
-        elif en <= self.calib_array[-1][0]:
-            calib = self.calib_array[-1][1:]
-        else:
-            calib = self._interpol(self.calib_array, int(en))
+        calib = self.calibration.get_coefficients(int(en))[0].tolist()
 
-        for i in calib:
-            self.FLUX[self.labels[calib.index(i)+1]] = i
+        self.labels = self.calibration.labels
+        self.FLUX[self.labels[0]] = int(en)
+        for i, value in enumerate(calib):
+            self.FLUX[self.labels[i+1]] = value
 
         return calib
 
-    def _interpol(self, arr, val, debug=0):
-        larr = []
-        for i, vals in enumerate(arr):
-            if abs(vals[0] - val)  < 10:
-                return vals[1:]
+    def calc_flux_coefs(self, energies):
+        """
+        Descript. : diode coefficients for an array of energies [eV]
+        Return    : array (energies x diodes)
+        """
+        return self.calibration.get_coefficients(energies)
 
-            larr.append(abs(vals[0] - val))
-        min_index = larr.index(min(larr))
-        x1 = arr[min_index][0]
-        y1 = arr[min_index][1]
-        try:
-            z1 = arr[min_index][2]
-        except:
-            pass
-        if debug:
-            print arr[min_index]
-        if x1 < val and min_index > 0:
-            min_index -= 1
-        elif x1 > val and min_index < len(arr)-1:
-            min_index += 1
-        else:
-            return None
-        if debug:
-            print arr[min_index]
-        x2 = arr[min_index][0]
-        y2 = arr[min_index][1]
-        try:
-            z2 = arr[min_index][2]
-        except:
-            pass        
-        bb = (y2-y1)/(x2-x1)
-        aa =  y1 - bb*x1
-        try:
-            dd = (z2-z1)/(x2-x1)
-            cc = z1 - dd*x1
-            return [aa+bb*val, cc+dd*val]
-        except:
-            return aa+bb*val
-    
 
 if __name__ == '__main__' :
     fl = CalculateFlux()
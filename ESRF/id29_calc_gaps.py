@@ -1,127 +1,190 @@
+import os
 import logging
-import math
 import sys
 
-class CalculateGaps:
-    def __init__(self, energy):
-        self.GAPS = {}
+import numpy
+
+CONFIG_FILE = "/users/blissadm/local/spec/userconf/undulators.dat"
+#CONFIG_FILE = "/tmp/undulators.dat"
+
+# odd harmonics tried for each undulator, the first one giving a gap above
+# the minimum gap is used
+HARMONICS = numpy.arange(1, 19, 2)
+MEMO_SIZE = 10000
 
-    def _calc_gaps(self,energy, undulator=None):
-        config_file = "/users/blissadm/local/spec/userconf/undulators.dat"
-        #config_file = "/tmp/undulators.dat"
+__models = {}
 
+
+class UndulatorModel(object):
+    """
+    Descript. : undulator table read from the undulators file. Columns of
+                a line are the undulator name, the maximum gap and six
+                parameters (length, period, B0, -, minimum gap, gap
+                correction). The file is read again only if it has been
+                modified, gaps are memoised per energy.
+    """
+    def __init__(self, config_file=CONFIG_FILE):
+        self.config_file = config_file
+        self.names = []
+        self.max_gaps = numpy.zeros(0)
+        self.params = numpy.zeros((0, 6))
+        self.__mtime = None
+        self.__gaps = {}
+
+    def reload(self):
+        """
+        Descript. : reads the file if it has been modified since last read
+        Return    : True if the table is available
+        """
         try:
-            f = open(config_file) 
-            array = []
-            nb_line = 0
+            mtime = os.path.getmtime(self.config_file)
+            if mtime == self.__mtime:
+                return True
+            names = []
+            max_gaps = []
+            params = []
+            f = open(self.config_file)
             for line in f:
-                if not line.startswith('#'):
-                    array.append(line.split())
-                    nb_line += 1
-                else:
-                    pass
-        except IOError:
-            logging.exception("Cannot read undulators file")
-
-        if nb_line == 1:
-            larr = map(float,array[2:])
-            gg = self._calc_gap(energy, larr)
-            if gg == 0:
-                gg = array[1]
-            self.GAPS[array[0]] = gg
-        elif nb_line > 1:
-            gap = {}
-            p_gap = {}
-
-            for i in array:
-                larr = map(float,i[2:])
-                gg = self._calc_gap(energy, larr)
-                if gg == 0:
-                    gg = int(i[1].strip("."))
-                p_gap[i[0]] = gg
-                if undulator != None:
-                   if i[0] == undulator:
-                       gmax = int(i[1].strip("."))
-                       if gg != 0:
-                           gap[i[0]] = gg
-                   else:
-                       gap[i[0]] = int(i[1].strip("."))
-                else:
-                    gap[i[0]] = gg
-            if undulator != None:
-                for i in array:
-                    if i[0] != undulator and gap[undulator] == gmax :
-                        larr = map(float,i[2:])
-                        gg = self._calc_gap(energy, larr)
-                        gap[i[0]] = gg
-            gaps = gap.values()
-            labels = gap.keys()
-            if undulator != None:
-                for i in gaps:
-                    if i == gmax and gaps.index(i) != 0:
-                        gaps.reverse()
-                        labels.reverse()
-            self.GAPS = dict(zip(labels, gaps))
+                if line.startswith('#'):
+                    continue
+                columns = line.split()
+                if len(columns) < 8:
+                    continue
+                names.append(columns[0])
+                max_gaps.append(int(columns[1].strip(".")))
+                params.append([float(value) for value in columns[2:8]])
+            f.close()
+        except (IOError, OSError):
+            logging.getLogger("HWR").exception("Cannot read undulators file")
+            return False
+
+        if not names:
+            logging.getLogger("HWR").error("Undulators file format error")
+            return False
+        self.names = names
+        self.max_gaps = numpy.array(max_gaps)
+        self.params = numpy.array(params, float)
+        self.__mtime = mtime
+        self.__gaps = {}
+        return True
+
+    def solve(self, energies):
+        """
+        Descript. : computes the gaps of all undulators for the energies
+                    (array [keV]), without memoisation
+        Return    : array (energies x undulators), 0 where there is no
+                    solution
+        """
+        energies = numpy.asarray(energies, float).reshape(-1, 1, 1)
+        length, period, b0, _, min_gap, correction = \
+            [column.reshape(1, -1, 1) for column in self.params.T]
+        harmonics = HARMONICS.reshape(1, 1, -1)
+
+        const = 13.056 * period * 100 / pow(6.04, 2)
+        k2 = (numpy.pi / period) / 1000
+        #Transform energy in wavelength
+        target = (12.3984 / energies) / const
+        targ = (target * harmonics - 1) * 2
+
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            k = numpy.sqrt(numpy.where(targ > 0, targ, numpy.nan))
+            bo = k / (period * 93.4)
+            #gap is not quite right - correction factors
+            gaps = -numpy.log(bo / b0) / k2 + correction
+            solved = gaps > min_gap
+
+        # gap of the lowest harmonic with a solution
+        result = numpy.zeros(solved.shape[:2])
+        for i in reversed(range(len(HARMONICS))):
+            result = numpy.where(solved[..., i], gaps[..., i], result)
+        return result
+
+    def get_gaps(self, energies):
+        """
+        Descript. : gaps of all undulators for the energies (array [keV]),
+                    only energies not asked before are computed
+        Return    : array (energies x undulators), 0 where there is no
+                    solution
+        """
+        energies = [float(energy) for energy in numpy.atleast_1d(energies)]
+        if not self.reload():
+            return numpy.zeros((len(energies), 0))
+
+        missing = sorted(set(energies).difference(self.__gaps))
+        if missing:
+            if len(self.__gaps) + len(missing) > MEMO_SIZE:
+                self.__gaps = {}
+            self.__gaps.update(zip(missing, self.solve(missing)))
+        return numpy.array([self.__gaps[energy] for energy in energies]).\
+            reshape(len(energies), len(self.names))
+
+
+def get_undulator_model(config_file=CONFIG_FILE):
+    """
+    Descript. : returns the model of the undulators file, shared by all
+                CalculateGaps objects
+    """
+    if config_file not in __models:
+        __models[config_file] = UndulatorModel(config_file)
+    return __models[config_file]
+
+
+class CalculateGaps:
+    def __init__(self, energy=None, config_file=CONFIG_FILE):
+        self.GAPS = {}
+        self.model = get_undulator_model(config_file)
+
+    def _select_gaps(self, gaps, undulator=None):
+        """
+        Descript. : gaps of the undulators for one energy. If undulator is
+                    given, the other undulators are opened, unless there is
+                    no solution for undulator.
+        """
+        names = self.model.names
+        max_gaps = self.model.max_gaps
+        p_gap = numpy.where(gaps == 0, max_gaps, gaps)
+        logging.getLogger("HWR").debug("Undulator gaps: %s" % \
+            dict(zip(names, p_gap.tolist())))
+
+        if undulator is None or undulator not in names:
+            return dict(zip(names, p_gap.tolist()))
+
+        index = names.index(undulator)
+        if p_gap[index] == max_gaps[index]:
+            selected = gaps.tolist()
         else:
-            logging.exception("Undulators file format error")
-        print p_gap
+            selected = max_gaps.tolist()
+        selected[index] = float(p_gap[index])
+        return dict(zip(names, selected))
+
+    def _calc_gaps(self, energy, undulator=None):
+        gaps = self.model.get_gaps(energy)
+        if gaps.size == 0:
+            return self.GAPS
+        self.GAPS = self._select_gaps(gaps[0], undulator)
         return self.GAPS
 
+    def calc_gap_table(self, energies, undulator=None):
+        """
+        Descript. : gaps for all the energies of a planned scan
+        Return    : list of dictionaries undulator:gap, one per energy
+        """
+        gaps = self.model.get_gaps(energies)
+        if gaps.size == 0:
+            return [{} for energy in numpy.atleast_1d(energies)]
+        return [self._select_gaps(row, undulator) for row in gaps]
+
     def _calc_gap(self, energy, arr):
-        gamma = 0.511/6040
-        contst_en = 6.04
-        dist = 31            #Calculate beam size at 31 m from source
-        sigma_x = 0.000088
-        sigma_y = 0.0000038
-        sigma_h = 0.1334
-        sigma_v = 0.0242
-        const=13.056*arr[1]*100/pow(contst_en,2)
-        k2 = (math.pi/arr[1])/1000
-        #Transform energy in wavelength
-        h_over_e = 12.3984
-        energy = h_over_e/energy
-        target=energy/const
-        nsols=0
-
-        k = [0]*19
-        g = [0]*19
-        pis = [0]*19
-        kout = [0]*19
-        iharm = [0]*19
-        hsiz = [0]*19
-        vsiz = [0]*19
-        #calculate gap now ...
-        for i in range(1,19,2):
-            targ = target*i
-            targ = (targ-1)*2
-            if targ > 0:
-                k[i]=math.sqrt(targ)
-                bo = k[i]/(arr[1]*93.4)
-                g[i] = -1*math.log(bo/arr[2])/k2
-                #gap is not quite right - correction factors
-                g[i] += arr[5]
-                #Power [GeV] at 200 mA
-                pis[i] = 0.633*(pow(contst_en,2))*(pow(bo,2))*0.2*arr[1]*arr[0]
-                if g[i] > arr[4]:
-                    nsols += 1
-                    g[nsols]=g[i]
-                    pis[nsols]=pis[i]
-                    kout[nsols]=k[i]
-                    iharm[nsols]=i
-                    consta = 1+pow(k[i],2)/2
-                    constb = consta/(2*i*arr[0])
-                    sigmarp=math.sqrt(constb)*gamma
-                    #Answer is in rad, we want mrad
-                    sigma_pv=2.35*1000*math.sqrt(pow(sigmarp,2)+pow(sigma_y,2))
-                    sigma_ph=2.35*1000*math.sqrt(pow(sigmarp,2)+pow(sigma_x,2))
-                    #Calculate beam sizes - these are in mcrions
-                    hsiz[nsols] = math.sqrt(pow(sigma_h,2) + pow(sigma_ph*dist,2))
-                    vsiz[nsols] = math.sqrt(pow(sigma_v,2) + pow(sigma_pv*dist,2))
-        if nsols == 0:
+        gap = 0
+        if len(arr) >= 6:
+            model = UndulatorModel()
+            model.names = ["undulator"]
+            model.params = numpy.array([arr[:6]], float)
+            gap = model.solve([energy])[0, 0]
+        if gap == 0:
             logging.info("Cannot CALCULATE GAPS")
-            return 0
-        return g[1]
-            
+        return gap
+
 if __name__ == '__main__' :
 
     cg = CalculateGaps(float(sys.argv[1]))
@@ -0,0 +1,254 @@
+"""
+Compiled element and absorption edge database.
+
+The McMaster tables of SOLEIL/xabs_lib.py are compiled once into numpy
+arrays (one row per element, one column per edge or emission line) and
+cached on disk in the cache directory of the user (~/.cache/mxcube), never
+in a shared temporary directory. The cache is loaded without pickle
+support. The database is loaded lazily, once per process, and rebuilt
+when xabs_lib.py changes.
+
+Lookups by element symbol or atomic number and edge are O(1), arrays of
+elements can be looked up at once (eg. to fill a periodic table).
+
+The static parameter files of the energy scan (EdgeScan.dat) are parsed
+once per file modification and indexed by element and edge as well.
+"""
+
+import os
+import imp
+import logging
+
+import numpy
+
+
+EDGES = ('K', 'L1', 'L2', 'L3', 'M')
+EMISSION_LINES = ('K-alpha', 'K-beta', 'L-alpha', 'L-beta')
+YIELD_EDGES = ('K', 'L1', 'L2', 'L3')
+
+XABS_LIB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "SOLEIL", "xabs_lib.py")
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mxcube")
+CACHE_FILE = os.path.join(CACHE_DIR, "element_db.npz")
+
+__database = None
+__static_parameters = {}
+
+
+class ElementDatabase(object):
+    def __init__(self, arrays):
+        self.symbols = [str(symbol) for symbol in arrays["symbols"]]
+        self.z = arrays["z"]
+        self.atomic_weight = arrays["atomic_weight"]
+        self.density = arrays["density"]
+        self.edge_energies = arrays["edge_energies"]
+        self.edge_jumps = arrays["edge_jumps"]
+        self.fluorescence_yields = arrays["fluorescence_yields"]
+        self.emission_energies = arrays["emission_energies"]
+
+        self.__rows = {}
+        for row, symbol in enumerate(self.symbols):
+            self.__rows[symbol] = row
+            self.__rows[int(self.z[row])] = row
+
+    @staticmethod
+    def compile(mc_master):
+        """
+        Descript. : builds the arrays from the McMaster dictionary
+        """
+        symbols = sorted(mc_master, key=lambda el: mc_master[el]['element']['Z'])
+        size = len(symbols)
+        arrays = {"symbols": numpy.array(symbols),
+                  "z": numpy.zeros(size, numpy.int32),
+                  "atomic_weight": numpy.zeros(size),
+                  "density": numpy.zeros(size),
+                  "edge_energies": numpy.zeros((size, len(EDGES))),
+                  "edge_jumps": numpy.zeros((size, len(YIELD_EDGES))),
+                  "fluorescence_yields": numpy.zeros((size, len(YIELD_EDGES))),
+                  "emission_energies": numpy.zeros((size, len(EMISSION_LINES)))}
+
+        for row, symbol in enumerate(symbols):
+            element = mc_master[symbol]
+            arrays["z"][row] = int(element['element']['Z'])
+            arrays["atomic_weight"][row] = element['element']['Atomic']
+            arrays["density"][row] = element['element']['Density']
+            for col, edge in enumerate(EDGES):
+                arrays["edge_energies"][row, col] = \
+                    element['edgeEnergies'].get(edge, numpy.nan)
+            for col, line in enumerate(EMISSION_LINES):
+                arrays["emission_energies"][row, col] = \
+                    element['edgeEnergies'].get(line, numpy.nan)
+            for col, edge in enumerate(YIELD_EDGES):
+                arrays["edge_jumps"][row, col] = \
+                    element['edgeJumps'].get(edge, numpy.nan)
+                arrays["fluorescence_yields"][row, col] = \
+                    element['fluorescenceYeild'].get(edge, numpy.nan)
+        return arrays
+
+    def get_row(self, element):
+        """
+        Descript. : element is a symbol or an atomic number
+        """
+        try:
+            return self.__rows[element]
+        except KeyError:
+            raise KeyError("Unknown element %s" % str(element))
+
+    def get_rows(self, elements):
+        return numpy.array([self.get_row(element) for element in elements],
+                           numpy.intp)
+
+    def get_edge_energy(self, element, edge):
+        """
+        Return    : edge energy [keV]
+        """
+        return self.edge_energies[self.get_row(element), EDGES.index(edge)]
+
+    def get_emission_energy(self, element, line):
+        """
+        Return    : emission line energy [keV]
+        """
+        return self.emission_energies[self.get_row(element),
+                                      EMISSION_LINES.index(line)]
+
+    def get_edge_jump(self, element, edge):
+        return self.edge_jumps[self.get_row(element), YIELD_EDGES.index(edge)]
+
+    def get_fluorescence_yield(self, element, edge):
+        return self.fluorescence_yields[self.get_row(element),
+                                        YIELD_EDGES.index(edge)]
+
+    def get_edge(self, element, edge):
+        """
+        Descript. : edge energy and fluorescence line (ROI center) used by
+                    the energy scans. The line is the alpha line of the
+                    edge family, the L edge means L3
+        Return    : (edge energy, roi center) [keV]
+        """
+        edge = edge.upper()
+        roi_center = self.get_emission_energy(element, edge[0] + '-alpha')
+        if edge == 'L':
+            edge = 'L3'
+        return float(self.get_edge_energy(element, edge)), float(roi_center)
+
+    def get_edge_energies(self, elements, edge):
+        """
+        Descript. : vectorised lookup, elements is a sequence of symbols
+                    or atomic numbers
+        """
+        return self.edge_energies[self.get_rows(elements), EDGES.index(edge)]
+
+    def get_emission_energies(self, elements, line):
+        return self.emission_energies[self.get_rows(elements),
+                                      EMISSION_LINES.index(line)]
+
+    def get_elements_in_range(self, edge, min_energy, max_energy):
+        """
+        Return    : symbols of the elements with the edge in the energy range
+        """
+        energies = self.edge_energies[:, EDGES.index(edge)]
+        rows = numpy.nonzero((energies >= min_energy) & \
+                             (energies <= max_energy))[0]
+        return [self.symbols[row] for row in rows]
+
+
+def __load_cache(source_mtime):
+    try:
+        cache = numpy.load(CACHE_FILE, allow_pickle=False)
+        if float(cache["source_mtime"]) == source_mtime:
+            return dict((key, cache[key]) for key in cache.files)
+    except:
+        pass
+
+
+def __save_cache(arrays, source_mtime):
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR, 0o700)
+        # written aside and renamed, readers never see a partial file
+        tmp_file = "%s.%d" % (CACHE_FILE, os.getpid())
+        cache_file = open(tmp_file, "wb")
+        numpy.savez(cache_file, source_mtime=source_mtime, **arrays)
+        cache_file.close()
+        os.rename(tmp_file, CACHE_FILE)
+    except:
+        logging.getLogger("HWR").warning(\
+            "ElementDatabase: could not write cache file %s" % CACHE_FILE)
+
+
+def get_database():
+    """
+    Descript. : returns the element database, compiled from xabs_lib on
+                first use or loaded from the cache file
+    """
+    global __database
+    if __database is None:
+        source_mtime = os.path.getmtime(XABS_LIB_FILE)
+        arrays = __load_cache(source_mtime)
+        if arrays is None:
+            xabs_lib = imp.load_source("xabs_lib", XABS_LIB_FILE)
+            arrays = ElementDatabase.compile(xabs_lib.McMaster)
+            __save_cache(arrays, source_mtime)
+        __database = ElementDatabase(arrays)
+    return __database
+
+
+def __read_static_parameters(config_file):
+    """
+    Descript. : parses the static parameter file, rows are indexed by
+                (element, edge letter), the last row of a pair wins
+    """
+    table = {}
+    f = open(config_file)
+    for line in f:
+        if line.startswith('#'):
+            continue
+        columns = line.split()
+        if len(columns) < 18:
+            continue
+        # atomic number, K, L1, L2 and L3 edge energies [eV], ROI min, max
+        values = [float(value) for value in columns[3:13]]
+        table[(columns[1], columns[2])] = (int(columns[0]), values[0],
+             values[3], values[4], values[5], values[8], values[9])
+    f.close()
+    return table
+
+
+def get_static_parameters(config_file, element, edge):
+    """
+    Descript. : static energy scan parameters of the element edge read
+                from the config_file (spec EdgeScan.dat format). The file
+                is parsed again only when it has been modified
+    Return    : dictionary with the edge, scan and ROI energies [keV],
+                empty if the file or the edge is not found
+    """
+    try:
+        mtime = os.path.getmtime(config_file)
+        if __static_parameters.get(config_file, (None, ))[0] != mtime:
+            __static_parameters[config_file] = \
+                (mtime, __read_static_parameters(config_file))
+        table = __static_parameters[config_file][1]
+    except:
+        return {}
+
+    row = table.get((element, edge[0]))
+    if row is None:
+        return {}
+
+    if edge == "K":
+        edge_index = 1
+    else:
+        try:
+            edge_index = {1: 2, 2: 3}.get(int(edge[1]), 4)
+        except:
+            edge_index = 4
+
+    edge_energy = row[edge_index] / 1000
+    return {"atomic_nb": row[0],
+            "edgeEnergy": edge_energy,
+            "startEnergy": edge_energy - 0.05,
+            "endEnergy": edge_energy + 0.05,
+            "findattEnergy": edge_energy + 0.03,
+            "remoteEnergy": edge_energy + 1,
+            "eroi_min": row[5],
+            "eroi_max": row[6]}
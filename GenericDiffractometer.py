@@ -194,6 +194,8 @@ class GenericDiffractometer(HardwareObject):
         self.centring_status = {"valid": False}
         self.centring_time = 0
         self.user_confirms_centring = None
+        self.centring_continuous_sweep = None
+        self.centring_phi_range = None
         self.user_clicked_event = None
         self.omega_reference_par = None
         self.move_to_motors_positions_task = None
@@ -335,6 +337,10 @@ class GenericDiffractometer(HardwareObject):
         except:
            pass # used the default value
 
+        # automatic centring: continuous phi sweep instead of n_points stops
+        self.centring_continuous_sweep = bool(self.getProperty("centring_continuous_sweep"))
+        self.centring_phi_range = self.getProperty("centring_phi_range") or 180
+
         # Other parameters ---------------------------------------------------
         try:
             self.zoom_centre = eval(self.getProperty("zoom_centre"))
@@ -659,7 +665,9 @@ class GenericDiffractometer(HardwareObject):
                                              self.beam_position[0],
                                              self.beam_position[1],
                                              msg_cb = self.emit_progress_message,
-                                             new_point_cb=lambda point: self.emit("newAutomaticCentringPoint", point))
+                                             new_point_cb=lambda point: self.emit("newAutomaticCentringPoint", point),
+                                             continuous_sweep=self.centring_continuous_sweep,
+                                             phi_range=self.centring_phi_range)
 	else:
             self.current_centring_procedure = gevent.spawn(self.automatic_centring)
         self.current_centring_procedure.link(self.centring_done)
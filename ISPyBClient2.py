@@ -10,16 +10,19 @@ import itertools
 import time
 import json
 
-from suds.transport.http import HttpAuthenticated
-from suds.client import Client
 from suds import WebFault
 from suds.sudsobject import asdict
+from suds.transport import TransportError
 from urllib2 import URLError
 from HardwareRepository.BaseHardwareObjects import HardwareObject
 from datetime import datetime
-from collections import namedtuple
 from pprint import pformat
 
+import ISPyBImageQueue
+import ISPyBClientRegistry
+import ISPyBFanOut
+import ISPyBSampleMatching
+
 
 # Production web-services:    http://160.103.210.1:8080/ispyb-ejb3/ispybWS/
 # Test web-services:          http://160.103.210.4:8080/ispyb-ejb3/ispybWS/
@@ -39,10 +42,7 @@ _CONNECTION_ERROR_MSG = "Could not connect to ISPyB, please verify that " + \
                         "configuration is correct"
 
 
-SampleReference = namedtuple('SampleReference', ['code',
-                                                 'container_reference',
-                                                 'sample_reference',
-                                                 'container_code'])
+SampleReference = ISPyBSampleMatching.SampleReference
 
 def trace(fun):
     def _trace(*args):
@@ -101,6 +101,27 @@ def utf_encode(res_d):
     return res_d
 
 
+def sessions_to_dicts(res_sessions):
+    """
+    Sessions returned by the web service as dictionaries, with the dates
+    as strings.
+    """
+    sessions = []
+    for session in res_sessions or []:
+        if session is not None :
+            try:
+                session.startDate = \
+                    datetime.strftime(session.startDate,
+                                      "%Y-%m-%d %H:%M:%S")
+                session.endDate = \
+                    datetime.strftime(session.endDate,
+                                      "%Y-%m-%d %H:%M:%S")
+            except:
+                pass
+            sessions.append(utf_encode(asdict(session)))
+    return sessions
+
+
 class ISPyBClient2(HardwareObject):
     """
     Web-service client for ISPyB.
@@ -113,6 +134,10 @@ class ISPyBClient2(HardwareObject):
         self.__shipping = None
         self.__collection = None
         self.__tools_ws = None
+        self.__autoproc_ws = None
+        self.__image_queue = None
+        self.__records = ISPyBFanOut.TTLCache()
+        self.__fan_out = ISPyBFanOut.FanOut()
         self.__translations = {}
         self.__disabled = False
 
@@ -134,6 +159,12 @@ class ISPyBClient2(HardwareObject):
             if self.ldapConnection is None:
                 logging.getLogger("HWR").debug('LDAP Server is not available')
 
+        # proposal, person, laboratory and session records are requested
+        # concurrently and memoised for lims_cache_ttl seconds
+        self.__records.ttl = float(self.getProperty("lims_cache_ttl") or 300)
+        self.__fan_out = ISPyBFanOut.FanOut(
+            int(self.getProperty("lims_concurrency") or 8))
+
         self.loginType = self.getProperty("loginType") or "proposal"
         self.loginTranslate = self.getProperty("loginTranslate") or True
         self.session_hwobj = self.getObjectByRole('session')
@@ -166,33 +197,25 @@ class ISPyBClient2(HardwareObject):
                 _WS_AUTOPROC_URL = _WSDL_ROOT + \
                     'ToolsForAutoprocessingWebService?wsdl'
 
-                t1 = HttpAuthenticated(username = self.ws_username, 
-                                      password = self.ws_password)
-                
-                t2 = HttpAuthenticated(username = self.ws_username, 
-                                      password = self.ws_password)
-                
-                t3 = HttpAuthenticated(username = self.ws_username, 
-                                      password = self.ws_password)
-
-                t4 = HttpAuthenticated(username = self.ws_username,
-                                       password = self.ws_password)
-                
+                # one parsed WSDL per url and process, see ISPyBClientRegistry
+                wsdl_cache_dir = self.getProperty("wsdl_cache_dir")
+                if wsdl_cache_dir is not None:
+                    ISPyBClientRegistry.get_registry().cache_dir = \
+                        wsdl_cache_dir
+
                 try: 
-                    self.__shipping = Client(_WS_SHIPPING_URL, timeout = 3,
-                                             transport = t1, cache = None)
-                    self.__collection = Client(_WS_COLLECTION_URL, timeout = 3,
-                                               transport = t2, cache = None)
-                    self.__tools_ws = Client(_WS_BL_SAMPLE_URL, timeout = 3,
-                                             transport = t3, cache = None)
-                    self.__autoproc_ws = Client(_WS_AUTOPROC_URL, timeout = 3,
-                                             transport = t4, cache = None)
-                
-                    # ensure that suds do not create those files in tmp 
-                    self.__shipping.set_options(cache=None)
-                    self.__collection.set_options(cache=None)
-                    self.__tools_ws.set_options(cache=None)
-                    self.__autoproc_ws.set_options(cache=None)
+                    self.__shipping = ISPyBClientRegistry.get_proxy(
+                        _WS_SHIPPING_URL, self.ws_username, self.ws_password,
+                        timeout = 3)
+                    self.__collection = ISPyBClientRegistry.get_proxy(
+                        _WS_COLLECTION_URL, self.ws_username, self.ws_password,
+                        timeout = 3)
+                    self.__tools_ws = ISPyBClientRegistry.get_proxy(
+                        _WS_BL_SAMPLE_URL, self.ws_username, self.ws_password,
+                        timeout = 3)
+                    self.__autoproc_ws = ISPyBClientRegistry.get_proxy(
+                        _WS_AUTOPROC_URL, self.ws_username, self.ws_password,
+                        timeout = 3)
                 except URLError:
                     logging.getLogger("ispyb_client")\
                         .exception(_CONNECTION_ERROR_MSG)
@@ -201,6 +224,21 @@ class ISPyBClient2(HardwareObject):
             logging.getLogger("ispyb_client").exception(_CONNECTION_ERROR_MSG)
             return
 
+        # Images are stored by a write-behind queue, unless image_queue_size
+        # is 0. Records not sent are kept in the journal file
+        image_queue_size = self.getProperty("image_queue_size")
+        if image_queue_size is None:
+            image_queue_size = 10000
+        if self.__collection and int(image_queue_size) > 0:
+            journal_file = self.getProperty("image_journal_file") or \
+                os.path.expanduser("~/.ispyb_image_journal_%s" % \
+                                   self.beamline_name)
+            self.__image_queue = ISPyBImageQueue.ImageQueue(
+                self.__send_image_record, int(image_queue_size),
+                batch_size=int(self.getProperty("image_batch_size") or 100),
+                journal_file=journal_file,
+                retry_errors=(IOError, TransportError))
+
         # Add the porposal codes defined in the configuration xml file
         # to a directory. Used by translate()
         try:
@@ -339,73 +377,9 @@ class ISPyBClient2(HardwareObject):
         """
         if self.__shipping:
             try:
-                try:
-                    person = self.__shipping.service.\
-                             findPersonByProposal(proposal_code,
-                                                  proposal_number)
-                    if not person:
-                        person = {}
-
-                except WebFault, e:
-                    logging.getLogger("ispyb_client").exception(str(e))
-                    person = {}
-
-                try:
-                    proposal = self.__shipping.service.\
-                        findProposal(proposal_code,
-                                     proposal_number)
-
-                    if proposal:
-                        proposal.code = proposal_code
-                    else:
-                        return {'Proposal': {},
-                                'Person': {},
-                                'Laboratory': {},
-                                'Session': {},
-                                'status': {'code':'error'}}
-
-                except WebFault, e:
-                    logging.getLogger("ispyb_client").exception(str(e))
-                    proposal = {}
-
-                try:
-                    lab = None
-                    #lab = self.__shipping.service.findLaboratoryByCodeAndNumber(proposal_code, proposal_number)
-                    lab = self.__shipping.service.findLaboratoryByProposal(proposal_code, proposal_number)
-
-                    if not lab:
-                        lab = {}
-
-                except WebFault, e:
-                    logging.getLogger("ispyb_client").exception(str(e))
-
-                    lab = {}
-                try:
-                    res_sessions = self.__collection.service.\
-                        findSessionsByProposalAndBeamLine(proposal_code,
-                                                          proposal_number,
-                                                          self.beamline_name)
-                    sessions = []
-
-                    # Handels a list of sessions
-                    for session in res_sessions:
-                        if session is not None :
-                            try:
-                                session.startDate = \
-                                    datetime.strftime(session.startDate,
-                                                      "%Y-%m-%d %H:%M:%S")
-                                session.endDate = \
-                                    datetime.strftime(session.endDate,
-                                                      "%Y-%m-%d %H:%M:%S")
-                            except:
-                                pass
-
-                            sessions.append(utf_encode(asdict(session)))
-
-                except WebFault, e:
-                    logging.getLogger("ispyb_client").exception(str(e))
-                    sessions = []
-
+                proposal, person, lab, sessions = self.__fan_out.map(
+                    [(self.__get_record, (kind, proposal_code, proposal_number)) \
+                     for kind in ("proposal", "person", "laboratory", "sessions")])
             except URLError:
                 logging.getLogger("ispyb_client").exception(_CONNECTION_ERROR_MSG)
                 return {'Proposal': {},
@@ -414,9 +388,16 @@ class ISPyBClient2(HardwareObject):
                         'Session': {},
                         'status': {'code':'error'}}
 
-            return  {'Proposal': utf_encode(asdict(proposal)),
-                     'Person': utf_encode(asdict(person)),
-                     'Laboratory': utf_encode(asdict(lab)),
+            if not proposal:
+                return {'Proposal': {},
+                        'Person': {},
+                        'Laboratory': {},
+                        'Session': {},
+                        'status': {'code':'error'}}
+
+            return  {'Proposal': proposal,
+                     'Person': person,
+                     'Laboratory': lab,
                      'Session': sessions,
                      'status': {'code':'ok'}}
 
@@ -431,6 +412,59 @@ class ISPyBClient2(HardwareObject):
                     'Session': {},
                     'status': {'code':'error'}}
 
+    def __get_record(self, kind, proposal_code, proposal_number):
+        """
+        Returns the proposal, person, laboratory or sessions (<kind>) of a
+        proposal, memoised. Web service faults are logged and give an
+        empty record, that is not memoised.
+        """
+        try:
+            return self.__records.get_or_call((kind, proposal_code,
+                                               proposal_number),
+                self.__find_record, kind, proposal_code, proposal_number)
+        except WebFault, e:
+            logging.getLogger("ispyb_client").exception(str(e))
+            if kind == "sessions":
+                return []
+            return {}
+
+    def __find_record(self, kind, proposal_code, proposal_number):
+        if kind == "proposal":
+            proposal = self.__shipping.service.\
+                findProposal(proposal_code, proposal_number)
+            if not proposal:
+                return {}
+            proposal.code = proposal_code
+            return utf_encode(asdict(proposal))
+        elif kind == "person":
+            person = self.__shipping.service.\
+                findPersonByProposal(proposal_code, proposal_number)
+            return utf_encode(asdict(person)) if person else {}
+        elif kind == "laboratory":
+            lab = self.__shipping.service.\
+                findLaboratoryByProposal(proposal_code, proposal_number)
+            return utf_encode(asdict(lab)) if lab else {}
+        else:
+            res_sessions = self.__collection.service.\
+                findSessionsByProposalAndBeamLine(proposal_code,
+                                                  proposal_number,
+                                                  self.beamline_name)
+            return sessions_to_dicts(res_sessions)
+
+    def clear_cache(self):
+        """
+        Forgets the memoised proposal, person, laboratory and session
+        records, the next requests query ISPyB.
+        """
+        self.__records.invalidate()
+
+    def get_cache_statistics(self):
+        """
+        :returns: hits, misses, waits and size of the record cache
+        :rtype: dict
+        """
+        return self.__records.get_statistics()
+
     @trace
     def get_proposal_by_username(self, username):
 
@@ -522,19 +556,15 @@ class ISPyBClient2(HardwareObject):
         if self.__shipping:
 
             try:
-                person = self.__shipping.service.\
-                    findPersonBySessionIdLocalContact(session_id)
+                return self.__records.get_or_call(
+                    ("local_contact", session_id), self.__find_local_contact,
+                    session_id)
             except WebFault, e:
                 logging.getLogger("ispyb_client").exception(str(e))
-                person = {}
+                return {}
             except URLError:
                 logging.getLogger("ispyb_client").exception(_CONNECTION_ERROR_MSG)
-                person = {}
-
-            if person is None:
                 return {}
-            else:
-                utf_encode(asdict(person))
 
         else:
             logging.getLogger("ispyb_client").\
@@ -542,6 +572,13 @@ class ISPyBClient2(HardwareObject):
                           "local contact")
             return {}
 
+    def __find_local_contact(self, session_id):
+        person = self.__shipping.service.\
+            findPersonBySessionIdLocalContact(session_id)
+        if person is None:
+            return {}
+        return utf_encode(asdict(person))
+
     def _ispybLogin (self, loginID, psd):
         # to do, check how it is done in EMBL
         return True, "True"
@@ -857,20 +894,31 @@ class ISPyBClient2(HardwareObject):
 
 
     #@in_greenlet
-    def store_image(self, image_dict):
+    def store_image(self, image_dict, wait=False):
         """
-        Stores the image (image parameters) <image_dict>
+        Stores the image (image parameters) <image_dict>. The image is
+        queued and stored later, unless <wait> is True or the queue is
+        disabled.
 
         :param image_dict: A dictonary with image pramaters.
         :type image_dict: dict
 
-        :returns: None
+        :param wait: Store the image now and return its id.
+        :type wait: bool
+
+        :returns: image id if the image has been stored, None otherwise
         """
         if self.__disabled:
             return
     
         if self.__collection:
             if 'dataCollectionId' in image_dict:
+                if self.__image_queue is not None and not wait:
+                    self.__image_queue.put(ISPyBImageQueue.IMAGE,
+                        image_dict['dataCollectionId'],
+                        (image_dict.get('imageNumber'),
+                         image_dict.get('fileName')), image_dict)
+                    return
                 try:
                     image_id = self.__collection.service.storeOrUpdateImage(image_dict)
                     return image_id
@@ -886,39 +934,37 @@ class ISPyBClient2(HardwareObject):
             logging.getLogger("ispyb_client").\
                 exception("Error in store_image: could not connect to server")
 
-
-    def __find_sample(self, sample_ref_list, code = None, location = None):
+    def __send_image_record(self, kind, record):
         """
-        Returns the sample with the matching "search criteria" <code> and/or
-        <location> with-in the list sample_ref_list.
-
-        The sample_ref object is defined in the head of the file.
+        Sends a record of the image queue, called by the queue worker.
+        """
+        if kind == ISPyBImageQueue.IMAGE:
+            return self.__collection.service.storeOrUpdateImage(record)
+        else:
+            return self.__autoproc_ws.service.\
+                storeOrUpdateImageQualityIndicators(record)
 
-        :param sample_ref_list: The list of sample_refs to search.
-        :type sample_ref: list
+    def flush_image_queue(self, timeout=None):
+        """
+        Waits until the queued images are stored.
 
-        :param code: The vial datamatrix code (or bar code)
-        :param type: str
+        :param timeout: Maximum time to wait in seconds.
+        :type timeout: float
 
-        :param location: A tuple (<basket>, <vial>) to search for.
-        :type location: tuple
+        :returns: True if all images are stored
         """
-        for sample_ref in sample_ref_list:
+        if self.__image_queue is None:
+            return True
+        return self.__image_queue.flush(timeout)
 
-            if code and location:
-                if sample_ref.code == code and \
-                        sample_ref.container_reference == location[0] and \
-                        sample_ref.sample_reference == location[1]:
-                    return sample_ref
-            elif code:
-                if sample_ref.code == code:
-                    return sample_ref
-            elif location:
-                if sample_ref.container_reference == location[0] and \
-                       sample_ref.sample_reference == location[1]:
-                    return sample_ref
-
-        return None
+    def get_image_queue_statistics(self):
+        """
+        :returns: counters of the image queue (see ImageQueue.get_statistics)
+                  or an empty dictionary if the queue is disabled
+        """
+        if self.__image_queue is None:
+            return {}
+        return self.__image_queue.get_statistics()
 
 
     @trace
@@ -962,8 +1008,10 @@ class ISPyBClient2(HardwareObject):
                             objects
         :type sample_refs: list (of sample_ref objects).
 
-        :returns: A list with sample_ref objects.
-        :rtype: list
+        :returns: A list with sample_ref objects, in 'loaded_sample', and
+                  the numbers of matched samples in 'match_statistics'
+                  (see ISPyBSampleMatching.match_samples).
+        :rtype: dict
         """
         if self.__tools_ws:
             sample_references = []
@@ -984,75 +1032,17 @@ class ISPyBClient2(HardwareObject):
             except URLError:
                 logging.getLogger("ispyb_client").exception(_CONNECTION_ERROR_MSG)
 
+            # matched with indexes of the sample changer samples by code and
+            # location, see ISPyBSampleMatching
+            matched_samples, sample_references, match_statistics = \
+                ISPyBSampleMatching.match_samples(response_samples,
+                                                  sample_references)
+            logging.getLogger("ispyb_client").debug("Samples matched with " + \
+                "the sample changer: %s" % match_statistics)
+
             samples = []
-            for sample in response_samples:
+            for sample in matched_samples:
                 try:
-                    loc = [None, None]
-                    try:
-                      loc[0]=int(sample.containerSampleChangerLocation)
-                    except:
-                      pass
-                    try:
-                      loc[1]=int(sample.sampleLocation)
-                    except:
-                      pass
-
-                    # Unmatched sample, just catch and do nothing
-                    # (dont remove from sample_ref)
-                    if not sample.code and \
-                            not sample.sampleLocation:
-                        pass
-                    # Sample location and code was found in ISPyB and they match
-                    # with the sample changer.
-                    elif sample.code and sample.sampleLocation:
-                        sc_sample = \
-                            self.__find_sample(sample_references,
-                                               code = sample.code,
-                                               location = loc)
-
-                        # The sample codes dose not match
-                        if not sc_sample:
-                            sc_sample = self.__find_sample(sample_references,
-                                                           location = loc)
-
-                            if sc_sample.code != '':
-                                sample.code = sc_sample.code
-
-                        sample_references.remove(sc_sample)
-
-
-                    # Only location was found, update with the code
-                    # from sample changer if it exists.
-                    elif sample.sampleLocation:
-                        sc_sample = \
-                            self.__find_sample(sample_references,
-                                               location = loc)
-                        if sc_sample:
-                            sample.sampleCode = sc_sample.code
-                            sample_references.remove(sc_sample)
-
-                    # Sample code was found in ISPyB but dosent match with
-                    # the samplechanger at given location
-                    #
-                    # Use the information from the sample changer.
-                    else:
-                        #Use sample changer code for sample  ?
-                        sample.containerSampleChangerLocation = \
-                            sample_references.containter_referance
-                        sample.sampleLocation = \
-                            sample_references.sample_reference
-
-                        loc = (int(sample.containerSampleChangerLocation),
-                               int(sample.sampleLocation))
-
-                        sc_sample = \
-                            self.__find_sample(sample_references,
-                                               location = loc)
-                        if sc_sample:
-                            sample.code = sc_sample.code
-                            sample_references.remove(sc_sample)
-
-
                     samples.append(utf_encode(asdict(sample)))
 
 #                         {'BLSample': utf_encode(asdict(sample.blSample)),
@@ -1083,6 +1073,7 @@ class ISPyBClient2(HardwareObject):
 
 
             return {'loaded_sample': samples,
+                    'match_statistics': match_statistics,
                     'status': {'code':'ok'}}
         else:
             logging.getLogger("ispyb_client").\
@@ -1141,6 +1132,7 @@ class ISPyBClient2(HardwareObject):
 
                 session = self.__collection.service.\
                     storeOrUpdateSession(session_dict)
+                self.__records.invalidate("sessions")
 
                 # changing back to string representation of the dates,
                 # since the session_dict is used after this method is called,
@@ -1467,8 +1459,8 @@ class ISPyBClient2(HardwareObject):
 
         if self.__shipping:
             try:
-               proposals = eval(self.__shipping.service.\
-                  findProposalsByLoginName(user_name))  
+               proposals = self.__records.get_or_call(("proposals", user_name),
+                  self.__find_proposals_by_login_name, user_name)
                if proposal_list is not None:
                    for proposal in proposals:
                         if proposal['type'].upper() in ['MX', 'MB'] and \
@@ -1480,61 +1472,19 @@ class ISPyBClient2(HardwareObject):
 
             res_proposal = []
             if len(proposal_list) > 0:
-                for proposal in proposal_list:
-
-                    proposal_code = proposal['code']
-                    proposal_number = proposal['number']
-
-                    #person
-                    try:
-                        person = self.__shipping.service.\
-                                      findPersonByProposal(proposal_code,
-                                                           proposal_number)
-                        if not person:
-                            person = {}
-                    except WebFault, e:
-                        logging.getLogger("ispyb_client").exception(e.message)
-                        person = {}
-
-                    #lab
-                    try:
-                        lab = self.__shipping.service.\
-                                   findLaboratoryByProposal(proposal_code,
-                                                            proposal_number)
-                        if not lab:
-                            lab = {}
-                    except WebFault, e:
-                        logging.getLogger("ispyb_client").exception(e.message)
-                        lab = {}
-
-                    #sessions
-                    try:
-                        res_sessions = self.__collection.service.\
-                               findSessionsByProposalAndBeamLine(proposal_code,
-                                                                 proposal_number,
-                                                                 self.beamline_name)
-                        sessions = []
-                        for session in res_sessions:
-                            if session is not None :
-                                try:
-                                    session.startDate = \
-                                        datetime.strftime(session.startDate,
-                                                          "%Y-%m-%d %H:%M:%S")
-                                    session.endDate = \
-                                        datetime.strftime(session.endDate,
-                                                          "%Y-%m-%d %H:%M:%S")
-                                except:
-                                    pass
-                                sessions.append(utf_encode(asdict(session)))
-
-                    except WebFault, e:
-                        logging.getLogger("ispyb_client").exception(e.message)
-                        sessions = []
-
-                    
+                # person, lab and sessions of all proposals, concurrently
+                kinds = ("person", "laboratory", "sessions")
+                records = self.__fan_out.map(
+                    [(self.__get_record, (kind, proposal['code'],
+                                          proposal['number'])) \
+                     for proposal in proposal_list for kind in kinds])
+
+                for index, proposal in enumerate(proposal_list):
+                    person, lab, sessions = \
+                        records[index * len(kinds):(index + 1) * len(kinds)]
                     res_proposal.append({'Proposal': proposal,
-                                         'Person': utf_encode(asdict(person)),
-                                         'Laboratory': utf_encode(asdict(lab)),
+                                         'Person': person,
+                                         'Laboratory': lab,
                                          'Session' : sessions})
             else:
                 logging.getLogger("ispyb_client").\
@@ -1545,6 +1495,10 @@ class ISPyBClient2(HardwareObject):
                           " returning empty proposal")
         return res_proposal 
 
+    def __find_proposals_by_login_name(self, user_name):
+        return eval(self.__shipping.service.\
+            findProposalsByLoginName(user_name))
+
     def store_autoproc_program(self, autoproc_program_dict):
         """
         """
@@ -1658,8 +1612,10 @@ class ISPyBClient2(HardwareObject):
         return workflow_step_id
         
 
-    def store_image_quality_indicators(self, image_dict):
+    def store_image_quality_indicators(self, image_dict, wait=False):
         """
+        Stores the quality indicators of an image, queued with the images
+        unless <wait> is True or the queue is disabled.
         """
         quality_ind_id = -1
         quality_ind_dict = {"imageId": image_dict["image_id"],
@@ -1669,11 +1625,17 @@ class ISPyBClient2(HardwareObject):
                             "goodBraggCandidates": image_dict["spots_num"],
                             "totalIntegratedSignal": image_dict["spots_int_aver"],
                             "method1Res": image_dict["spots_resolution"]}
+        if self.__image_queue is not None and not wait:
+            self.__image_queue.put(ISPyBImageQueue.QUALITY_INDICATORS,
+                                   quality_ind_dict["autoProcProgramId"],
+                                   quality_ind_dict["imageId"],
+                                   quality_ind_dict)
+            return
         try:
            quality_ind_id = self.__autoproc_ws.service.\
                 storeOrUpdateImageQualityIndicators(quality_ind_dict)
-        except ex:
-            msg = 'Could not store image quality indicators in lims: %s' % ex.message
+        except:
+            msg = 'Could not store image quality indicators in lims'
             logging.getLogger("ispyb_client").exception(msg)
         return quality_ind_id
 
@@ -2158,10 +2120,9 @@ class ISPyBValueFactory():
         workflow_vo = None
 
         try:
-            ws_client = Client(_WS_COLLECTION_URL,
-                               cache = None)
-            workflow_vo = \
-                ws_client.factory.create('workflow3VO')
+            with ISPyBClientRegistry.get_client(_WS_COLLECTION_URL) as ws_client:
+                workflow_vo = \
+                    ws_client.factory.create('workflow3VO')
         except:
             raise
 
@@ -2190,10 +2151,9 @@ class ISPyBValueFactory():
         workflow_mesh_vo = None
 
         try:
-            ws_client = Client(_WS_COLLECTION_URL,
-                               cache = None)
-            workflow_mesh_vo = \
-                ws_client.factory.create('workflowMeshWS3VO')
+            with ISPyBClientRegistry.get_client(_WS_COLLECTION_URL) as ws_client:
+                workflow_mesh_vo = \
+                    ws_client.factory.create('workflowMeshWS3VO')
         except:
             raise
 
@@ -2223,10 +2183,9 @@ class ISPyBValueFactory():
         grid_info_vo = None
 
         try:
-            ws_client = Client(_WS_COLLECTION_URL,
-                               cache = None)
-            grid_info_vo = \
-                ws_client.factory.create('gridInfoWS3VO')
+            with ISPyBClientRegistry.get_client(_WS_COLLECTION_URL) as ws_client:
+                grid_info_vo = \
+                    ws_client.factory.create('gridInfoWS3VO')
         except:
             raise
 
@@ -2256,10 +2215,9 @@ class ISPyBValueFactory():
         workflow_vo = None
 
         try:
-            ws_client = Client(_WS_COLLECTION_URL,
-                               cache = None)
-            workflow_step_vo = \
-                ws_client.factory.create('workflowStep3VO')
+            with ISPyBClientRegistry.get_client(_WS_COLLECTION_URL) as ws_client:
+                workflow_step_vo = \
+                    ws_client.factory.create('workflowStep3VO')
         except:
             raise
 
@@ -2284,39 +2242,6 @@ class ISPyBValueFactory():
 
         return workflow_step_vo
 
-    def grid_info_from_workflow_info(self, workflow_info_dict):
-        """
-        Ceates grid3VO from worflow_info_dict.
-        :rtype: grid3VO
-        """
-        ws_client = None
-        grid_info_vo = None
-
-        try:
-            ws_client = Client(_WS_COLLECTION_URL,
-                               cache = None)
-            grid_info_vo = \
-                ws_client.factory.create('gridInfoWS3VO')
-        except:
-            raise
-
-        try:
-            if workflow_info_dict.get("grid_info_id"):
-                grid_info_vo.gridInfoId = workflow_info_dict.get("grid_info_id")
-            grid_info_vo.dx_mm = workflow_info_dict.get("dx_mm")
-            grid_info_vo.dy_mm = workflow_info_dict.get("dy_mm")
-            grid_info_vo.meshAngle = workflow_info_dict.get("mesh_angle")
-            grid_info_vo.steps_x = workflow_info_dict.get("steps_x")
-            grid_info_vo.steps_y = workflow_info_dict.get("steps_y")
-            grid_info_vo.xOffset = workflow_info_dict.get("xOffset")
-            grid_info_vo.yOffset = workflow_info_dict.get("yOffset")
-        except KeyError,diag:
-            err_msg = \
-                "ISPyBClient: error storing a grid info (%s)" % str(diag)
-            raise ISPyBArgumentError(err_msg)
-
-        return grid_info_vo
-
 
 class ISPyBArgumentError(Exception):
     def __init__(self, msg):
@@ -205,7 +205,7 @@ class ISPyBClient2Mockup(HardwareObject):
         pass
 
 
-    def store_image(self, image_dict):
+    def store_image(self, image_dict, wait=False):
         """
         Stores the image (image parameters) <image_dict>
         
@@ -550,7 +550,7 @@ class ISPyBClient2Mockup(HardwareObject):
     def _store_workflow(self, info_dict):
         pass
 
-    def store_image_quality_indicators(self, image_dict):
+    def store_image_quality_indicators(self, image_dict, wait=False):
         pass
 
     # Bindings to methods called from older bricks.
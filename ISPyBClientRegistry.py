@@ -0,0 +1,331 @@
+"""
+Process wide registry of the suds clients of the ISPyB web services.
+
+Building a suds Client downloads and parses the WSDL and all its schemas,
+which takes seconds for the ISPyB services. The registry builds one client
+per WSDL url and process, and keeps a small pool of clones of it per
+credentials (Client.clone shares the parsed WSDL). A clone is checked out
+of the pool for the duration of one call and returned afterwards, so that
+the options and the last messages of a client are not shared between
+concurrent calls, and the clones are reused by the short lived greenlets
+of the callers.
+
+The WSDL and schema documents are also kept on disk (suds DocumentCache)
+in a directory named after the url and the sha1 of the WSDL document, so
+that a restart only downloads the WSDL document and a new version of the
+WSDL is not read from an old cache. Only the WSDL document is hashed: the
+schema documents it imports (?xsd=N for the JAX-WS services) can change
+behind an unchanged WSDL, so the cached documents expire after CACHE_DAYS
+(one day). The parsed WSDL object itself is not cached on disk: unpickling
+it takes as long as parsing the documents.
+
+Running the module measures the client construction times on a generated
+WSDL and schema, served by a local http server (requires suds):
+    python ISPyBClientRegistry.py [types_num] [server_delay]
+"""
+
+import os
+import sys
+import time
+import hashlib
+import logging
+import contextlib
+import gevent
+
+from suds.client import Client
+from suds.cache import DocumentCache
+from suds.transport import Request
+from suds.transport.http import HttpAuthenticated
+
+
+CACHE_DIR = os.path.expanduser("~/.ispyb_wsdl_cache")
+CACHE_DAYS = 1
+POOL_SIZE = 4
+
+__registry = None
+
+
+def get_registry():
+    """
+    Descript. : returns the shared client registry
+    """
+    global __registry
+    if __registry is None:
+        __registry = ClientRegistry()
+    return __registry
+
+
+def get_client(url, username=None, password=None, timeout=90):
+    """
+    Descript. : context manager, checks a client of the url out of the
+                pool and returns it to the pool at the end of the block
+    """
+    return get_registry().get_client(url, username, password, timeout)
+
+
+def get_proxy(url, username=None, password=None, timeout=90):
+    """
+    Descript. : object that forwards the attributes to the pooled clients
+                of the url
+    """
+    return get_registry().get_proxy(url, username, password, timeout)
+
+
+class ServiceProxy(object):
+    """
+    Descript. : each method call is done on a client checked out of the
+                pool for the duration of the call
+    """
+    def __init__(self, registry, key):
+        self.__registry = registry
+        self.__key = key
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            with self.__registry.get_client(*self.__key) as client:
+                return getattr(client.service, name)(*args, **kwargs)
+        call.__name__ = name
+        return call
+
+
+class ClientProxy(object):
+    """
+    Descript. : client.service.method(...) is called on a pooled client,
+                the other attributes (factory ...) are read from one
+    """
+    def __init__(self, registry, url, username, password, timeout):
+        self.__registry = registry
+        self.__key = (url, username, password, timeout)
+        self.service = ServiceProxy(registry, self.__key)
+
+    def __getattr__(self, name):
+        with self.__registry.get_client(*self.__key) as client:
+            return getattr(client, name)
+
+
+class ClientRegistry(object):
+    """
+    Descript. : one parsed WSDL per url, a pool of reusable clones per
+                url and credentials
+    """
+    def __init__(self, cache_dir=CACHE_DIR, cache_days=CACHE_DAYS,
+                 pool_size=POOL_SIZE):
+        self.cache_dir = cache_dir
+        self.cache_days = cache_days
+        self.pool_size = pool_size
+        self._clients = {}
+        self._pools = {}
+        self._stats = {"parsed": 0, "cached": 0, "clones": 0, "reused": 0,
+                       "build_time": 0.0}
+
+    @contextlib.contextmanager
+    def get_client(self, url, username=None, password=None, timeout=90):
+        """
+        Descript. : checks a clone of the client of url, with its own
+                    transport and options, out of the pool for the
+                    duration of the with block. Clones beyond pool_size
+                    idle ones are dropped when returned
+        Return    : suds Client
+        """
+        key = (url, username, password, timeout)
+        pool = self._pools.setdefault(key, [])
+        if pool:
+            client = pool.pop()
+            self._stats["reused"] += 1
+        else:
+            client = self._get_parsed_client(url, username, password,
+                                             timeout).clone()
+            client.set_options(transport=HttpAuthenticated(username=username,
+                password=password, timeout=timeout))
+            self._stats["clones"] += 1
+        try:
+            yield client
+        finally:
+            if len(pool) < self.pool_size and self._pools.get(key) is pool:
+                pool.append(client)
+
+    def get_proxy(self, url, username=None, password=None, timeout=90):
+        """
+        Descript. : builds the client of url if needed and returns a proxy
+                    to the pooled clients
+        Return    : ClientProxy
+        """
+        self._get_parsed_client(url, username, password, timeout)
+        return ClientProxy(self, url, username, password, timeout)
+
+    def get_statistics(self):
+        """
+        Return    : dictionary with "urls", "parsed" (WSDL downloaded and
+                    parsed), "cached" (WSDL parsed from the disk cache),
+                    "clones" (built), "reused" (taken from a pool) and
+                    "build_time" [s]
+        """
+        stats = dict(self._stats)
+        stats["urls"] = len(self._clients)
+        return stats
+
+    def clear(self):
+        self._clients.clear()
+        self._pools.clear()
+
+    def _get_parsed_client(self, url, username=None, password=None,
+                           timeout=90):
+        client = self._clients.get(url)
+        if client is None:
+            start = time.time()
+            transport = HttpAuthenticated(username=username, password=password,
+                                          timeout=timeout)
+            cache = None
+            cache_location = self._get_cache_location(url, transport)
+            if cache_location:
+                cached = os.path.isdir(cache_location) and \
+                    len(os.listdir(cache_location)) > 0
+                cache = DocumentCache(cache_location, days=self.cache_days)
+            client = Client(url, transport=transport, cache=cache,
+                            cachingpolicy=0)
+            self._clients[url] = client
+            self._stats["cached" if cache and cached else "parsed"] += 1
+            self._stats["build_time"] += time.time() - start
+            logging.getLogger("HWR").debug("ClientRegistry: client of %s " \
+                "built in %.3f s" % (url, time.time() - start))
+        return client
+
+    def _get_cache_location(self, url, transport):
+        """
+        Descript. : cache directory of the current version of the WSDL
+        Return    : path, None if the WSDL cannot be cached
+        """
+        if not self.cache_dir:
+            return None
+        try:
+            document = transport.open(Request(url))
+            wsdl_hash = hashlib.sha1(url.encode("utf-8"))
+            wsdl_hash.update(document.read())
+            document.close()
+        except:
+            logging.getLogger("HWR").warning("ClientRegistry: cannot read " \
+                "%s, the WSDL is not cached" % url)
+            return None
+        return os.path.join(self.cache_dir, wsdl_hash.hexdigest())
+
+
+def write_wsdl(directory, types_num):
+    """
+    Descript. : writes bench.wsdl and the imported bench.xsd with types_num
+                complex types of 20 fields and one operation per type
+                (benchmark data)
+    """
+    f = open(os.path.join(directory, "bench.xsd"), "w")
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"\n'
+            '  xmlns:tns="http://bench.ispyb/"'
+            ' targetNamespace="http://bench.ispyb/">\n')
+    for index in range(types_num):
+        f.write('<xs:element name="store%d" type="tns:store%d"/>\n'
+                '<xs:complexType name="store%d"><xs:sequence>'
+                '<xs:element name="arg0" type="tns:value%dVO" minOccurs="0"/>'
+                '</xs:sequence></xs:complexType>\n'
+                '<xs:complexType name="value%dVO"><xs:sequence>\n' % \
+                ((index, ) * 5))
+        for field in range(20):
+            f.write('<xs:element name="field%d" type="xs:string"'
+                    ' minOccurs="0"/>\n' % field)
+        f.write('</xs:sequence></xs:complexType>\n')
+    f.write('</xs:schema>\n')
+    f.close()
+
+    f = open(os.path.join(directory, "bench.wsdl"), "w")
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<definitions xmlns="http://schemas.xmlsoap.org/wsdl/"\n'
+            '  xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"\n'
+            '  xmlns:xs="http://www.w3.org/2001/XMLSchema"\n'
+            '  xmlns:tns="http://bench.ispyb/"'
+            ' targetNamespace="http://bench.ispyb/">\n'
+            '<types><xs:schema><xs:import namespace="http://bench.ispyb/"'
+            ' schemaLocation="bench.xsd"/></xs:schema></types>\n')
+    for index in range(types_num):
+        f.write('<message name="store%d"><part name="parameters"'
+                ' element="tns:store%d"/></message>\n' % (index, index))
+    f.write('<portType name="Bench">\n')
+    for index in range(types_num):
+        f.write('<operation name="store%d"><input message="tns:store%d"/>'
+                '</operation>\n' % (index, index))
+    f.write('</portType>\n<binding name="BenchBinding" type="tns:Bench">'
+            '<soap:binding style="document"'
+            ' transport="http://schemas.xmlsoap.org/soap/http"/>\n')
+    for index in range(types_num):
+        f.write('<operation name="store%d"><soap:operation soapAction=""/>'
+                '<input><soap:body use="literal"/></input></operation>\n' % \
+                index)
+    f.write('</binding>\n<service name="BenchService"><port name="BenchPort"'
+            ' binding="tns:BenchBinding"><soap:address'
+            ' location="http://127.0.0.1:1/"/></port></service>\n'
+            '</definitions>\n')
+    f.close()
+
+
+def __run_http_server(directory, port, delay):
+    """
+    Descript. : serves the files of directory, each answer after delay [s]
+    """
+    try:
+        from BaseHTTPServer import HTTPServer
+        from SimpleHTTPServer import SimpleHTTPRequestHandler
+    except ImportError:
+        from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+    class DelayedHandler(SimpleHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            SimpleHTTPRequestHandler.do_GET(self)
+
+        def log_message(self, *args):
+            pass
+
+    os.chdir(directory)
+    HTTPServer(("127.0.0.1", port), DelayedHandler).serve_forever()
+
+
+if __name__ == '__main__' and sys.argv[1:2] == ["--http-server"]:
+    __run_http_server(sys.argv[2], int(sys.argv[3]), float(sys.argv[4]))
+elif __name__ == '__main__':
+    import shutil
+    import tempfile
+    import subprocess
+
+    types_num = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    port = 18766
+    tmp_dir = tempfile.mkdtemp()
+    write_wsdl(tmp_dir, types_num)
+    url = "http://127.0.0.1:%d/bench.wsdl" % port
+    cache_dir = os.path.join(tmp_dir, "cache")
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                               "--http-server", tmp_dir, str(port), str(delay)])
+    time.sleep(0.5)
+
+    def timed(label, method):
+        start = time.time()
+        with method() as client:
+            client.factory.create("value0VO")
+        print("%-40s %8.3f s" % (label, time.time() - start))
+
+    @contextlib.contextmanager
+    def unpooled_client():
+        yield Client(url, cache=None)
+
+    print("WSDL with %d types, server delay %.3f s" % (types_num, delay))
+    try:
+        timed("Client(url, cache=None)", unpooled_client)
+        timed("registry, cold (empty disk cache)",
+              lambda: ClientRegistry(cache_dir).get_client(url))
+        registry = ClientRegistry(cache_dir)
+        timed("registry, warm (disk cache)", lambda: registry.get_client(url))
+        timed("registry, pooled clone", lambda: registry.get_client(url))
+        gevent.spawn(timed, "registry, pooled clone, new greenlet",
+                     lambda: registry.get_client(url)).get()
+        print(registry.get_statistics())
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(tmp_dir)
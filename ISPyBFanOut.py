@@ -0,0 +1,131 @@
+"""
+Concurrent requests and memoisation of the LIMS records.
+
+FanOut runs independent requests (e.g. person, laboratory and sessions
+of each proposal of a user) in a bounded pool of greenlets and returns
+the results in the order of the requests.
+
+TTLCache memoises records for a limited time, so that a new login or a
+refresh of the GUI does not query the LIMS again. Greenlets asking for a
+record that is being requested wait for the running request instead of
+sending the same one.
+"""
+
+import sys
+import copy
+import time
+import collections
+import gevent
+import gevent.pool
+import gevent.event
+
+
+class FanOut(object):
+    """
+    Descript. : runs requests in a pool of size greenlets
+    """
+    def __init__(self, size=8):
+        self.size = size
+        self._pool = gevent.pool.Pool(size)
+
+    def map(self, calls):
+        """
+        Descript. : calls is a list of (function, args). Waits until all
+                    calls are done and raises the exception of the first
+                    failed call, if any
+        Return    : list of results in the order of calls
+        """
+        if len(calls) < 2:
+            return [function(*args) for function, args in calls]
+        greenlets = [self._pool.spawn(self._call, function, args) \
+                     for function, args in calls]
+        gevent.joinall(greenlets)
+        results = []
+        for greenlet in greenlets:
+            ok, value = greenlet.value
+            if not ok:
+                raise value
+            results.append(value)
+        return results
+
+    def _call(self, function, args):
+        try:
+            return True, function(*args)
+        except Exception:
+            return False, sys.exc_info()[1]
+
+
+class TTLCache(object):
+    """
+    Descript. : records memoised for ttl seconds, at most max_size records.
+                Values are copied, so callers can modify what they get
+    """
+    def __init__(self, ttl=300, max_size=1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._values = collections.OrderedDict()
+        self._pending = {}
+        self._stats = {"hits": 0, "misses": 0, "waits": 0}
+
+    def get(self, key, default=None):
+        entry = self._values.get(key)
+        if entry is None or entry[0] < time.time():
+            return default
+        return copy.deepcopy(entry[1])
+
+    def put(self, key, value):
+        self._values.pop(key, None)
+        self._values[key] = (time.time() + self.ttl, copy.deepcopy(value))
+        while len(self._values) > self.max_size:
+            self._values.popitem(last=False)
+
+    def get_or_call(self, key, function, *args):
+        """
+        Descript. : value of key, function(*args) is called if the value is
+                    not memoised or has expired. Exceptions of function are
+                    raised and nothing is memoised
+        """
+        entry = self._values.get(key)
+        if entry is not None and entry[0] >= time.time():
+            self._stats["hits"] += 1
+            return copy.deepcopy(entry[1])
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self._stats["waits"] += 1
+            return copy.deepcopy(pending.get())
+
+        self._stats["misses"] += 1
+        pending = self._pending[key] = gevent.event.AsyncResult()
+        try:
+            value = function(*args)
+        except Exception:
+            pending.set_exception(sys.exc_info()[1])
+            raise
+        else:
+            self.put(key, value)
+            pending.set(value)
+            return copy.deepcopy(value)
+        finally:
+            del self._pending[key]
+
+    def invalidate(self, kind=None):
+        """
+        Descript. : removes the values with keys starting with kind, or all
+                    the values
+        """
+        if kind is None:
+            self._values.clear()
+        else:
+            for key in list(self._values):
+                if isinstance(key, tuple) and key and key[0] == kind:
+                    del self._values[key]
+
+    def get_statistics(self):
+        """
+        Return    : dictionary with "size", "hits", "misses" and "waits"
+                    (requests that waited for the same running request)
+        """
+        stats = dict(self._stats)
+        stats["size"] = len(self._values)
+        return stats
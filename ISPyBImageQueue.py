@@ -0,0 +1,481 @@
+"""
+Write-behind queue of the image records stored in ISPyB.
+
+Image records (storeOrUpdateImage) and image quality indicators
+(storeOrUpdateImageQualityIndicators) are put in a bounded queue and
+sent by a background greenlet, so that the collection does not wait for
+the LIMS. Records are grouped per data collection (or per autoprocessing
+program for the quality indicators) and sent in batches of one group;
+a record put again while it is pending is merged with the pending one.
+
+When the server cannot be reached, the batch is retried with an
+exponential backoff. After a few failures, or when the queue is full,
+the records are written to a journal file (one json record per line)
+and new records are appended to it until the server answers again. The
+journal is read back by the worker, also after a restart of the
+application.
+
+Running the module measures the enqueue latency and the throughput
+against a local stub SOAP server (requires suds):
+    python ISPyBImageQueue.py [images_num] [server_delay]
+"""
+
+import os
+import sys
+import time
+import json
+import atexit
+import itertools
+import logging
+import collections
+import gevent
+import gevent.event
+
+
+IMAGE = "image"
+QUALITY_INDICATORS = "quality_indicators"
+
+
+class ImageQueue(object):
+    """
+    Descript. : bounded write-behind queue, send(kind, record) is called
+                by the worker for each record. Exceptions of retry_errors
+                mean that the server is not available, other exceptions
+                reject the record
+    """
+    def __init__(self, send, max_size=10000, batch_size=100,
+                 flush_delay=0.1, journal_file=None, retry_errors=(IOError, ),
+                 retry_delay=1.0, max_retry_delay=60.0, spill_retries=3):
+        self._send = send
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_delay = flush_delay
+        self.journal_file = journal_file
+        self.retry_errors = retry_errors
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.spill_retries = spill_retries
+
+        # (kind, group) -> OrderedDict key -> [record, put time, version]
+        self._groups = collections.OrderedDict()
+        self._size = 0
+        self._journal_size = self._count_journal()
+        self._failures = 0
+        self._closed = False
+        self._worker = None
+        self._wakeup = gevent.event.Event()
+        self._idle = gevent.event.Event()
+        self._latencies = collections.deque(maxlen=1000)
+        self._stats = {"put": 0, "coalesced": 0, "sent": 0, "rejected": 0,
+                       "retries": 0, "spilled": 0, "replayed": 0,
+                       "send_time": 0.0}
+
+        if self._journal_size:
+            logging.getLogger("HWR").info("ImageQueue: %d records to replay" \
+                " from %s" % (self._journal_size, self.journal_file))
+            self._start_worker()
+        else:
+            self._idle.set()
+        atexit.register(self.close, 0)
+
+    def put(self, kind, group, key, record):
+        """
+        Descript. : queues the record, merged with the pending record of
+                    the same kind, group and key if there is one
+        """
+        self._stats["put"] += 1
+        self._idle.clear()
+        records = self._groups.get((kind, group))
+        if records is not None and key in records:
+            entry = records[key]
+            entry[0].update(record)
+            entry[2] += 1
+            self._stats["coalesced"] += 1
+        elif self._closed or self._journal_size or self._size >= self.max_size:
+            # keeps the order of the records already in the journal
+            self._spill([(kind, group, key, dict(record))])
+        else:
+            if records is None:
+                records = self._groups[(kind, group)] = \
+                    collections.OrderedDict()
+            records[key] = [dict(record), time.time(), 0]
+            self._size += 1
+        self._start_worker()
+        self._wakeup.set()
+
+    def flush(self, timeout=None):
+        """
+        Descript. : waits until all records, journal included, are sent
+        Return    : True if the queue is empty
+        """
+        return self._idle.wait(timeout)
+
+    def close(self, timeout=None):
+        """
+        Descript. : sends the pending records within timeout and writes the
+                    remaining ones to the journal
+        """
+        if self._closed:
+            return
+        if timeout is None or timeout > 0:
+            self.flush(timeout)
+        self._closed = True
+        if self._worker is not None:
+            self._worker.kill(block=False)
+            self._worker = None
+        if self._size:
+            self._spill_pending()
+
+    def get_statistics(self):
+        """
+        Descript. : counters of the queue
+        Return    : dictionary with "pending", "journal", "put",
+                    "coalesced", "sent", "rejected", "retries", "spilled",
+                    "replayed", "mean_latency", "max_latency" [s] (put to
+                    sent, last 1000 records) and "throughput" [records/s]
+        """
+        stats = dict(self._stats)
+        send_time = stats.pop("send_time")
+        stats["pending"] = self._size
+        stats["journal"] = self._journal_size
+        latencies = list(self._latencies)
+        stats["mean_latency"] = sum(latencies) / len(latencies) \
+            if latencies else 0
+        stats["max_latency"] = max(latencies) if latencies else 0
+        stats["throughput"] = stats["sent"] / send_time if send_time else 0
+        return stats
+
+    def _start_worker(self):
+        if self._worker is None and not self._closed:
+            self._worker = gevent.spawn(self._run)
+
+    def _run(self):
+        while True:
+            if not self._size and self._journal_size:
+                self._replay()
+            if not self._size:
+                self._idle.set()
+                self._wakeup.clear()
+                self._wakeup.wait()
+                # lets the following records of the collection arrive
+                gevent.sleep(self.flush_delay)
+                continue
+
+            try:
+                self._send_batch()
+                self._failures = 0
+            except self.retry_errors:
+                self._failures += 1
+                self._stats["retries"] += 1
+                delay = min(self.retry_delay * 2 ** (self._failures - 1),
+                            self.max_retry_delay)
+                logging.getLogger("HWR").warning("ImageQueue: server not " \
+                    "available (%s), retry in %.1f s" % \
+                    (sys.exc_info()[1], delay))
+                if self._failures >= self.spill_retries:
+                    self._spill_pending()
+                gevent.sleep(delay)
+
+    def _send_batch(self):
+        """
+        Descript. : sends up to batch_size records of the first group
+        """
+        kind, group = next(iter(self._groups))
+        records = self._groups[(kind, group)]
+        for key in list(records)[:self.batch_size]:
+            entry = records[key]
+            version = entry[2]
+            start = time.time()
+            try:
+                self._send(kind, dict(entry[0]))
+            except self.retry_errors:
+                raise
+            except Exception:
+                self._stats["rejected"] += 1
+                logging.getLogger("HWR").exception("ImageQueue: %s record " \
+                    "rejected: %s" % (kind, entry[0]))
+            else:
+                end = time.time()
+                self._stats["sent"] += 1
+                self._stats["send_time"] += end - start
+                self._latencies.append(end - entry[1])
+
+            # the record merged during the call is sent again
+            if records.get(key) is entry and entry[2] == version:
+                del records[key]
+                self._size -= 1
+        if not records and self._groups.get((kind, group)) is records:
+            del self._groups[(kind, group)]
+
+    def _pending_lines(self):
+        for (kind, group), records in self._groups.items():
+            for key, entry in records.items():
+                yield (kind, group, key, entry[0])
+
+    def _spill_pending(self):
+        """
+        Descript. : moves the pending records in front of the journal
+        """
+        records = list(self._pending_lines())
+        self._groups.clear()
+        self._size = 0
+        self._spill(records, first=True)
+
+    def _spill(self, records, first=False):
+        if not self.journal_file:
+            logging.getLogger("HWR").error("ImageQueue: no journal, %d " \
+                "records lost" % len(records))
+            return
+        try:
+            lines = [json.dumps(record) + "\n" for record in records]
+            if first and self._journal_size:
+                lines.extend(self._read_journal())
+                self._write_journal(lines)
+            else:
+                journal = open(self.journal_file, "a")
+                journal.writelines(lines)
+                journal.close()
+            self._journal_size += len(records)
+            self._stats["spilled"] += len(records)
+        except (IOError, OSError, ValueError, TypeError):
+            logging.getLogger("HWR").exception("ImageQueue: could not " \
+                "write %d records to %s" % (len(records), self.journal_file))
+
+    def _replay(self):
+        """
+        Descript. : moves max_size records of the journal to the queue
+        """
+        try:
+            lines = self._read_journal()
+        except (IOError, OSError):
+            logging.getLogger("HWR").exception("ImageQueue: could not " \
+                "read %s" % self.journal_file)
+            self._journal_size = 0
+            return
+
+        now = time.time()
+        for line in lines[:self.max_size]:
+            try:
+                kind, group, key, record = json.loads(line)
+            except ValueError:
+                logging.getLogger("HWR").error("ImageQueue: invalid " \
+                    "journal line: %s" % line)
+                continue
+            key = tuple(key) if isinstance(key, list) else key
+            records = self._groups.setdefault((kind, group),
+                                              collections.OrderedDict())
+            if key in records:
+                records[key][0].update(record)
+                records[key][2] += 1
+            else:
+                records[key] = [record, now, 0]
+                self._size += 1
+            self._stats["replayed"] += 1
+        try:
+            self._write_journal(lines[self.max_size:])
+        except (IOError, OSError):
+            logging.getLogger("HWR").exception("ImageQueue: could not " \
+                "write %s" % self.journal_file)
+        self._journal_size = len(lines[self.max_size:])
+
+    def _count_journal(self):
+        if not self.journal_file:
+            return 0
+        try:
+            return len(self._read_journal())
+        except (IOError, OSError):
+            return 0
+
+    def _read_journal(self):
+        if not os.path.exists(self.journal_file):
+            return []
+        journal = open(self.journal_file)
+        lines = [line for line in journal if line.strip()]
+        journal.close()
+        return lines
+
+    def _write_journal(self, lines):
+        if not lines:
+            if os.path.exists(self.journal_file):
+                os.remove(self.journal_file)
+            return
+        tmp_file = self.journal_file + ".tmp"
+        journal = open(tmp_file, "w")
+        journal.writelines(lines)
+        journal.close()
+        os.rename(tmp_file, self.journal_file)
+
+
+STUB_WSDL = """<?xml version="1.0" encoding="UTF-8"?>
+<definitions xmlns="http://schemas.xmlsoap.org/wsdl/"
+    xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+    xmlns:xs="http://www.w3.org/2001/XMLSchema"
+    xmlns:tns="http://stub.ispyb/" targetNamespace="http://stub.ispyb/">
+  <types>
+    <xs:schema targetNamespace="http://stub.ispyb/">
+      <xs:element name="storeOrUpdateImage" type="tns:storeOrUpdateImage"/>
+      <xs:element name="storeOrUpdateImageResponse"
+                  type="tns:storeOrUpdateImageResponse"/>
+      <xs:complexType name="storeOrUpdateImage"><xs:sequence>
+        <xs:element name="arg0" type="tns:image" minOccurs="0"/>
+      </xs:sequence></xs:complexType>
+      <xs:complexType name="image"><xs:sequence>
+        <xs:element name="dataCollectionId" type="xs:int" minOccurs="0"/>
+        <xs:element name="fileName" type="xs:string" minOccurs="0"/>
+        <xs:element name="fileLocation" type="xs:string" minOccurs="0"/>
+        <xs:element name="imageNumber" type="xs:int" minOccurs="0"/>
+        <xs:element name="measuredIntensity" type="xs:double" minOccurs="0"/>
+        <xs:element name="synchrotronCurrent" type="xs:double" minOccurs="0"/>
+      </xs:sequence></xs:complexType>
+      <xs:complexType name="storeOrUpdateImageResponse"><xs:sequence>
+        <xs:element name="return" type="xs:int" minOccurs="0"/>
+      </xs:sequence></xs:complexType>
+    </xs:schema>
+  </types>
+  <message name="storeOrUpdateImage">
+    <part name="parameters" element="tns:storeOrUpdateImage"/>
+  </message>
+  <message name="storeOrUpdateImageResponse">
+    <part name="parameters" element="tns:storeOrUpdateImageResponse"/>
+  </message>
+  <portType name="Stub">
+    <operation name="storeOrUpdateImage">
+      <input message="tns:storeOrUpdateImage"/>
+      <output message="tns:storeOrUpdateImageResponse"/>
+    </operation>
+  </portType>
+  <binding name="StubBinding" type="tns:Stub">
+    <soap:binding style="document"
+                  transport="http://schemas.xmlsoap.org/soap/http"/>
+    <operation name="storeOrUpdateImage">
+      <soap:operation soapAction=""/>
+      <input><soap:body use="literal"/></input>
+      <output><soap:body use="literal"/></output>
+    </operation>
+  </binding>
+  <service name="StubService">
+    <port name="StubPort" binding="tns:StubBinding">
+      <soap:address location="http://127.0.0.1:%d/"/>
+    </port>
+  </service>
+</definitions>
+"""
+
+STUB_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
+<S:Envelope xmlns:S="http://schemas.xmlsoap.org/soap/envelope/"><S:Body>
+<ns2:storeOrUpdateImageResponse xmlns:ns2="http://stub.ispyb/">
+<return>%d</return></ns2:storeOrUpdateImageResponse></S:Body></S:Envelope>
+"""
+
+
+def __run_stub_server(port, delay):
+    """
+    Descript. : SOAP server answering storeOrUpdateImage after delay [s]
+    """
+    try:
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    except ImportError:
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+
+    class StubHandler(BaseHTTPRequestHandler):
+        image_ids = itertools.count(1)
+
+        def reply(self, body):
+            body = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self.reply(STUB_WSDL % port)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(delay)
+            self.reply(STUB_RESPONSE % next(StubHandler.image_ids))
+
+        def log_message(self, *args):
+            pass
+
+    HTTPServer(("127.0.0.1", port), StubHandler).serve_forever()
+
+
+def __start_stub_server(port, delay):
+    """
+    Descript. : runs the stub server in another interpreter, a forked
+                process would also run the greenlets of the queue
+    Return    : server process
+    """
+    import subprocess
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                                "--stub-server", str(port), str(delay)])
+    time.sleep(0.5)
+    return process
+
+
+if __name__ == '__main__' and sys.argv[1:2] == ["--stub-server"]:
+    __run_stub_server(int(sys.argv[2]), float(sys.argv[3]))
+elif __name__ == '__main__':
+    from gevent import monkey
+    monkey.patch_all()
+    import tempfile
+    from suds.client import Client
+
+    images_num = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.002
+    port = 18765
+    journal_file = os.path.join(tempfile.gettempdir(),
+                                "ISPyBImageQueue_benchmark.journal")
+    if os.path.exists(journal_file):
+        os.remove(journal_file)
+    logging.basicConfig(level=logging.ERROR)
+
+    def images(dc_id):
+        for number in range(1, images_num + 1):
+            yield {"dataCollectionId": dc_id, "imageNumber": number,
+                   "fileName": "test_1_%05d.cbf" % number,
+                   "fileLocation": "/data/test", "measuredIntensity": 1e12,
+                   "synchrotronCurrent": 200.0}
+
+    server = __start_stub_server(port, delay)
+    client = Client("http://127.0.0.1:%d/?wsdl" % port, timeout=3,
+                    cache=None)
+    send = lambda kind, record: client.service.storeOrUpdateImage(record)
+
+    print("%d images, server delay %.3f s" % (images_num, delay))
+    start = time.time()
+    for image in images(1):
+        client.service.storeOrUpdateImage(image)
+    elapsed = time.time() - start
+    print("synchronous: %.3f s, %.1f images/s, %.2f ms per image" % \
+          (elapsed, images_num / elapsed, elapsed / images_num * 1000))
+
+    queue = ImageQueue(send, max_size=images_num // 2, retry_delay=0.1,
+                       journal_file=journal_file)
+    start = time.time()
+    for image in images(2):
+        queue.put(IMAGE, 2, image["imageNumber"], image)
+        # collection of the next image
+        gevent.sleep(0)
+    put_time = time.time() - start
+    queue.flush()
+    elapsed = time.time() - start
+    print("queued: put %.2f ms per image, all sent in %.3f s" % \
+          (put_time / images_num * 1000, elapsed))
+    print(queue.get_statistics())
+
+    server.terminate()
+    server.wait()
+    for image in images(3):
+        queue.put(IMAGE, 3, image["imageNumber"], image)
+    gevent.sleep(1)
+    print("server down: %s" % queue.get_statistics())
+    server = __start_stub_server(port, delay)
+    start = time.time()
+    queue.flush()
+    print("server up again, journal sent in %.3f s: %s" % \
+          (time.time() - start, queue.get_statistics()))
+    server.terminate()
+    server.wait()
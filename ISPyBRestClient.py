@@ -5,7 +5,9 @@ import os
 import logging
 import gevent
 from datetime import datetime
-from requests import put, get, post
+
+from ISPyBFanOut import FanOut
+from ISPyBRestSession import RestSession
 
 from HardwareRepository import HardwareRepository
 from HardwareRepository.BaseHardwareObjects import HardwareObject
@@ -15,6 +17,19 @@ _CONNECTION_ERROR_MSG = "Could not connect to ISPyB, please verify that " + \
                         "configuration is correct"
 _NO_TOKEN_MSG = "Could not connect to ISPyB, no valid REST token available."
 
+def format_session_dates(sessions):
+    """
+    Descript. : converts the dates of the sessions returned by the REST
+                service ("Jan 1, 2016 9:00:00 AM") to "%Y-%m-%d %H:%M:%S"
+    """
+    for session in sessions:
+        for name in ('startDate', 'endDate'):
+            date_object = datetime.strptime(session[name],
+                                            '%b %d, %Y %I:%M:%S %p')
+            session[name] = datetime.strftime(date_object,
+                                              "%Y-%m-%d %H:%M:%S")
+    return sessions
+
 def in_greenlet(fun):
     def _in_greenlet(*args, **kwargs):
         log_msg = "lims client " + fun.__name__ + " called with: "
@@ -47,6 +62,8 @@ class ISPyBRestClient(HardwareObject):
         self.__rest_username = None
         self.__rest_token = None
         self.__rest_token_timestamp = None 
+        self.__rest_session = RestSession()
+        self.__fan_out = FanOut()
 
     def init(self):
         """
@@ -64,6 +81,16 @@ class ISPyBRestClient(HardwareObject):
         self.__rest_username = self.getProperty('restUserName')
         self.__rest_password = self.getProperty('restPass')
 
+        # all requests share the keep-alive connections of one session,
+        # up to lims_concurrency at the same time. The answers of the
+        # read requests are memoised for lims_cache_ttl seconds
+        concurrency = int(self.getProperty("lims_concurrency") or 8)
+        self.__rest_session.set_pool_size(concurrency)
+        self.__rest_session.ttl = float(self.getProperty("lims_cache_ttl") or 60)
+        self.__rest_session.timeout = \
+            float(self.getProperty("lims_timeout") or 30)
+        self.__fan_out = FanOut(concurrency)
+
         self.__update_rest_token()
 
     def __update_rest_token(self):
@@ -86,7 +113,8 @@ class ISPyBRestClient(HardwareObject):
                logging.getLogger("ispyb_client").info("Requesting new RESTful token...")
                data_dict = {'login' : str(self.__rest_username),
                             'password' : str(self.__rest_password)}
-               response = post(self.__rest_root + 'authenticate', data = data_dict)
+               response = self.__rest_session.post(self.__rest_root + \
+                   'authenticate', data = data_dict)
                self.__rest_token = response.json().get('token') 
                self.__rest_token_timestamp = datetime.now()
                logging.getLogger("ispyb_client").info("RESTful token acquired")
@@ -105,9 +133,8 @@ class ISPyBRestClient(HardwareObject):
         result = []
         if self.__rest_token:
             try:
-               response = get(self.__rest_root + self.__rest_token + \
-                   '/proposal/%s/list' % user_name)
-               proposal_list = eval(str(response.text))
+               proposal_list = self.__rest_session.get(self.__rest_root + \
+                   self.__rest_token + '/proposal/%s/list' % user_name)
                for proposal in proposal_list:
                    temp_proposal_dict = {}
                    # Backward compatability with webservices
@@ -120,26 +147,15 @@ class ISPyBRestClient(HardwareObject):
                        temp_proposal_dict['Proposal']['number'] = proposal['Proposal_proposalNumber']
                        temp_proposal_dict['Proposal']['title'] = proposal['Proposal_title']
                        temp_proposal_dict['Proposal']['personId'] = proposal['Proposal_personId']
-
-                       # gets all sessions for 
-                       #proposal_txt = temp_proposal_dict['Proposal']['code'] + \
-                       #               str(temp_proposal_dict['Proposal']['number'])
-                       #sessions = self.get_proposal_sessions(temp_proposal_dict['Proposal']['proposalId'])
-                       res_sessions = self.get_proposal_sessions(\
-                           temp_proposal_dict['Proposal']['proposalId'])
-                       #This could be fixed and removed from here
-                       proposal_sessions = []
-                       for session in res_sessions:
-                           date_object = datetime.strptime(session['startDate'], '%b %d, %Y %I:%M:%S %p')
-                           session['startDate'] = datetime.strftime(
-                                 date_object, "%Y-%m-%d %H:%M:%S")
-                           date_object = datetime.strptime(session['endDate'], '%b %d, %Y %I:%M:%S %p')
-                           session['endDate'] = datetime.strftime(
-                                 date_object, "%Y-%m-%d %H:%M:%S") 
-                           proposal_sessions.append(session)
-
-                       temp_proposal_dict['Sessions'] = proposal_sessions
                        result.append(temp_proposal_dict)
+
+               # sessions of all proposals are requested concurrently,
+               # dates are converted once per answer of the server
+               sessions = self.__fan_out.map([(self.__get_formatted_sessions,
+                   (proposal_dict['Proposal']['proposalId'], )) \
+                   for proposal_dict in result])
+               for proposal_dict, proposal_sessions in zip(result, sessions):
+                   proposal_dict['Sessions'] = proposal_sessions
             except:
                logging.getLogger("ispyb_client").exception(_CONNECTION_ERROR_MSG)  
         else:
@@ -151,9 +167,9 @@ class ISPyBRestClient(HardwareObject):
         session_list = []
         if self.__rest_token:
             try:
-               response = get(self.__rest_root + self.__rest_token + \
-                    '/proposal/%s/session/list' % proposal_id)
-               session_list = response.json()
+               session_list = self.__rest_session.get(self.__rest_root + \
+                    self.__rest_token + '/proposal/%s/session/list' % \
+                    proposal_id)
                #for session in all_sessions:
                #    if session['proposalVO']['proposalId'] == proposal_id:
                #session_list.append(all_sessions) 
@@ -164,6 +180,34 @@ class ISPyBRestClient(HardwareObject):
 
         return session_list
 
+    def __get_formatted_sessions(self, proposal_id):
+        """
+        Descript. : sessions of the proposal with the dates as strings
+                    "%Y-%m-%d %H:%M:%S", empty list if the request fails
+        """
+        try:
+            return self.__rest_session.get(self.__rest_root + \
+                self.__rest_token + '/proposal/%s/session/list' % proposal_id,
+                format_session_dates)
+        except:
+            logging.getLogger("ispyb_client").exception(_CONNECTION_ERROR_MSG)
+            return []
+
+    def clear_cache(self):
+        """
+        Descript. : forgets the memoised answers, the next requests
+                    query ISPyB
+        """
+        self.__rest_session.invalidate()
+
+    def get_cache_statistics(self):
+        """
+        Descript. : requests sent, cache hits, 304 answers and latencies
+                    of the REST session
+        Return    : dict
+        """
+        return self.__rest_session.get_statistics()
+
     #@trace
     def get_session_local_contact(self, session_id):
         """
@@ -177,8 +221,12 @@ class ISPyBRestClient(HardwareObject):
         result = {} 
 
         if self.__rest_token:
-             response = get(self.__rest_root + self.__rest_token + \
-                 "/proposal/session/%d/localcontact" % session_id)
+             try:
+                 result = self.__rest_session.get(self.__rest_root + \
+                     self.__rest_token + \
+                     "/proposal/session/%d/localcontact" % session_id)
+             except:
+                 logging.getLogger("ispyb_client").exception(_CONNECTION_ERROR_MSG)
         else:
             logging.getLogger("ispyb_client").exception(_NO_TOKEN_MSG)
         return result
@@ -246,7 +294,7 @@ class ISPyBRestClient(HardwareObject):
         pass
 
 
-    def store_image(self, image_dict):
+    def store_image(self, image_dict, wait=False):
         """
         Stores the image (image parameters) <image_dict>
         
@@ -348,8 +396,9 @@ class ISPyBRestClient(HardwareObject):
         self.update_rest_token()
         if self.__rest_token:
             try:
-               response = get(self.__rest_root + self.__rest_token + '/proposal/%s/session/list' % self.__rest_username)
-               all_sessions = response.json()
+               all_sessions = self.__rest_session.get(self.__rest_root + \
+                   self.__rest_token + '/proposal/%s/session/list' % \
+                   self.__rest_username)
                for session in all_sessions:
                    if session['proposalVO']['proposalId'] == proposal_id:
                        session_list.append(session)
@@ -0,0 +1,289 @@
+"""
+Persistent HTTP session of the ISPyB REST client.
+
+The module level requests.get/post open a new connection (and TLS
+handshake) for each request. RestSession sends all the requests through
+one requests.Session, with a pool of keep-alive connections per host as
+large as the number of concurrent requests.
+
+The decoded answers of the GET requests are memoised for ttl seconds.
+When an answer has expired and the server sent an ETag, the request is
+sent again with If-None-Match and a 304 answer renews the memoised value
+without transferring nor decoding it. A convert function can be given
+to memoise the converted value instead of the decoded json.
+
+Running the module measures the requests of a user login (proposal list
+and sessions of each proposal) against a local stub REST server:
+    python ISPyBRestSession.py [proposals_num] [server_delay]
+"""
+
+import sys
+import copy
+import time
+import json
+import logging
+import collections
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class RestSession(object):
+    """
+    Descript. : keep-alive session with a cache of the GET answers
+    """
+    def __init__(self, pool_size=8, ttl=60, max_size=1000, timeout=30):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.set_pool_size(pool_size)
+
+        # key -> [time of the answer, etag, value]
+        self._values = collections.OrderedDict()
+        self._latencies = collections.deque(maxlen=1000)
+        self._stats = {"requests": 0, "errors": 0, "hits": 0, "misses": 0,
+                       "revalidated": 0}
+
+    def set_pool_size(self, pool_size):
+        """
+        Descript. : keeps up to pool_size open connections per host
+        """
+        self.pool_size = pool_size
+        self._adapter = HTTPAdapter(pool_connections=pool_size,
+                                    pool_maxsize=pool_size)
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+
+    def get(self, url, convert=None, cache=True):
+        """
+        Descript. : json answer of url, converted with convert(value) if
+                    given. The value is memoised if cache is True. HTTP
+                    errors raise requests.HTTPError and are not memoised
+        Return    : copy of the value
+        """
+        key = (url, convert)
+        entry = self._values.get(key) if cache else None
+        if entry is not None and entry[0] + self.ttl >= time.time():
+            self._stats["hits"] += 1
+            return copy.deepcopy(entry[2])
+
+        headers = {}
+        if entry is not None and entry[1]:
+            headers["If-None-Match"] = entry[1]
+        response = self.request("GET", url, headers=headers)
+
+        if response.status_code == 304 and entry is not None:
+            self._stats["revalidated"] += 1
+            value = entry[2]
+        else:
+            self._stats["misses"] += 1
+            value = response.json()
+            if convert is not None:
+                value = convert(value)
+        if cache:
+            self._values.pop(key, None)
+            self._values[key] = [time.time(),
+                                 response.headers.get("ETag") or \
+                                 (entry and entry[1]), copy.deepcopy(value)]
+            while len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+        return value
+
+    def post(self, url, data=None):
+        return self.request("POST", url, data=data)
+
+    def put(self, url, data=None):
+        return self.request("PUT", url, data=data)
+
+    def request(self, method, url, **kwargs):
+        """
+        Descript. : sends the request on the session, raises
+                    requests.HTTPError for the error answers
+        Return    : requests.Response
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        self._stats["requests"] += 1
+        start = time.time()
+        try:
+            response = self.session.request(method, url, **kwargs)
+            response.raise_for_status()
+        except:
+            self._stats["errors"] += 1
+            raise
+        finally:
+            self._latencies.append(time.time() - start)
+        return response
+
+    def invalidate(self):
+        self._values.clear()
+
+    def close(self):
+        self.session.close()
+
+    def get_statistics(self):
+        """
+        Return    : dictionary with "requests" (sent), "errors", "hits"
+                    (answered from the cache), "misses", "revalidated"
+                    (304 answers), "size" (memoised answers),
+                    "connections" (opened since the start),
+                    "mean_latency" and "max_latency" [s] (last 1000
+                    requests)
+        """
+        stats = dict(self._stats)
+        stats["size"] = len(self._values)
+        latencies = list(self._latencies)
+        stats["mean_latency"] = sum(latencies) / len(latencies) \
+            if latencies else 0
+        stats["max_latency"] = max(latencies) if latencies else 0
+        connections = 0
+        try:
+            pools = self._adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                connections += pools[pool_key].num_connections
+        except:
+            pass
+        stats["connections"] = connections
+        return stats
+
+
+def __run_stub_server(port, delay, proposals_num):
+    """
+    Descript. : REST server with the proposals of a user, each answer
+                after delay [s]. Answers have an ETag and 304 is answered
+                to a matching If-None-Match
+    """
+    try:
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+        from SocketServer import ThreadingMixIn
+    except ImportError:
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+        from socketserver import ThreadingMixIn
+
+    class StubServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+        request_queue_size = 64
+
+    proposals = [{"Proposal_proposalId": index,
+                  "Proposal_proposalType": "MX",
+                  "Proposal_proposalCode": "MX",
+                  "Proposal_proposalNumber": 1000 + index,
+                  "Proposal_title": "Proposal %d" % index,
+                  "Proposal_personId": index} \
+                 for index in range(1, proposals_num + 1)]
+
+    def sessions(proposal_id):
+        return [{"sessionId": proposal_id * 100 + index,
+                 "proposalId": proposal_id,
+                 "startDate": "Jan %d, 2016 9:00:00 AM" % (index + 1),
+                 "endDate": "Jan %d, 2016 9:00:00 AM" % (index + 2)} \
+                for index in range(10)]
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+        wbufsize = -1
+
+        def reply(self, status, body=b""):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if status == 200:
+                self.send_header("ETag", '"%d"' % (len(body) + 1))
+            self.end_headers()
+            self.wfile.write(body)
+            self.wfile.flush()
+
+        def do_GET(self):
+            time.sleep(delay)
+            parts = self.path.strip("/").split("/")
+            if parts[-1] == "list" and parts[-2] == "session":
+                body = json.dumps(sessions(int(parts[-3])))
+            elif parts[-1] == "list":
+                body = json.dumps(proposals)
+            else:
+                self.reply(404)
+                return
+            body = body.encode()
+            if self.headers.get("If-None-Match") == '"%d"' % (len(body) + 1):
+                self.reply(304)
+            else:
+                self.reply(200, body)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(delay)
+            self.reply(200, json.dumps({"token": "token"}).encode())
+
+        def log_message(self, *args):
+            pass
+
+    StubServer(("127.0.0.1", port), StubHandler).serve_forever()
+
+
+if __name__ == '__main__' and sys.argv[1:2] == ["--stub-server"]:
+    __run_stub_server(int(sys.argv[2]), float(sys.argv[3]), int(sys.argv[4]))
+elif __name__ == '__main__':
+    from gevent import monkey
+    monkey.patch_all()
+    import os
+    import subprocess
+    from datetime import datetime
+    from ISPyBFanOut import FanOut
+
+    proposals_num = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    port = 18767
+    root = "http://127.0.0.1:%d/ispyb/rest/token" % port
+    logging.basicConfig(level=logging.ERROR)
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                               "--stub-server", str(port), str(delay),
+                               str(proposals_num)])
+    time.sleep(0.5)
+
+    def format_dates(sessions):
+        for session in sessions:
+            for name in ("startDate", "endDate"):
+                session[name] = datetime.strptime(session[name],
+                    "%b %d, %Y %I:%M:%S %p").strftime("%Y-%m-%d %H:%M:%S")
+        return sessions
+
+    def sessions_url(proposal):
+        return root + "/proposal/%s/session/list" % \
+            proposal["Proposal_proposalId"]
+
+    def login_module_get():
+        # requests as sent before the session, one connection per request
+        proposals = requests.get(root + "/proposal/user/list").json()
+        return [format_dates(requests.get(sessions_url(proposal)).json()) \
+                for proposal in proposals]
+
+    def login_session(rest_session, fan_out):
+        proposals = rest_session.get(root + "/proposal/user/list")
+        return fan_out.map([(rest_session.get, (sessions_url(proposal),
+                             format_dates)) for proposal in proposals])
+
+    def timed(label, method, *args):
+        start = time.time()
+        result = method(*args)
+        print("%-36s %8.3f s" % (label, time.time() - start))
+        return result
+
+    print("%d proposals, server delay %.3f s" % (proposals_num, delay))
+    try:
+        expected = timed("requests.get, sequential", login_module_get)
+        rest_session = RestSession(pool_size=1)
+        assert timed("session, sequential", login_session, rest_session,
+                     FanOut(1)) == expected
+        rest_session = RestSession(pool_size=8)
+        assert timed("session, 8 concurrent requests", login_session,
+                     rest_session, FanOut(8)) == expected
+        assert timed("session, cached", login_session, rest_session,
+                     FanOut(8)) == expected
+        rest_session.ttl = 0
+        assert timed("session, expired (304 answers)", login_session,
+                     rest_session, FanOut(8)) == expected
+        print(rest_session.get_statistics())
+    finally:
+        server.terminate()
+        server.wait()
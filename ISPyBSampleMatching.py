@@ -0,0 +1,289 @@
+"""
+Matching of the ISPyB samples of a proposal with the samples of the
+sample changer, used by ISPyBClient2.get_session_samples.
+
+The sample changer samples are indexed once by datamatrix code and by
+location (basket, vial), so each ISPyB sample is matched with dictionary
+lookups instead of a search through the sample changer list.
+
+Running the module compares the indexed matching with a linear search on
+synthetic data:
+    python ISPyBSampleMatching.py [lims_samples_num] [baskets_num]
+"""
+
+import sys
+import time
+import random
+from collections import namedtuple
+
+
+SampleReference = namedtuple('SampleReference', ['code',
+                                                 'container_reference',
+                                                 'sample_reference',
+                                                 'container_code'])
+
+
+class SampleIndex(object):
+    """
+    Descript. : sample changer samples indexed by code and location, a
+                sample is found at most once
+    """
+    def __init__(self, sample_refs):
+        self.sample_refs = list(sample_refs)
+        self.available = [True] * len(self.sample_refs)
+        self.by_code = {}
+        self.by_location = {}
+        for index, sample_ref in enumerate(self.sample_refs):
+            self.by_code.setdefault(sample_ref.code, []).append(index)
+            self.by_location.setdefault((sample_ref.container_reference,
+                sample_ref.sample_reference), []).append(index)
+
+    def find(self, code=None, location=None):
+        """
+        Descript. : first available sample with the code and/or the
+                    location (basket, vial), same order as the list
+        Return    : index of the sample, None if not found
+        """
+        if code:
+            for index in self.by_code.get(code, ()):
+                if self.available[index] and (location is None or \
+                   (self.sample_refs[index].container_reference,
+                    self.sample_refs[index].sample_reference) == location):
+                    return index
+        elif location is not None:
+            for index in self.by_location.get(location, ()):
+                if self.available[index]:
+                    return index
+        return None
+
+    def take(self, index):
+        self.available[index] = False
+        return self.sample_refs[index]
+
+    def remaining(self):
+        return [sample_ref for index, sample_ref in enumerate(self.sample_refs) \
+                if self.available[index]]
+
+
+def get_location(sample):
+    """
+    Descript. : (basket, vial) of an ISPyB sample, None if not an integer
+    """
+    location = [None, None]
+    try:
+        location[0] = int(sample.containerSampleChangerLocation)
+    except:
+        pass
+    try:
+        location[1] = int(sample.sampleLocation)
+    except:
+        pass
+    return tuple(location)
+
+
+def match_samples(lims_samples, sample_refs):
+    """
+    Descript. : matches the ISPyB samples with the sample changer samples.
+                The datamatrix code read by the sample changer is used in
+                case of conflict, ISPyB samples with a code but no
+                location get the location of the sample changer sample
+                with that code.
+    Return    : (samples, unmatched_refs, statistics). samples are the
+                ISPyB samples to report (updated), unmatched_refs the
+                sample changer samples not found in ISPyB, statistics a
+                dictionary with the number of samples matched by "code",
+                by "location", matched by location with a different code
+                ("conflicts"), ISPyB samples without code nor location
+                ("not_located"), not found in the sample changer
+                ("unmatched_lims") and sample changer samples not found in
+                ISPyB ("unmatched_sample_changer")
+    """
+    index = SampleIndex(sample_refs)
+    statistics = {"code": 0, "location": 0, "conflicts": 0,
+                  "not_located": 0, "unmatched_lims": 0,
+                  "unmatched_sample_changer": 0}
+    samples = []
+
+    for sample in lims_samples or []:
+        code = getattr(sample, "code", None)
+        sample_location = getattr(sample, "sampleLocation", None)
+        location = get_location(sample)
+
+        # Unmatched sample, just catch and do nothing
+        # (dont remove from sample_ref)
+        if not code and not sample_location:
+            statistics["not_located"] += 1
+
+        # Sample location and code was found in ISPyB, they should match
+        # with the sample changer, else the code of the sample changer is
+        # used. Samples not in the sample changer are not reported.
+        elif code and sample_location:
+            found = index.find(code=code, location=location)
+            if found is not None:
+                statistics["code"] += 1
+            else:
+                found = index.find(location=location)
+                if found is None:
+                    statistics["unmatched_lims"] += 1
+                    continue
+                if index.sample_refs[found].code != '':
+                    sample.code = index.sample_refs[found].code
+                    statistics["conflicts"] += 1
+                else:
+                    statistics["location"] += 1
+            index.take(found)
+
+        # Only location was found, update with the code
+        # from sample changer if it exists.
+        elif sample_location:
+            found = index.find(location=location)
+            if found is not None:
+                sample.sampleCode = index.take(found).code
+                statistics["location"] += 1
+            else:
+                statistics["unmatched_lims"] += 1
+
+        # Only the code was found in ISPyB, use the location of the
+        # sample changer sample with that code.
+        else:
+            found = index.find(code=code)
+            if found is not None:
+                sample_ref = index.take(found)
+                sample.containerSampleChangerLocation = \
+                    sample_ref.container_reference
+                sample.sampleLocation = sample_ref.sample_reference
+                statistics["code"] += 1
+            else:
+                statistics["unmatched_lims"] += 1
+
+        samples.append(sample)
+
+    unmatched_refs = index.remaining()
+    statistics["unmatched_sample_changer"] = len(unmatched_refs)
+    return samples, unmatched_refs, statistics
+
+
+def __match_samples_linear(lims_samples, sample_refs):
+    """
+    Descript. : matching by linear search, as done before the indexes
+                (benchmark reference, samples with only a code are not
+                reported)
+    """
+    def find_sample(sample_ref_list, code=None, location=None):
+        for sample_ref in sample_ref_list:
+            if code and location:
+                if sample_ref.code == code and \
+                   sample_ref.container_reference == location[0] and \
+                   sample_ref.sample_reference == location[1]:
+                    return sample_ref
+            elif code:
+                if sample_ref.code == code:
+                    return sample_ref
+            elif location:
+                if sample_ref.container_reference == location[0] and \
+                   sample_ref.sample_reference == location[1]:
+                    return sample_ref
+        return None
+
+    sample_refs = list(sample_refs)
+    samples = []
+    for sample in lims_samples:
+        loc = get_location(sample)
+        if not sample.code and not sample.sampleLocation:
+            pass
+        elif sample.code and sample.sampleLocation:
+            sc_sample = find_sample(sample_refs, code=sample.code, location=loc)
+            if not sc_sample:
+                sc_sample = find_sample(sample_refs, location=loc)
+                if sc_sample is None:
+                    continue
+                if sc_sample.code != '':
+                    sample.code = sc_sample.code
+            sample_refs.remove(sc_sample)
+        elif sample.sampleLocation:
+            sc_sample = find_sample(sample_refs, location=loc)
+            if sc_sample:
+                sample.sampleCode = sc_sample.code
+                sample_refs.remove(sc_sample)
+        else:
+            continue
+        samples.append(sample)
+    return samples, sample_refs
+
+
+class __Sample(object):
+    """
+    Descript. : ISPyB sample of the benchmark
+    """
+    def __init__(self, code, basket, vial):
+        self.code = code
+        self.containerSampleChangerLocation = basket
+        self.sampleLocation = vial
+        self.sampleCode = None
+
+    def get_values(self):
+        return (self.code, self.containerSampleChangerLocation,
+                self.sampleLocation, self.sampleCode)
+
+
+def __synthetic_data(lims_samples_num, baskets_num, vials_num=16):
+    """
+    Descript. : sample changer full of samples and ISPyB samples, part of
+                them in the sample changer with the same code, a different
+                code or no code, some without code nor location
+    """
+    sample_refs = []
+    for basket in range(1, baskets_num + 1):
+        for vial in range(1, vials_num + 1):
+            code = "DM%03d%02d" % (basket, vial) if random.random() < 0.9 \
+                   else ""
+            sample_refs.append(SampleReference(code, basket, vial,
+                                               "PUCK%03d" % basket))
+    random.shuffle(sample_refs)
+
+    lims_samples = []
+    for number in range(lims_samples_num):
+        basket = random.randint(1, baskets_num * 3)
+        vial = random.randint(1, vials_num)
+        kind = random.random()
+        if kind < 0.5:
+            code = "DM%03d%02d" % (basket, vial)
+        elif kind < 0.6:
+            code = "XX%05d" % number
+        else:
+            code = ""
+        if random.random() < 0.05:
+            # no code-only samples, not reported by the linear search
+            code, basket, vial = "", None, None
+        lims_samples.append(__Sample(code, basket and str(basket),
+                                     vial and str(vial)))
+    return lims_samples, sample_refs
+
+
+if __name__ == '__main__':
+    import copy
+
+    lims_samples_num = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    baskets_num = int(sys.argv[2]) if len(sys.argv) > 2 else 29
+    random.seed(0)
+    lims_samples, sample_refs = __synthetic_data(lims_samples_num,
+                                                 baskets_num)
+    print("%d ISPyB samples, %d sample changer samples" % \
+          (len(lims_samples), len(sample_refs)))
+
+    samples = copy.deepcopy(lims_samples)
+    start = time.time()
+    linear_samples, linear_refs = __match_samples_linear(samples, sample_refs)
+    print("linear search: %8.4f s" % (time.time() - start))
+
+    samples = copy.deepcopy(lims_samples)
+    start = time.time()
+    indexed_samples, indexed_refs, statistics = match_samples(samples,
+                                                              sample_refs)
+    print("indexes:       %8.4f s" % (time.time() - start))
+    print(statistics)
+
+    assert [sample.get_values() for sample in linear_samples] == \
+        [sample.get_values() for sample in indexed_samples]
+    assert sorted(linear_refs) == sorted(indexed_refs)
+    print("same result")
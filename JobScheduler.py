@@ -0,0 +1,332 @@
+"""
+Shared scheduler of the external processing jobs (EDNA characterisation,
+autoprocessing, thumbnails ...).
+
+Jobs are started without a shell from an argument list. Each program type
+has a lane with a bounded number of running jobs and the total number of
+running jobs is bounded as well. Pending jobs wait in a priority queue
+(characterisation before autoprocessing before thumbnails) and completion is signalled with gevent events, so callers can wait on a
+job without blocking the other greenlets.
+
+Example of xml:
+<object class="JobScheduler">
+   <max_jobs>6</max_jobs>
+   <characterisation_jobs>2</characterisation_jobs>
+   <autoprocessing_jobs>4</autoprocessing_jobs>
+   <thumbnails_jobs>2</thumbnails_jobs>
+</object>
+
+The objects without a job scheduler role use the scheduler returned by
+get_scheduler(), which is the last JobScheduler initialised or a default
+one.
+"""
+
+import os
+import sys
+import time
+import heapq
+import logging
+import itertools
+import gevent
+import gevent.event
+import gevent.subprocess
+
+from HardwareRepository.BaseHardwareObjects import HardwareObject
+
+
+# lower priority value runs first
+PRIORITIES = {"characterisation": 0,
+              "autoprocessing": 1,
+              "radiation_damage": 1,
+              "thumbnails": 2}
+DEFAULT_PRIORITY = 1
+
+MAX_JOBS = {"characterisation": 2,
+            "autoprocessing": 4,
+            "radiation_damage": 1,
+            "thumbnails": 2}
+DEFAULT_MAX_JOBS = 2
+MAX_TOTAL_JOBS = 6
+
+__scheduler = None
+
+
+def get_scheduler():
+    """
+    Descript. : returns the shared job scheduler
+    """
+    global __scheduler
+    if __scheduler is None:
+        scheduler = JobScheduler("job_scheduler")
+        scheduler.init()
+    return __scheduler
+
+
+def set_scheduler(scheduler):
+    global __scheduler
+    __scheduler = scheduler
+
+
+class Job(object):
+    """
+    Descript. : external process run by the JobScheduler
+    """
+    QUEUED, RUNNING, FINISHED, FAILED, KILLED = \
+        "queued", "running", "finished", "failed", "killed"
+
+    def __init__(self, job_id, argv, program, priority, cwd=None, env=None,
+                 stdout=None):
+        self.id = job_id
+        self.argv = [str(arg) for arg in argv]
+        self.program = program
+        self.priority = priority
+        self.cwd = cwd
+        self.env = env
+        self.stdout = stdout
+        self.state = Job.QUEUED
+        self.returncode = None
+        self.error = None
+        self.process = None
+        self.submit_time = time.time()
+        self.start_time = None
+        self.end_time = None
+        self.done_event = gevent.event.Event()
+
+    def is_done(self):
+        return self.done_event.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Descript. : waits the end of the job
+        Return    : return code of the process, None if not finished
+        """
+        self.done_event.wait(timeout)
+        return self.returncode
+
+    def get_info(self):
+        return {"id": self.id,
+                "program": self.program,
+                "argv": self.argv,
+                "state": self.state,
+                "returncode": self.returncode,
+                "error": self.error,
+                "pid": self.process.pid if self.process else None,
+                "submit_time": self.submit_time,
+                "start_time": self.start_time,
+                "end_time": self.end_time}
+
+
+class JobScheduler(HardwareObject):
+    """
+    Descript. : runs jobs with bounded concurrency per program type
+    """
+    def __init__(self, name):
+        HardwareObject.__init__(self, name)
+        self.max_jobs = dict(MAX_JOBS)
+        self.max_total_jobs = MAX_TOTAL_JOBS
+        self.history_size = 100
+        self._job_ids = itertools.count(1)
+        self._queue = []
+        self._running = {}
+        self._finished = []
+        self._stats = {}
+
+    def init(self):
+        for program in MAX_JOBS:
+            max_jobs = self.getProperty("%s_jobs" % program)
+            if max_jobs is not None:
+                self.max_jobs[program] = int(max_jobs)
+        self.max_total_jobs = int(self.getProperty("max_jobs") or MAX_TOTAL_JOBS)
+        self.history_size = int(self.getProperty("history_size") or 100)
+        set_scheduler(self)
+
+    def submit(self, argv, program="default", priority=None, cwd=None,
+               env=None, stdout=None):
+        """
+        Descript. : queues the execution of argv (list of arguments, no
+                    shell). env entries are added to the environment and
+                    stdout is a file name (default: /dev/null)
+        Return    : Job
+        """
+        if priority is None:
+            priority = PRIORITIES.get(program, DEFAULT_PRIORITY)
+        job = Job(self._job_ids.next(), argv, program, priority, cwd, env,
+                  stdout)
+        heapq.heappush(self._queue, (priority, job.id, job))
+        self._get_stats(program)["submitted"] += 1
+        logging.getLogger("HWR").debug("JobScheduler: job %d (%s) queued: %s" % \
+            (job.id, program, " ".join(job.argv)))
+        self._dispatch()
+        return job
+
+    def run(self, argv, program="default", priority=None, cwd=None,
+            env=None, stdout=None, timeout=None):
+        """
+        Descript. : submits argv and waits the end of the job
+        Return    : Job
+        """
+        job = self.submit(argv, program, priority, cwd, env, stdout)
+        job.wait(timeout)
+        return job
+
+    def kill(self, job):
+        """
+        Descript. : removes the job from the queue or kills its process
+        """
+        if job.state == Job.QUEUED:
+            self._queue = [entry for entry in self._queue if entry[2] is not job]
+            heapq.heapify(self._queue)
+            self._job_ended(job, Job.KILLED)
+        elif job.state == Job.RUNNING and job.process is not None:
+            job.state = Job.KILLED
+            try:
+                job.process.kill()
+            except OSError:
+                pass
+
+    def get_job(self, job_id):
+        for job in itertools.chain(self._running.values(),
+                                   [entry[2] for entry in self._queue],
+                                   self._finished):
+            if job.id == job_id:
+                return job
+
+    def get_queued_jobs(self):
+        return [entry[2] for entry in sorted(self._queue)]
+
+    def get_running_jobs(self):
+        return sorted(self._running.values(), key=lambda job: job.id)
+
+    def get_finished_jobs(self):
+        return list(self._finished)
+
+    def get_status(self):
+        """
+        Descript. : state of the lanes and job counters per program
+        Return    : dictionary program: {"max_jobs", "running", "queued",
+                    "submitted", "finished", "failed", "killed",
+                    "mean_wait_time", "mean_run_time"}
+        """
+        status = {}
+        for program, stats in self._stats.items():
+            ended = stats["finished"] + stats["failed"] + stats["killed"]
+            started = stats["started"]
+            status[program] = {"max_jobs": self._get_max_jobs(program),
+                "running": len([job for job in self._running.values() \
+                                if job.program == program]),
+                "queued": len([entry for entry in self._queue \
+                               if entry[2].program == program]),
+                "submitted": stats["submitted"],
+                "finished": stats["finished"],
+                "failed": stats["failed"],
+                "killed": stats["killed"],
+                "mean_wait_time": stats["wait_time"] / started if started else 0,
+                "mean_run_time": stats["run_time"] / ended if ended else 0}
+        return status
+
+    def _get_max_jobs(self, program):
+        return self.max_jobs.get(program, DEFAULT_MAX_JOBS)
+
+    def _get_stats(self, program):
+        if program not in self._stats:
+            self._stats[program] = {"submitted": 0, "started": 0,
+                                    "finished": 0, "failed": 0, "killed": 0,
+                                    "wait_time": 0.0, "run_time": 0.0}
+        return self._stats[program]
+
+    def _dispatch(self):
+        """
+        Descript. : starts the queued jobs, in priority order, that have
+                    a free slot in their lane
+        """
+        running = {}
+        for job in self._running.values():
+            running[job.program] = running.get(job.program, 0) + 1
+
+        total = len(self._running)
+        waiting = []
+        while self._queue and total < self.max_total_jobs:
+            entry = heapq.heappop(self._queue)
+            job = entry[2]
+            if running.get(job.program, 0) < self._get_max_jobs(job.program):
+                total += 1
+                running[job.program] = running.get(job.program, 0) + 1
+                self._start(job)
+            else:
+                waiting.append(entry)
+        for entry in waiting:
+            heapq.heappush(self._queue, entry)
+
+    def _start(self, job):
+        job.state = Job.RUNNING
+        job.start_time = time.time()
+        stats = self._get_stats(job.program)
+        stats["started"] += 1
+        stats["wait_time"] += job.start_time - job.submit_time
+        self._running[job.id] = job
+        self.emit("jobStarted", (job, ))
+        gevent.spawn(self._run_job, job)
+
+    def _run_job(self, job):
+        state = Job.FAILED
+        stdout = None
+        try:
+            env = None
+            if job.env:
+                env = dict(os.environ)
+                env.update(job.env)
+            stdout = open(job.stdout or os.devnull, "a")
+            job.process = gevent.subprocess.Popen(job.argv, cwd=job.cwd,
+                env=env, stdin=None, stdout=stdout, close_fds=True)
+            job.returncode = job.process.wait()
+            if job.state == Job.KILLED:
+                state = Job.KILLED
+            elif job.returncode == 0:
+                state = Job.FINISHED
+        except gevent.GreenletExit:
+            # the job greenlet is killed, so is the process
+            state = Job.KILLED
+            if job.process is not None and job.process.poll() is None:
+                try:
+                    job.process.kill()
+                except OSError:
+                    pass
+            raise
+        except Exception:
+            job.error = str(sys.exc_info()[1])
+            logging.getLogger("HWR").exception("JobScheduler: job %d (%s) " \
+                "could not be executed" % (job.id, job.program))
+        finally:
+            if stdout is not None:
+                stdout.close()
+            self._running.pop(job.id, None)
+            self._job_ended(job, state)
+            self._dispatch()
+
+    def _job_ended(self, job, state):
+        job.state = state
+        job.end_time = time.time()
+        stats = self._get_stats(job.program)
+        stats[state] += 1
+        if job.start_time is not None:
+            stats["run_time"] += job.end_time - job.start_time
+        self._finished.append(job)
+        del self._finished[:-self.history_size]
+        logging.getLogger("HWR").debug("JobScheduler: job %d (%s) %s, " \
+            "return code %s" % (job.id, job.program, state, job.returncode))
+        job.done_event.set()
+        self.emit("jobFinished", (job, ))
+
+
+if __name__ == '__main__':
+    # load test with sleep jobs: JobScheduler.py [jobs] [duration]
+    jobs_num = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    duration = sys.argv[2] if len(sys.argv) > 2 else "0.5"
+    scheduler = get_scheduler()
+    programs = PRIORITIES.keys()
+    jobs = [scheduler.submit(["sleep", duration], programs[i % len(programs)])
+            for i in range(jobs_num)]
+    while not all(job.is_done() for job in jobs):
+        gevent.sleep(1)
+        print(scheduler.get_status())
+    print(scheduler.get_status())
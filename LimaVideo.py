@@ -11,9 +11,9 @@ Example xml:
 </device>
 """
 import os
-import time
 import logging
 import gevent
+import numpy
 
 from Lima import Core 
 from Lima import Prosilica
@@ -23,6 +23,8 @@ from HardwareRepository.BaseHardwareObjects import Device
 from HardwareRepository.HardwareObjects.Camera import JpegType, BayerType, \
      MmapType, RawType, RGBType
 
+from VideoFrameRing import VideoFrameRing
+
 class LimaVideo(Device):
     """
     Descript. : 
@@ -54,6 +56,8 @@ class LimaVideo(Device):
         self.video = None 
 
         self.image_polling = None
+        self.frame_ring = None
+        self.emitted_frame_number = None
 
     def init(self):
         """
@@ -61,6 +65,7 @@ class LimaVideo(Device):
         """
         self.force_update = False
         self.scaling = pixmaptools.LUT.Scaling() 
+        self.frame_ring = VideoFrameRing()
         self.cam_type = self.getProperty("type").lower()
         self.cam_address = self.getProperty("address")
         self.cam_mirror = eval(self.getProperty("mirror"))
@@ -264,7 +269,7 @@ class LimaVideo(Device):
         self.do_scaling = True 
         while self.video.getLive():
             self.get_new_image()
-            time.sleep(sleep_time)
+            gevent.sleep(sleep_time)
 	     	
     def connectNotify(self, signal):
         """
@@ -281,25 +286,100 @@ class LimaVideo(Device):
         """
         self.do_scaling = True
 
-    def get_new_image(self):
+    def grab_frame(self):
         """
-        Descript. :
+        Descript. : reads last Lima image. New image is stored in the frame
+                    ring as read-only numpy view, without any conversion
+        Return.   : last VideoFrame or None
         """
         image = self.video.getLastImage()
         if image.frameNumber() > -1:
-            raw_buffer = image.buffer()	
-            if self.do_scaling:
-                self.scaling.autoscale_min_max(raw_buffer,
-                     image.width(), image.height(), self.scaling_type)
-                self.do_scaling = False
-            valid_flag, qimage = pixmaptools.LUT.raw_video_2_image(raw_buffer,
-                        image.width(),image.height(), self.scaling_type, self.scaling)
-            if valid_flag:
-                if self.cam_mirror is not None:
-                    qimage = qimage.mirror(self.cam_mirror[0], self.cam_mirror[1])     
-                self.emit("imageReceived", qimage, qimage.width(),
-                          qimage.height(), self.force_update)
-                return qimage
+            if self.scaling_type == pixmaptools.LUT.Scaling.BAYER_RG16:
+                raw_array = numpy.frombuffer(image.buffer(), numpy.uint16).\
+                     reshape(image.height(), image.width())
+            elif self.scaling_type == pixmaptools.LUT.Scaling.RGB24:
+                raw_array = numpy.frombuffer(image.buffer(), numpy.uint8).\
+                     reshape(image.height(), image.width(), 3)
+            else:
+                raw_array = numpy.frombuffer(image.buffer(), numpy.uint8).\
+                     reshape(image.height(), image.width())
+            frame = self.frame_ring.add_frame(raw_array, image.frameNumber())
+            if frame is not None:
+                self.emit("frameReceived", frame)
+        return self.frame_ring.get_last_frame()
+
+    def get_last_frame(self):
+        """
+        Descript. : returns last VideoFrame from the frame ring
+        """
+        return self.frame_ring.get_last_frame()
+
+    def frame_to_qimage(self, frame):
+        """
+        Descript. : converts raw frame to mirrored QImage
+        """
+        if self.do_scaling:
+            self.scaling.autoscale_min_max(frame.raw_array,
+                 frame.width, frame.height, self.scaling_type)
+            self.do_scaling = False
+        valid_flag, qimage = pixmaptools.LUT.raw_video_2_image(frame.raw_array,
+                    frame.width, frame.height, self.scaling_type, self.scaling)
+        if valid_flag:
+            if self.cam_mirror is not None:
+                qimage = qimage.mirror(self.cam_mirror[0], self.cam_mirror[1])     
+            return qimage
+
+    def frame_to_array(self, frame, bw):
+        """
+        Descript. : converts raw frame to mirrored numpy array. Bayer
+                    frames are returned as raw mosaic (good enough for
+                    loop detection)
+        """
+        image_array = frame.raw_array
+        if self.scaling_type == pixmaptools.LUT.Scaling.BAYER_RG16:
+            image_array = (image_array * (255.0 / max(image_array.max(), 1))).\
+                 astype(numpy.uint8)
+        elif self.scaling_type == pixmaptools.LUT.Scaling.RGB24 and bw:
+            image_array = numpy.dot(image_array, [0.299, 0.587, 0.114])
+
+        if self.cam_mirror is not None:
+            if self.cam_mirror[0]:
+                image_array = image_array[:, ::-1]
+            if self.cam_mirror[1]:
+                image_array = image_array[::-1]
+        return image_array
+
+    def get_new_image(self):
+        """
+        Descript. : returns QImage of the last frame. Conversion is done
+                    once per frame and imageReceived is emitted only for
+                    new frames
+        """
+        frame = self.grab_frame()
+        if frame is None:
+            return
+
+        qimage = frame.get_conversion("qimage", self.frame_to_qimage)
+        if qimage is not None and \
+           frame.frame_number != self.emitted_frame_number:
+            self.emitted_frame_number = frame.frame_number
+            self.emit("imageReceived", qimage, qimage.width(),
+                      qimage.height(), self.force_update)
+        return qimage
+
+    def get_snapshot(self, bw=None, return_as_array=True):
+        """
+        Descript. : returns last grabbed frame as numpy array without
+                    conversion to QImage
+        Args.     : bw (if True returns 2d grayscale array)
+        """
+        if not return_as_array:
+            return self.get_new_image()
+
+        frame = self.grab_frame()
+        if frame is not None:
+            return frame.get_conversion(("array", bool(bw)),
+                 lambda frame: self.frame_to_array(frame, bw))
 
     def take_snapshot(self, filename, bw=False):
         """
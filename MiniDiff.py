@@ -190,6 +190,10 @@ class MiniDiff(Equipment):
                 self.aperture = hwr.getHardwareObject(aperture_prop)
             except:
                 pass
+
+        # automatic centring: continuous phi sweep instead of n_points stops
+        self.centring_continuous_sweep = bool(self.getProperty("centring_continuous_sweep"))
+        self.centring_phi_range = self.getProperty("centring_phi_range") or 180
             
         if self.phiMotor is not None:
             self.connect(self.phiMotor, 'stateChanged', self.phiMotorStateChanged)
@@ -546,7 +550,9 @@ class MiniDiff(Equipment):
                                                                    self.pixelsPerMmY, self.pixelsPerMmZ, 
                                                                    self.getBeamPosX(), self.getBeamPosY(), 
                                                                    msg_cb=self.emitProgressMessage,
-                                                                   new_point_cb=lambda point: self.emit("newAutomaticCentringPoint", point))
+                                                                   new_point_cb=lambda point: self.emit("newAutomaticCentringPoint", point),
+                                                                   continuous_sweep=self.centring_continuous_sweep,
+                                                                   phi_range=self.centring_phi_range)
        
         self.currentCentringProcedure.link(self.autoCentringDone)
 
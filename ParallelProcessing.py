@@ -1,15 +1,30 @@
 import os
+import re
 import glob
 import time
+import heapq
 import logging
 import gevent
+import gevent.queue
+import gevent.socket
 import numpy
 import subprocess
 
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+try:
+    import zmq.green as zmq
+except ImportError:
+    zmq = None
+
 import matplotlib.pyplot as plt
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
 import SimpleHTML as simpleHtml
+import XSDataFastParser
 import queue_model_enumerables_v1 as qme
 
 from HardwareRepository.BaseHardwareObjects import HardwareObject
@@ -24,6 +39,363 @@ from XSDataCommon import XSDataInteger
 from XSDataCommon import XSDataString
 
 
+DOZOR_RESULT_FILE_TEMPLATE = "ResultControlDozor_Chunk_%06d.xml"
+DOZOR_RESULT_FILE_PATTERN = re.compile(r"^ResultControlDozor_Chunk_(\d+)\.xml$")
+
+
+class DozorResultSource(object):
+    """
+    Descript. : Base class of the Dozor result sources. A result source
+                delivers the names of closed ResultControlDozor_Chunk
+                files via result_queue. Each chunk is delivered once.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.result_queue = gevent.queue.Queue()
+        self._delivered_chunks = set()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def deliver(self, result_file_name):
+        """
+        Descript. : Puts result file in the queue if the file is a Dozor
+                    chunk that has not been delivered yet
+        """
+        match = DOZOR_RESULT_FILE_PATTERN.match(\
+             os.path.basename(result_file_name))
+        if match is None:
+            return
+        chunk_index = int(match.group(1))
+        if chunk_index not in self._delivered_chunks:
+            self._delivered_chunks.add(chunk_index)
+            self.result_queue.put((chunk_index, result_file_name))
+
+    def get_result_file(self, timeout):
+        """
+        Descript. : Waits for the next closed result file
+        Return.   : (chunk_index, result_file_name) or None after timeout
+        """
+        try:
+            return self.result_queue.get(timeout=timeout)
+        except gevent.queue.Empty:
+            return None
+
+
+class DozorResultPoller(DozorResultSource):
+    """
+    Descript. : Fallback source. Polls the processing directory for the
+                next chunk file and waits until its size stops growing.
+    """
+    def __init__(self, directory, polling_interval=0.2):
+        DozorResultSource.__init__(self, directory)
+        self.polling_interval = polling_interval
+        self._polling_task = None
+
+    def start(self):
+        self._polling_task = gevent.spawn(self.polling_task)
+
+    def stop(self):
+        if self._polling_task is not None:
+            self._polling_task.kill()
+            self._polling_task = None
+
+    def polling_task(self):
+        result_place = []
+        while not result_place:
+            result_place = glob.glob(os.path.join(self.directory,
+                                                  "EDApplication*/"))
+            gevent.sleep(self.polling_interval)
+
+        result_file_index = 0
+        while True:
+            result_file_name = os.path.join(result_place[0],
+                 DOZOR_RESULT_FILE_TEMPLATE % result_file_index)
+            logging.debug("ParallelProcessing: Waiting for Dozor result " +\
+                          "file: %s" % result_file_name)
+            while not (os.path.exists(result_file_name) and \
+                       os.stat(result_file_name).st_size > 0):
+                #Listing the directory refreshes NFS attribute cache
+                os.listdir(result_place[0])
+                gevent.sleep(self.polling_interval)
+
+            #Poll while the size is increasing
+            old_size = -1
+            new_size = os.stat(result_file_name).st_size
+            while old_size < new_size:
+                gevent.sleep(self.polling_interval)
+                old_size = new_size
+                new_size = os.stat(result_file_name).st_size
+
+            self.deliver(result_file_name)
+            result_file_index += 1
+
+
+class DozorResultInotifyWatcher(DozorResultSource):
+    """
+    Descript. : Watches the processing directory (and EDApplication
+                subdirectories created later) with inotify and delivers
+                a chunk file as soon as it is closed after writing.
+                Files closed before a watch is added are found by listing
+                the directory once the watch is in place.
+    """
+    def __init__(self, directory):
+        DozorResultSource.__init__(self, directory)
+        self._watch_manager = None
+        self._notifier = None
+        self._watch_task = None
+
+    def start(self):
+        self._watch_manager = pyinotify.WatchManager()
+        self._notifier = pyinotify.Notifier(self._watch_manager,
+                                            self.process_event,
+                                            timeout=0)
+        self._watch_manager.add_watch(self.directory,
+             pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO,
+             rec=True, auto_add=True)
+
+        #Files may have been closed before the watch was added
+        self.deliver_closed_files(os.path.join(self.directory,
+                                               "EDApplication*"))
+        self._watch_task = gevent.spawn(self.watch_task)
+
+    def stop(self):
+        if self._watch_task is not None:
+            self._watch_task.kill()
+            self._watch_task = None
+        if self._notifier is not None:
+            self._notifier.stop()
+            self._notifier = None
+
+    def process_event(self, event):
+        if event.mask & (pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO):
+            self.deliver(event.pathname)
+        elif event.mask & pyinotify.IN_CREATE and event.dir:
+            #auto_add has just added the watch on the new directory,
+            #files closed before are not reported by inotify
+            self.deliver_closed_files(event.pathname)
+
+    def deliver_closed_files(self, directory_pattern):
+        """
+        Descript. : Delivers the chunk files found in the directories
+                    matching directory_pattern. Files still being written
+                    are left to their IN_CLOSE_WRITE event
+        """
+        for result_file_name in sorted(glob.glob(os.path.join(\
+             directory_pattern, "ResultControlDozor_Chunk_*"))):
+            if self.is_complete(result_file_name):
+                self.deliver(result_file_name)
+
+    @staticmethod
+    def is_complete(result_file_name):
+        """
+        Descript. : Returns True if the result file ends with the closing
+                    tag of its root element
+        """
+        try:
+            result_file = open(result_file_name, "rb")
+            try:
+                result_file.seek(0, os.SEEK_END)
+                result_file.seek(max(0, result_file.tell() - 64))
+                tail = result_file.read()
+                return tail.rstrip().endswith(b"</XSDataResultControlDozor>")
+            finally:
+                result_file.close()
+        except (IOError, OSError):
+            return False
+
+    def watch_task(self):
+        watch_fd = self._watch_manager.get_fd()
+        while True:
+            gevent.socket.wait_read(watch_fd)
+            if self._notifier.check_events(timeout=0):
+                self._notifier.read_events()
+                self._notifier.process_events()
+
+
+class DozorResultZmqFeed(DozorResultSource):
+    """
+    Descript. : Receives names of closed chunk files pushed by the
+                processing wrapper on a ZeroMQ PULL socket. Local
+                sockets are available via ipc:// addresses.
+    """
+    def __init__(self, directory, address):
+        DozorResultSource.__init__(self, directory)
+        self.address = address
+        self._context = None
+        self._socket = None
+        self._receive_task = None
+
+    def start(self):
+        self._context = zmq.Context()
+        self._socket = self._context.socket(zmq.PULL)
+        self._socket.bind(self.address)
+        self._receive_task = gevent.spawn(self.receive_task)
+
+    def stop(self):
+        if self._receive_task is not None:
+            self._receive_task.kill()
+            self._receive_task = None
+        if self._socket is not None:
+            self._socket.close(linger=0)
+            self._socket = None
+        if self._context is not None:
+            self._context.term()
+            self._context = None
+
+    def receive_task(self):
+        while True:
+            result_file_name = self._socket.recv()
+            if not os.path.isabs(result_file_name):
+                result_file_name = os.path.join(self.directory,
+                                                result_file_name)
+            self.deliver(result_file_name)
+
+
+class ProcessingResultAggregator(object):
+    """
+    Descript. : Collects processing results chunk by chunk. Results are
+                stored in preallocated arrays: one dimensional arrays
+                indexed by image and, for a mesh scan, two dimensional
+                (row, col) arrays aligned with the grid. Serial image
+                number to (col, row) map is estimated once per scan and
+                a bounded heap keeps the best positions, so each chunk
+                costs only as much as its own number of images.
+    """
+    RESULT_KEYS = ("image_num", "spots_num", "spots_int_aver",
+                   "spots_resolution", "score")
+
+    def __init__(self, processing_params, grid, best_positions_num=10):
+        self.processing_params = processing_params
+        self.grid = grid
+        self.best_positions_num = best_positions_num
+        self.is_mesh = processing_params["lines_num"] > 1
+
+        self.results = {}
+        self.aligned_results = {}
+        self.cell_cols = None
+        self.cell_rows = None
+        self.cell_valid = None
+        self._best_heap = []
+        self._best_position_cache = {}
+
+        images_num = processing_params["images_num"]
+        for key in self.RESULT_KEYS:
+            self.results[key] = numpy.zeros(images_num)
+
+        if self.is_mesh:
+            num_cols = processing_params["steps_x"]
+            num_rows = processing_params["steps_y"]
+            self.cell_cols, self.cell_rows = self.get_cell_index_map(\
+                 grid, processing_params["first_image_num"], images_num)
+            self.cell_valid = (self.cell_cols >= 0) & \
+                              (self.cell_cols < num_cols) & \
+                              (self.cell_rows >= 0) & \
+                              (self.cell_rows < num_rows)
+            for key in self.RESULT_KEYS:
+                self.aligned_results[key] = numpy.zeros((num_rows, num_cols))
+            grid.set_score(self.results["score"])
+        else:
+            for key in self.RESULT_KEYS:
+                self.aligned_results[key] = self.results[key]
+
+    @staticmethod
+    def get_cell_index_map(grid, first_image_num, images_num):
+        """
+        Descript. : Returns arrays of col and row indexes for each image
+        """
+        return grid.get_col_row_from_image_serial_array(\
+             numpy.arange(first_image_num, first_image_num + images_num))
+
+    def add_results(self, image_indexes, chunk_results):
+        """
+        Descript. : Updates results of the given images
+        Args.     : image_indexes (numpy array of image indexes starting
+                    from 0), chunk_results (dict of numpy arrays with the
+                    same length as image_indexes)
+        """
+        image_indexes = numpy.asarray(image_indexes, dtype=int)
+        if self.is_mesh:
+            valid = self.cell_valid[image_indexes]
+            cell_rows = self.cell_rows[image_indexes[valid]]
+            cell_cols = self.cell_cols[image_indexes[valid]]
+
+        for key in self.RESULT_KEYS:
+            values = chunk_results.get(key)
+            if values is None:
+                continue
+            values = numpy.asarray(values)
+            self.results[key][image_indexes] = values
+            if self.is_mesh:
+                self.aligned_results[key][cell_rows, cell_cols] = values[valid]
+
+        for index, score in zip(image_indexes, chunk_results.get("score", ())):
+            if score > 0:
+                item = (score, -index)
+                if len(self._best_heap) < self.best_positions_num:
+                    heapq.heappush(self._best_heap, item)
+                elif item > self._best_heap[0]:
+                    heapq.heapreplace(self._best_heap, item)
+
+        if self.is_mesh:
+            #Lets the grid know that scores have changed
+            self.grid.set_score(self.results["score"])
+
+    def get_best_positions(self):
+        """
+        Descript. : Returns list of best positions sorted by score
+        """
+        best_positions_list = []
+        for score, index in sorted(self._best_heap, reverse=True):
+            index = -index
+            best_position = self._best_position_cache.get(index)
+            if best_position is None:
+                best_position = self.create_best_position(index)
+                self._best_position_cache[index] = best_position
+            best_positions_list.append(best_position)
+        return best_positions_list
+
+    def create_best_position(self, index):
+        index = int(index)
+        processing_params = self.processing_params
+        best_position = {}
+        best_position["index"] = index
+        best_position["index_serial"] = processing_params["first_image_num"] + index
+        best_position["score"] = float(self.results["score"][index])
+        best_position["spots_num"] = int(self.results["spots_num"][index])
+        best_position["spots_int_aver"] = float(self.results["spots_int_aver"][index])
+        best_position["spots_resolution"] = float(self.results["spots_resolution"][index])
+        best_position["filename"] = os.path.basename(processing_params["template"] % \
+             (processing_params["run_number"], processing_params["first_image_num"] + index))
+
+        cpos = None
+        if self.is_mesh:
+            col = int(self.cell_cols[index])
+            row = int(self.cell_rows[index])
+            cpos = self.grid.get_motor_pos_from_col_row(col, row, as_cpos=True)
+        else:
+            col = index
+            row = 0
+            #TODO Add best position for helical line
+        best_position["col"] = col + 1
+        best_position["row"] = processing_params["steps_y"] - row
+        best_position['cpos'] = cpos
+        return best_position
+
+    def get_results(self):
+        """
+        Descript. : Returns dictionary with aligned results and best positions.
+                    Arrays are copies, later chunks do not change them
+        """
+        aligned_results = dict((key, value.copy()) for key, value in \
+                               self.aligned_results.items())
+        aligned_results["best_positions"] = self.get_best_positions()
+        return aligned_results
+
+
 class ParallelProcessing(HardwareObject):
     def __init__(self, name):
         HardwareObject.__init__(self, name)
@@ -38,6 +410,8 @@ class ParallelProcessing(HardwareObject):
         self.processing_start_command = None
         self.processing_results = None
         self.processing_done_event = None
+        self.result_source_type = None
+        self.result_source_address = None
 
     def init(self):
         self.processing_done_event = gevent.event.Event()
@@ -63,6 +437,32 @@ class ParallelProcessing(HardwareObject):
 
         self.processing_start_command = str(self.getProperty("processing_command"))        
 
+        self.result_source_type = self.getProperty("result_source") or "polling"
+        self.result_source_address = self.getProperty("result_source_address")
+        if self.result_source_type == "inotify" and pyinotify is None:
+            logging.getLogger("HWR").warning("ParallelProcessing: pyinotify " +\
+                 "not available, polling is used to read results")
+            self.result_source_type = "polling"
+        elif self.result_source_type == "zmq" and \
+             (zmq is None or self.result_source_address is None):
+            logging.getLogger("HWR").warning("ParallelProcessing: ZeroMQ " +\
+                 "feed not available, polling is used to read results")
+            self.result_source_type = "polling"
+
+    def create_result_source(self, directory):
+        """
+        Descript. : Creates Dozor result source defined by the
+                    result_source property (inotify, zmq or polling)
+        Args.     : directory (processing directory)
+        Return.   : DozorResultSource object
+        """
+        if self.result_source_type == "inotify":
+            return DozorResultInotifyWatcher(directory)
+        elif self.result_source_type == "zmq":
+            return DozorResultZmqFeed(directory, self.result_source_address)
+        else:
+            return DozorResultPoller(directory)
+
     def create_processing_input(self, data_collection, processing_params):
         """
         Descript. : Creates dozor input file base on data collection parameters
@@ -229,14 +629,13 @@ class ParallelProcessing(HardwareObject):
         processing_input_file = os.path.join(processing_directory, "dozor_input.xml")
         processing_input.exportToFile(processing_input_file)
 
-        """
-        if not os.path.isfile(self.processing_start_command):
-            self.processing_done_event.set()
-            msg = "ParallelProcessing: Start command %s is not " +\
-                  "executable" % self.processing_start_command
-            logging.getLogger("queue_exec").error(msg)
-            self.emit("processingFailed")
-            return       
+        processing_params["simulated"] = \
+             not os.path.isfile(self.processing_start_command)
+        if processing_params["simulated"]:
+            msg = "ParallelProcessing: Start command %s is not " % \
+                  self.processing_start_command + \
+                  "executable, processing results are simulated"
+            logging.getLogger("queue_exec").warning(msg)
         else:
             msg = "ParallelProcessing: Starting processing using " +\
                   "xml file %s" % processing_input_file
@@ -244,11 +643,10 @@ class ParallelProcessing(HardwareObject):
             line_to_execute = self.processing_start_command + ' ' + \
                               processing_input_file + ' ' + \
                               processing_directory
+            subprocess.Popen(str(line_to_execute), shell = True,
+                             stdin = None, stdout = None, stderr = None,
+                             close_fds = True)
 
-        subprocess.Popen(str(line_to_execute), shell = True,
-                         stdin = None, stdout = None, stderr = None,
-                         close_fds = True)
-        """
         self.do_processing_result_polling(processing_params, 
                                           file_wait_timeout,
                                           data_collection.grid)
@@ -267,106 +665,33 @@ class ParallelProcessing(HardwareObject):
         Args.     : wait_timeout (file waiting timeout is sec.)
         Return.   : list of 10 best positions. If processing fails returns None 
         """
-        processing_result = {"image_num" : numpy.zeros(processing_params["images_num"]),
-                        "spots_num" : numpy.zeros(processing_params["images_num"]),
-                        "spots_int_aver" : numpy.zeros(processing_params["images_num"]),
-                        "spots_resolution" : numpy.zeros(processing_params["images_num"]),
-                        "score" : numpy.zeros(processing_params["images_num"])}
-
+        aggregator = ProcessingResultAggregator(processing_params, grid)
         processing_params["status"] = "Success"
-        failed = False
 
-        """
-        do_polling = True
-        result_file_index = 0
-        _result_place = []
-        _first_frame_timout = 5 * 60 / 10
-        _time_out = _first_frame_timout
-        _start_time = time.time()
-       
-        while _result_place == [] and time.time() - _start_time < _time_out :
-           _result_place = glob.glob(os.path.join(\
-                 processing_params["directory"],"EDApplication*/"))
-           gevent.sleep(0.2)
-        if _result_place == [] : 
-           msg = "ParallelProcessing: Failed to read dozor result " + \
-                 "rectory %s" % processing_params["directory"]
-           logging.error(msg)
-           processing_params["status"] = "Failed"
-           processing_params["comments"] += "Failed: " + msg
-           self.emit("processingFailed")
-           self.processing_done_event.set()
-           failed = True
-
-        while do_polling and not failed:
-            file_appeared = False
-            result_file_name = os.path.join(_result_place[0], 
-                  "ResultControlDozor_Chunk_%06d.xml" % result_file_index)
-            wait_file_start = time.time()
-            logging.debug("ParallelProcessing: Waiting for Dozor result " +\
-                          "file: %s" % result_file_name)
-            while not file_appeared and time.time() - wait_file_start < wait_timeout:
-                if os.path.exists(result_file_name) and os.stat(result_file_name).st_size > 0:
-                    file_appeared = True
-                    _time_out = wait_timeout
-                    logging.debug("ParallelProcessing: Dozor file is there," +\
-                                  " size={0}".format(os.stat(result_file_name).st_size))
-                else:
-                    os.system("ls %s > /dev/null" %_result_place[0])
-                    gevent.sleep(0.4)
-            if not file_appeared:
-                failed = True
-                msg = "ParallelProcessing: Dozor result file ({0}) " +\
-                      "failed to appear after {1} seconds".\
-                      format(result_file_name, wait_timeout)
-                logging.error(msg)
-                processing_params["status"] = "Failed"
-                processing_params["comments"] += "Failed: " + msg
+        if processing_params.get("simulated"):
+            gevent.sleep(10)
+            simulated_result = numpy.linspace(0, 
+                 processing_params["images_num"], 
+                 processing_params["images_num"]).astype('uint8')
+            aggregator.add_results(\
+                 numpy.arange(processing_params["images_num"]),
+                 dict((key, simulated_result) for key in \
+                      ProcessingResultAggregator.RESULT_KEYS))
+        else:
+            result_source = self.create_result_source(\
+                 processing_params["directory"])
+            result_source.start()
+            try:
+                failed = not self.read_processing_results(result_source,
+                     aggregator, processing_params, wait_timeout)
+            finally:
+                result_source.stop()
+            if failed:
                 self.emit("processingFailed")
                 self.processing_done_event.set()
                 return
-                
-            # poll while the size increasing:
-            _oldsize = -1 
-            _newsize =  0
-            while _oldsize < _newsize :
-                _oldsize = _newsize
-                _newsize = os.stat(result_file_name).st_size
-                gevent.sleep(0.3)
-                                
-            dozor_output_file = XSDataResultControlDozor.parseFile(result_file_name)
-            #this method could be improved with xml parsing
-            for dozor_image in dozor_output_file.getImageDozor():
-                image_index = dozor_image.getNumber().getValue() - 1
-                processing_result["image_num"][image_index] = image_index
-                processing_result["spots_num"][image_index] = \
-                      dozor_image.getSpots_num_of().getValue()
-                processing_result["spots_int_aver"][image_index] = \
-                      dozor_image.getSpots_int_aver().getValue()   
-                processing_result["spots_resolution"][image_index] = \
-                      dozor_image.getSpots_resolution().getValue()
-                processing_result["score"][image_index] = dozor_image.getScore().getValue()
-                image_index += 1
-                do_polling = (dozor_image.getNumber().getValue() != \
-                      processing_params["images_num"])
-
-            aligned_result = self.align_processing_results(\
-			    processing_result, processing_params, grid)
-            self.emit("paralleProcessingResults", (aligned_result, processing_params, False))
-            result_file_index += 1
-
-        """
-        gevent.sleep(10)
-        #This is for test...
 
-        for key in processing_result.keys():
-            processing_result[key] = numpy.linspace(0, 
-                 processing_params["images_num"], 
-                 processing_params["images_num"]).astype('uint8')
-        #processing_result['score'][20] = 10
-
-        self.processing_results = self.align_processing_results(\
-             processing_result, processing_params, grid)
+        self.processing_results = aggregator.get_results()
 
         self.emit("paralleProcessingResults", (self.processing_results,
                                                processing_params,
@@ -465,6 +790,53 @@ class ParallelProcessing(HardwareObject):
         plt.close(fig)
         self.processing_done_event.set()
 
+    def read_processing_results(self, result_source, aggregator,
+                                processing_params, wait_timeout):
+        """
+        Descript. : Reads Dozor result chunks delivered by the result source.
+                    Each chunk is parsed once, added to the aggregator and
+                    results are emitted. Reading finishes when all chunks
+                    up to the one containing the last image have been parsed.
+        Args.     : result_source (DozorResultSource), aggregator
+                    (ProcessingResultAggregator), wait_timeout (chunk
+                    waiting timeout in sec.)
+        Return.   : True if all results were read, False on timeout
+        """
+        parsed_chunks = set()
+        last_chunk_index = None
+
+        while last_chunk_index is None or \
+              len(parsed_chunks) <= last_chunk_index:
+            result = result_source.get_result_file(wait_timeout)
+            if result is None:
+                msg = "ParallelProcessing: Dozor result file failed to " +\
+                      "appear after %d seconds" % wait_timeout
+                logging.getLogger("HWR").error(msg)
+                processing_params["status"] = "Failed"
+                processing_params["comments"] += "Failed: " + msg
+                return False
+
+            chunk_index, result_file_name = result
+            logging.debug("ParallelProcessing: Reading Dozor result " +\
+                          "file: %s" % result_file_name)
+            dozor_images = XSDataFastParser.parse_dozor_file(result_file_name)
+            image_indexes = dozor_images["number"] - 1
+            chunk_results = {"image_num": image_indexes,
+                 "spots_num": dozor_images["spots_num_of"],
+                 "spots_int_aver": dozor_images["spots_int_aver"],
+                 "spots_resolution": dozor_images["spots_resolution"],
+                 "score": dozor_images["score"]}
+            aggregator.add_results(image_indexes, chunk_results)
+
+            if processing_params["images_num"] - 1 in image_indexes:
+                last_chunk_index = chunk_index
+            parsed_chunks.add(chunk_index)
+
+            self.emit("paralleProcessingResults", (aggregator.get_results(),
+                                                   processing_params,
+                                                   False))
+        return True
+
     def is_running(self):
         return not self.processing_done_event.is_set()
 
@@ -477,74 +849,10 @@ class ParallelProcessing(HardwareObject):
         Args.     : resuld_dict contains 5 one dimensional numpy arrays
         Return    : Dictionary with realigned results and best positions         
         """
-        #Each result array is realigned
-        aligned_results = {}
-        for result_array_key in results_dict.iterkeys():
-            aligned_results[result_array_key] = self.align_result_array(\
-              results_dict[result_array_key], processing_params, grid)
-        if processing_params['lines_num'] > 1:
-            grid.set_score(results_dict['score'])       
-
-        #Best positions are extracted
-        best_positions_list = []
-        index_arr = (-results_dict["score"]).argsort()[:10]
-        if len(index_arr) > 0:
-           for index in index_arr:
-               if results_dict["score"][index] > 0:
-                   best_position = {}
-                   best_position["index"] = index
-                   best_position["index_serial"] = processing_params["first_image_num"] + index
-                   best_position["score"] = float(results_dict["score"][index])
-                   best_position["spots_num"] = int(results_dict["spots_num"][index])
-                   best_position["spots_int_aver"] = float(results_dict["spots_int_aver"][index])
-                   best_position["spots_resolution"] = float(results_dict["spots_resolution"][index])
-                   best_position["filename"] = os.path.basename(processing_params["template"] % \
-                        (processing_params["run_number"], processing_params["first_image_num"] + index))
-
-                   cpos = None
-                   if processing_params["lines_num"] > 1: 
-                       col, row = grid.get_col_row_from_image_serial(\
-                            index + processing_params["first_image_num"])  
-                       cpos = grid.get_motor_pos_from_col_row(\
-                            col, row, as_cpos = True)
-                       #entred_position = processing_params["associated_grid"].get_motor_pos_from_col_row(col, row)
-                   else:
-                       col = index
-                       row = 0
-                       #cpos = processing_params["associated_data_collection"].get_motor_pos(index, as_cpos=True)
-                       cpos = None
-                       #TODO Add best position for helical line
-                   best_position["col"] = col + 1
-                   best_position["row"] = processing_params["steps_y"] - row
-                   best_position['cpos'] = cpos
-                   best_positions_list.append(best_position) 
-        aligned_results["best_positions"] = best_positions_list
-        return aligned_results
-
-    def align_result_array(self, result_array, processing_params, grid):
-        """
-        Descript. : realigns result array based on the grid
-                    Result array is numpy 2d array
-        """
-        num_lines = processing_params["lines_num"]
-        if num_lines == 1:
-            return result_array
-
-        num_images_per_line = processing_params["images_per_line"]
-        num_colls = processing_params["steps_x"]
-        num_rows = processing_params["steps_y"]
-        first_image_number = processing_params["first_image_num"]
-
-        aligned_result_array = numpy.zeros(num_lines * num_images_per_line).\
-                        reshape(num_colls, num_rows)        
-
-        for cell_index in range(aligned_result_array.size):
-            col, row = grid.get_col_row_from_image_serial(\
-                cell_index + first_image_number)
-            if (col < aligned_result_array.shape[0] and 
-                row < aligned_result_array.shape[1]):
-                aligned_result_array[col][row] = result_array[cell_index]
-        return numpy.transpose(aligned_result_array)
+        aggregator = ProcessingResultAggregator(processing_params, grid)
+        aggregator.add_results(numpy.arange(processing_params["images_num"]),
+                               results_dict)
+        return aggregator.get_results()
 
     def get_last_processing_results(self):
         return self.processing_results 
@@ -37,8 +37,8 @@ Graphics item library:
  - GraphicsView : widget that contains GraphicsScene
 """
 
-import copy
 import math
+import numpy
 import logging
 
 from PyQt4 import QtGui
@@ -51,6 +51,13 @@ SELECTED_COLOR = QtCore.Qt.green
 NORMAL_COLOR = QtCore.Qt.yellow
 SOLID_LINE_STYLE = QtCore.Qt.SolidLine
 
+GRID_LOD_OUTLINE = 0
+GRID_LOD_HEAT_MAP = 1
+GRID_LOD_CELLS = 2
+GRID_LOD_HEAT_MAP_MIN_CELL_PIX = 2
+GRID_LOD_CELLS_MIN_CELL_PIX = 20
+GRID_LOD_CELLS_MAX_IMAGE_PIX = pow(2, 24)
+
 
 class GraphicsItem(QtGui.QGraphicsItem):
     """Base class for all graphics items.
@@ -568,6 +575,9 @@ class GraphicsItemGrid(GraphicsItem):
         self.__fill_alpha = 120
         self.__display_overlay = True
         self.__osc_range = 0
+        self.__score_version = 0
+        self.__cache_image = None
+        self.__cache_key = None
        
         #self.__overlay_pixmap = None
 
@@ -792,6 +802,7 @@ class GraphicsItemGrid(GraphicsItem):
 
     def set_score(self, score):
         self.__score = score
+        self.__score_version += 1
 
     def get_snapshot(self):
         return self.__snapshot
@@ -826,71 +837,49 @@ class GraphicsItemGrid(GraphicsItem):
         else:
             draw_start_x = self.__center_coord.x() - self.__grid_size_pix[0] / 2.0
             draw_start_y = self.__center_coord.y() - self.__grid_size_pix[1] / 2.0
-
-            # Horizontal and vertical grid lines
-            for i in range(0, self.__num_cols + 1):
-                offset = i * self.__cell_size_pix[0]
-                painter.drawLine(draw_start_x + offset, draw_start_y,
-                                 draw_start_x + offset, draw_start_y + \
-                                 self.__num_rows * self.__cell_size_pix[1])
-            for i in range(0, self.__num_rows + 1):
-                offset = i * self.__cell_size_pix[1]
-                painter.drawLine(draw_start_x, draw_start_y + offset,
-                                 draw_start_x + self.__num_cols * self.__cell_size_pix[0],
-                                 draw_start_y + offset)    
-
-            #Draws beam shape and displays number of image if 
-            #less than 1000 cells and size is greater than 20px
-            cell_index = 0
-            if self.__num_cols * self.__num_rows < 1000 and \
-               self.__cell_size_pix[1] > 20:
-                for col in range(self.__num_cols):
-                    for row in range(self.__num_rows):
-                        #Estimate area where frame number or score will be displayed
-                        line, image = self.get_line_image_num(\
-                            cell_index + self.__first_image_num)
-                        pos_x, pos_y = self.get_coord_from_line_image(line, image)
-                        paint_rect = QtCore.QRect(\
-                            pos_x - self.__cell_size_pix[0] / 2, 
-                            pos_y - self.__cell_size_pix[1] / 2,
-                            self.__cell_size_pix[0], 
-                            self.__cell_size_pix[1])
-
-                        #If score exists overlay color may change
-                        cell_score = None
-                        if self.base_color:
-                            brush_color = self.base_color
-                            brush_color.setAlpha(self.__fill_alpha)
-                        else:
-                            brush_color = QtGui.QColor(70, 70, 165, self.__fill_alpha)
-                        #if self.__display_overlay and not self.__overlay_pixmap: 
-                        if self.__display_overlay:
-                            #painter.setBrush(QtGui.QColor(70, 70, 165))
-                            if self.__score is not None:
-                                cell_score = self.__score[cell_index]
-                                if self.__score.max() > 0:
-                                    cell_score = float(cell_score) / \
-                                                 self.__score.max()
-                                    brush_color.setHsv(0 + 60 * cell_score, 
-                                     255, 255 * cell_score, self.__fill_alpha)
-                            self.custom_brush.setColor(brush_color)
-                            painter.setBrush(self.custom_brush)
-                        else:
-                            painter.setBrush(QtCore.Qt.transparent)
-
-                        if self.beam_is_rectangle:
-                            painter.drawRect(pos_x - self.beam_size_pix[0] / 2,
-                                             pos_y - self.beam_size_pix[1] / 2,
-                                             self.beam_size_pix[0],
-                                             self.beam_size_pix[1])
-                        else:
-                            painter.drawEllipse(pos_x - self.beam_size_pix[0] / 2,
-                                                pos_y - self.beam_size_pix[1] / 2,
-                                                self.beam_size_pix[0],
-                                                self.beam_size_pix[1])
-                        painter.drawText(paint_rect, QtCore.Qt.AlignCenter, \
-                              str(cell_index + self.__first_image_num))
-                        cell_index += 1
+            grid_rect = QtCore.QRectF(draw_start_x, draw_start_y,
+                                      self.__grid_size_pix[0],
+                                      self.__grid_size_pix[1])
+
+            #Level of detail depends on the cell size in pixels. Cells are
+            #rasterised in a cached image, so repaint does not depend on
+            #the number of cells
+            level_of_detail = self.get_level_of_detail()
+            if level_of_detail == GRID_LOD_OUTLINE or \
+               (level_of_detail == GRID_LOD_HEAT_MAP and \
+                not self.__display_overlay):
+                painter.setBrush(QtCore.Qt.NoBrush)
+                painter.drawRect(grid_rect)
+            else:
+                cache_key = (level_of_detail,
+                             self.__num_cols,
+                             self.__num_rows,
+                             self.__num_lines,
+                             self.__num_images_per_line,
+                             self.__first_image_num,
+                             self.__reversing_rotation,
+                             tuple(self.__cell_size_pix),
+                             tuple(self.beam_size_pix),
+                             self.beam_is_rectangle,
+                             self.__fill_alpha,
+                             self.__display_overlay,
+                             self.base_color and self.base_color.rgb(),
+                             self.custom_pen.color().rgb(),
+                             self.__score_version)
+                if cache_key != self.__cache_key:
+                    if level_of_detail == GRID_LOD_HEAT_MAP:
+                        self.__cache_image = self.get_heat_map_image()
+                    else:
+                        self.__cache_image = self.get_cells_image()
+                    self.__cache_key = cache_key
+
+                if level_of_detail == GRID_LOD_HEAT_MAP:
+                    painter.drawImage(grid_rect, self.__cache_image)
+                    painter.setBrush(QtCore.Qt.NoBrush)
+                    painter.drawRect(grid_rect)
+                else:
+                    painter.drawImage(QtCore.QPointF(draw_start_x, draw_start_y),
+                                      self.__cache_image)
 
         """
         if self.__overlay_pixmap:
@@ -924,6 +913,127 @@ class GraphicsItemGrid(GraphicsItem):
                          "%d x %d" % (self.__num_lines, 
                                       self.__num_images_per_line))
  
+    def get_level_of_detail(self):
+        """
+        Descript. : returns grid level of detail based on the cell size
+                    in pixels: outline, heat map or cells with labels
+        """
+        if min(self.__cell_size_pix) < GRID_LOD_HEAT_MAP_MIN_CELL_PIX:
+            return GRID_LOD_OUTLINE
+        elif self.__cell_size_pix[1] > GRID_LOD_CELLS_MIN_CELL_PIX and \
+             self.__grid_size_pix[0] * self.__grid_size_pix[1] < \
+             GRID_LOD_CELLS_MAX_IMAGE_PIX:
+            return GRID_LOD_CELLS
+        else:
+            return GRID_LOD_HEAT_MAP
+
+    def get_cell_colors(self):
+        """
+        Descript. : returns ARGB32 color of each cell as 2d numpy array
+                    indexed by (row, col). If score exists color changes
+                    from black to yellow, otherwise base color is used
+        """
+        if self.base_color:
+            base_color = QtGui.QColor(self.base_color)
+        else:
+            base_color = QtGui.QColor(70, 70, 165)
+        base_color.setAlpha(self.__fill_alpha)
+        cell_colors = numpy.empty((self.__num_rows, self.__num_cols),
+                                  dtype=numpy.uint32)
+        cell_colors.fill(base_color.rgba())
+
+        if self.__score is not None and self.__score.max() > 0:
+            cell_num = min(self.__score.size, self.__num_cols * self.__num_rows)
+            cols, rows = self.get_col_row_from_image_serial_array(\
+                 numpy.arange(cell_num) + self.__first_image_num)
+            valid = (cols >= 0) & (cols < self.__num_cols) & \
+                    (rows >= 0) & (rows < self.__num_rows)
+            cell_score = self.__score[:cell_num][valid] / \
+                         float(self.__score.max())
+            #Same as QColor.setHsv(60 * score, 255, 255 * score)
+            red = (255 * cell_score).astype(numpy.uint32)
+            green = (255 * cell_score * cell_score).astype(numpy.uint32)
+            cell_colors[rows[valid], cols[valid]] = \
+                 (self.__fill_alpha << 24) | (red << 16) | (green << 8)
+        return cell_colors
+
+    def get_heat_map_image(self):
+        """
+        Descript. : returns QImage with one pixel per cell
+        """
+        cell_colors = self.get_cell_colors()
+        heat_map_image = QtGui.QImage(cell_colors.tostring(),
+                                      self.__num_cols,
+                                      self.__num_rows,
+                                      self.__num_cols * 4,
+                                      QtGui.QImage.Format_ARGB32)
+        #Copy detaches image from the numpy buffer
+        return heat_map_image.copy()
+
+    def get_cells_image(self):
+        """
+        Descript. : rasterises grid lines, beam shaped cells and frame
+                    numbers in a QImage of the grid size
+        """
+        width = int(math.ceil(self.__grid_size_pix[0])) + 1
+        height = int(math.ceil(self.__grid_size_pix[1])) + 1
+        cells_image = QtGui.QImage(width, height,
+                                   QtGui.QImage.Format_ARGB32_Premultiplied)
+        cells_image.fill(0)
+
+        image_painter = QtGui.QPainter(cells_image)
+        image_painter.setPen(self.custom_pen)
+
+        # Horizontal and vertical grid lines
+        for i in range(0, self.__num_cols + 1):
+            offset = i * self.__cell_size_pix[0]
+            image_painter.drawLine(QtCore.QPointF(offset, 0),
+                                   QtCore.QPointF(offset, self.__grid_size_pix[1]))
+        for i in range(0, self.__num_rows + 1):
+            offset = i * self.__cell_size_pix[1]
+            image_painter.drawLine(QtCore.QPointF(0, offset),
+                                   QtCore.QPointF(self.__grid_size_pix[0], offset))
+
+        #Draws beam shape and displays number of image
+        cell_num = self.__num_cols * self.__num_rows
+        image_serials = numpy.arange(cell_num) + self.__first_image_num
+        lines, images = self.get_line_image_num_array(image_serials)
+        pos_x, pos_y = self.get_coord_from_line_image_array(lines, images)
+        pos_x -= self.__center_coord.x() - self.__grid_size_pix[0] / 2.0
+        pos_y -= self.__center_coord.y() - self.__grid_size_pix[1] / 2.0
+        cols, rows = self.get_col_row_from_line_image_array(lines, images)
+        cell_colors = self.get_cell_colors()
+
+        for cell_index in range(cell_num):
+            if self.__display_overlay and \
+               0 <= cols[cell_index] < self.__num_cols and \
+               0 <= rows[cell_index] < self.__num_rows:
+                self.custom_brush.setColor(QtGui.QColor.fromRgba(\
+                     int(cell_colors[rows[cell_index], cols[cell_index]])))
+                image_painter.setBrush(self.custom_brush)
+            else:
+                image_painter.setBrush(QtCore.Qt.transparent)
+
+            beam_rect = QtCore.QRectF(\
+                 pos_x[cell_index] - self.beam_size_pix[0] / 2.0,
+                 pos_y[cell_index] - self.beam_size_pix[1] / 2.0,
+                 self.beam_size_pix[0],
+                 self.beam_size_pix[1])
+            if self.beam_is_rectangle:
+                image_painter.drawRect(beam_rect)
+            else:
+                image_painter.drawEllipse(beam_rect)
+
+            paint_rect = QtCore.QRectF(\
+                 pos_x[cell_index] - self.__cell_size_pix[0] / 2.0,
+                 pos_y[cell_index] - self.__cell_size_pix[1] / 2.0,
+                 self.__cell_size_pix[0],
+                 self.__cell_size_pix[1])
+            image_painter.drawText(paint_rect, QtCore.Qt.AlignCenter, \
+                 str(image_serials[cell_index]))
+        image_painter.end()
+        return cells_image
+
     def move_by_pix(self, move_direction):
         """Moves grid by one pixel
         """
@@ -1053,7 +1163,7 @@ class GraphicsItemGrid(GraphicsItem):
         """
         Descript. : x = x(click - x_middle_of_the_plot), y== the same 
         """
-        new_point = copy.deepcopy(self.__centred_position.as_dict())
+        new_point = self.__centred_position.as_dict()
         (hor_range, ver_range) = self.get_grid_size_mm()
         hor_range = - hor_range * (self.__num_cols / 2.0 - col) / self.__num_cols
         ver_range = - ver_range * (self.__num_rows / 2.0 - row) / self.__num_rows
@@ -1087,6 +1197,144 @@ class GraphicsItemGrid(GraphicsItem):
             return queue_model_objects.CentredPosition(new_point)
         else:
             return new_point
+
+    def get_line_image_num_array(self, image_numbers):
+        """
+        Descript. : array version of get_line_image_num
+        Args.     : image_numbers (sequence of serial frame numbers)
+        Return.   : lines, images (numpy int arrays)
+        """
+        image_offsets = numpy.asarray(image_numbers, dtype=int) - \
+                        self.__first_image_num
+        lines = image_offsets // self.__num_images_per_line
+        images = image_offsets - lines * self.__num_images_per_line
+        return lines, images
+
+    def get_coord_ref_from_line_image_array(self, lines, images):
+        """
+        Descript. : array version of get_coord_ref_from_line_image
+        """
+        lines = numpy.asarray(lines)
+        images = numpy.asarray(images)
+
+        fast_ref = numpy.full(images.shape, 0.5)
+        if self.__num_images_per_line > 1:
+            fast_ref = 0.5 - images / float(self.__num_images_per_line - 1)
+        if self.__reversing_rotation:
+            fast_ref = numpy.where(lines % 2, -fast_ref, fast_ref)
+
+        slow_ref = numpy.full(lines.shape, 0.5)
+        if self.__num_lines > 1:
+            slow_ref = 0.5 - lines / float(self.__num_lines - 1)
+        return fast_ref, slow_ref
+
+    def get_coord_from_line_image_array(self, lines, images):
+        """
+        Descript. : array version of get_coord_from_line_image
+        Return.   : coord_x, coord_y (numpy arrays of cell centers in pixels)
+        """
+        ref_fast, ref_slow = self.get_coord_ref_from_line_image_array(\
+             lines, images)
+
+        coord_x = self.__center_coord.x() + self.__grid_range_pix['fast'] * \
+                  self.grid_direction['fast'][0] * ref_fast  + \
+                  self.__grid_range_pix['slow'] * \
+                  self.grid_direction['slow'][0] * ref_slow
+        coord_y = self.__center_coord.y() + self.__grid_range_pix['fast'] * \
+                  self.grid_direction['fast'][1] * ref_fast  + \
+                  self.__grid_range_pix['slow'] * \
+                  self.grid_direction['slow'][1] * ref_slow
+        return coord_x, coord_y
+
+    def get_col_row_from_line_image_array(self, lines, images):
+        """
+        Descript. : array version of get_col_row_from_line_image
+        """
+        ref_fast, ref_slow = self.get_coord_ref_from_line_image_array(\
+             lines, images)
+
+        cols = self.__num_cols / 2.0 + (self.__num_images_per_line - 1) * \
+               self.grid_direction['fast'][0] * ref_fast + \
+               (self.__num_lines - 1) * \
+               self.grid_direction['slow'][0] * ref_slow
+        rows = self.__num_rows / 2.0 + (self.__num_images_per_line - 1) * \
+               self.grid_direction['fast'][1] * ref_fast + \
+               (self.__num_lines - 1) * \
+               self.grid_direction['slow'][1] * ref_slow
+        return cols.astype(int), rows.astype(int)
+
+    def get_col_row_from_image_serial_array(self, image_serials):
+        """
+        Descript. : array version of get_col_row_from_image_serial
+        Args.     : image_serials (sequence of serial frame numbers)
+        Return.   : cols, rows (numpy int arrays)
+        """
+        lines, images = self.get_line_image_num_array(image_serials)
+        return self.get_col_row_from_line_image_array(lines, images)
+
+    def get_image_from_col_row_array(self, cols, rows):
+        """
+        Descript. : array version of get_image_from_col_row
+        Return.   : images, lines, image_serials (numpy int arrays)
+        """
+        cols = numpy.asarray(cols, dtype=float)
+        rows = numpy.asarray(rows, dtype=float)
+
+        images = (self.__num_images_per_line / 2.0 + \
+                  self.grid_direction['fast'][0] * (self.__num_cols / 2.0 - cols) - \
+                  self.grid_direction['fast'][1] * (self.__num_rows / 2.0 - rows)).\
+                  astype(int)
+        lines = (self.__num_lines / 2.0 + \
+                 self.grid_direction['slow'][0] * (self.__num_cols / 2.0 - cols) - \
+                 self.grid_direction['slow'][1] * (self.__num_rows / 2.0 - rows)).\
+                 astype(int)
+
+        image_serials = self.__first_image_num + \
+                        self.__num_images_per_line * lines + images
+        if self.__reversing_rotation:
+            image_serials = numpy.where(lines % 2, self.__first_image_num + \
+                 self.__num_images_per_line * (lines + 1) - 1 - images,
+                 image_serials)
+        return images, lines, image_serials
+
+    def get_motor_pos_from_col_row_array(self, cols, rows):
+        """
+        Descript. : array version of get_motor_pos_from_col_row
+        Args.     : cols, rows (sequences, can be floats)
+        Return.   : dict of motor name: numpy array of positions
+        """
+        cols = numpy.asarray(cols, dtype=float)
+        rows = numpy.asarray(rows, dtype=float)
+
+        motor_pos_table = {}
+        for motor_name, position in self.__centred_position.as_dict().\
+             iteritems():
+            motor_pos_table[motor_name] = numpy.full(cols.shape, position,
+                                                     dtype=float)
+
+        (hor_range, ver_range) = self.get_grid_size_mm()
+        hor_range = - hor_range * (self.__num_cols / 2.0 - cols) / self.__num_cols
+        ver_range = - ver_range * (self.__num_rows / 2.0 - rows) / self.__num_rows
+        omega_rad = math.pi * (self.__osc_start - \
+                    self.grid_direction['omega_ref']) / 180.0
+
+        if self.grid_direction['fast'][0] == 1:
+            #MD2 when fast direction is horizontal direction 
+            motor_pos_table['sampx'] += ver_range * math.sin(omega_rad)
+            motor_pos_table['sampy'] -= ver_range * math.cos(omega_rad)
+            motor_pos_table['phiy'] -= hor_range
+            motor_pos_table['phi'] = motor_pos_table['phiy'] - \
+                 self.__osc_range * self.__num_cols / 2 + \
+                 (self.__num_cols - cols) * self.__osc_range
+        else:
+            #MD3
+            motor_pos_table['sampx'] -= hor_range * math.sin(omega_rad)
+            motor_pos_table['sampy'] += hor_range * math.cos(omega_rad)
+            motor_pos_table['phiy'] += ver_range
+            motor_pos_table['phi'] = motor_pos_table['phiy'] - \
+                 self.__osc_range * self.__num_rows / 2 + \
+                 (self.__num_rows - rows) * self.__osc_range
+        return motor_pos_table
  
 class GraphicsItemScale(GraphicsItem):
     """
@@ -54,6 +54,8 @@ class QueueManager(HardwareObject, QueueEntryContainer):
         self._running = False
         self._disable_collect = False
         self._is_stopped = False
+        # Maps data model to its queue entry
+        self._entry_index = {}
 
     def __getstate__(self):
         d = dict(self.__dict__)
@@ -77,6 +79,7 @@ class QueueManager(HardwareObject, QueueEntryContainer):
         :rtype: NoneType
         """
         QueueEntryContainer.enqueue(self, queue_entry)
+        self.add_entry_index(queue_entry)
 
     def execute(self):
         """
@@ -341,10 +344,14 @@ class QueueManager(HardwareObject, QueueEntryContainer):
         :rtype: QueueEntry
         """
         if not root_queue_entry:
+            entry = self._entry_index.get(model)
+            if entry is not None and self._is_entry_queued(entry, model):
+                return entry
             root_queue_entry = self
 
         for queue_entry in root_queue_entry._queue_entry_list:
             if queue_entry.get_data_model() is model:
+                self._entry_index[model] = queue_entry
                 return queue_entry
             else:
                 result = self.get_entry_with_model(model, queue_entry)
@@ -352,6 +359,50 @@ class QueueManager(HardwareObject, QueueEntryContainer):
                 if result:
                     return result
 
+    def _is_entry_queued(self, entry, model):
+        """
+        Returns True if the indexed entry <entry> still has the model
+        <model> and is still part of this queue.
+        """
+        if entry.get_data_model() is not model:
+            return False
+
+        container = entry.get_container()
+        while container is not None and container is not self:
+            container = container.get_container()
+
+        return container is self
+
+    def add_entry_index(self, entry):
+        """
+        Adds the entry <entry> and its child entries to the model
+        to entry index.
+
+        :param entry: The entry to index.
+        :type entry: QueueEntry
+        """
+        entries = [entry]
+        while entries:
+            current = entries.pop()
+            model = current.get_data_model()
+            if model is not None:
+                self._entry_index[model] = current
+            entries.extend(current._queue_entry_list)
+
+    def remove_entry_index(self, model):
+        """
+        Removes the model <model> and its child models from the model
+        to entry index.
+
+        :param model: The data model of the entry.
+        :type model: TaskNode
+        """
+        models = [model]
+        while models:
+            current = models.pop()
+            self._entry_index.pop(current, None)
+            models.extend(current.get_children())
+
     def execute_entry(self, entry):
         """
         Executes the queue entry <entry>.
@@ -372,6 +423,7 @@ class QueueManager(HardwareObject, QueueEntryContainer):
         :rtype: NoneType
         """
         self._queue_entry_list = []
+        self._entry_index = {}
 
     def show_workflow_tab(self):
         self.emit('show_workflow_tab')
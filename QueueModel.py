@@ -90,6 +90,7 @@ class QueueModel(HardwareObject):
         :returns: None
         :rtype: NoneType
         """
+        # The new root node comes with an empty node index
         self._models[name] = queue_model_objects.RootNode()
         self.queue_hwobj.clear()
 
@@ -119,6 +120,52 @@ class QueueModel(HardwareObject):
             self.emit('child_added', (parent_node, child_node))
             self._re_emit(child_node)
 
+    def _get_root(self, node):
+        """
+        Returns the root node of the tree <node> belongs to.
+        """
+        while node._parent is not None:
+            node = node._parent
+        return node
+
+    def _index_node(self, node):
+        """
+        Adds <node> and its descendants to the node and path template
+        indexes of the model it belongs to.
+        """
+        root = self._get_root(node)
+        if not isinstance(root, queue_model_objects.RootNode):
+            return
+
+        nodes = [node]
+        while nodes:
+            current = nodes.pop()
+            if current._node_id is not None:
+                root._node_index[current._node_id] = current
+            path_template = current.get_path_template()
+            if path_template:
+                root._path_template_index.add(path_template)
+            nodes.extend(current._children)
+
+    def _unindex_node(self, node):
+        """
+        Removes <node> and its descendants from the node and path
+        template indexes of the model it belongs to.
+        """
+        root = self._get_root(node)
+        if not isinstance(root, queue_model_objects.RootNode):
+            return
+
+        nodes = [node]
+        while nodes:
+            current = nodes.pop()
+            if root._node_index.get(current._node_id) is current:
+                del root._node_index[current._node_id]
+            path_template = current.get_path_template()
+            if path_template:
+                root._path_template_index.remove(path_template)
+            nodes.extend(current._children)
+
     def add_child(self, parent, child):
         """
         Adds the child node <child>. Raises the exception TypeError 
@@ -138,6 +185,7 @@ class QueueModel(HardwareObject):
             child._node_id = self._selected_model._total_node_count
             parent._children.append(child)
             child._set_name(child._name)
+            self._index_node(child)
             self.emit('child_added', (parent, child))
         else:
             raise TypeError("Expected type TaskNode, got %s "\
@@ -168,14 +216,15 @@ class QueueModel(HardwareObject):
         :param _id: The id of the node to retrieve.
         :type _id: int
 
-        :param parent: parent node to search in.
+        :param parent: parent node to search in, if not given the
+                       node index of the selected model is used.
         :type parent: TaskNode
 
         :returns: The node with the id <_id>
         :rtype: TaskNode
         """
         if parent is None:
-            parent = self._selected_model 
+            return self._selected_model._node_index.get(_id)
 
         for node in parent._children:
             if node._node_id == _id:
@@ -197,7 +246,9 @@ class QueueModel(HardwareObject):
         :rtype: None
         """
         if child in parent._children:
+            self._unindex_node(child)
             parent._children.remove(child)
+            self.queue_hwobj.remove_entry_index(child)
             self.emit('child_removed', (parent, child))
 
     def _detach_child(self, parent, child):
@@ -210,7 +261,8 @@ class QueueModel(HardwareObject):
         :returns: None
         :rtype: None
         """
-        child = parent._children.pop(child)
+        self._unindex_node(child)
+        parent._children.remove(child)
         return child
 
     def set_parent(self, parent, child):
@@ -224,10 +276,11 @@ class QueueModel(HardwareObject):
         :type child: TaskNode Object
         """
         if child._parent:
-            self._detach_child(parent, child)
-            child.set_parent(parent)
-        else:
-            child._parent = parent
+            self._detach_child(child._parent, child)
+            parent._children.append(child)
+
+        child._parent = parent
+        self._index_node(child)
 
     def view_created(self, view_item, task_model):
         """
@@ -262,11 +315,13 @@ class QueueModel(HardwareObject):
         #else:
             view_item.parent().get_queue_entry().enqueue(qe)
 
+        self.queue_hwobj.add_entry_index(qe)
+
     def get_next_run_number(self, new_path_template, exclude_current = True):
         """
-        Iterates through all the path templates of the tasks
-        in the model and returns the next available run number
-        for the path template <new_path_template>.
+        Looks up the path templates of the tasks in the model that have
+        the same directory and prefix and returns the next available run
+        number for the path template <new_path_template>.
 
         :param new_path_template: PathTempalte to match with.
         :type new_path_template: PathTemplate
@@ -277,19 +332,9 @@ class QueueModel(HardwareObject):
         :returns: The next available run number for the given path_template.
         :rtype: int
         """
-        all_path_templates = self.get_path_templates()
-        conflicting_path_templates = [0]
-
-        for pt in all_path_templates:
-            if exclude_current:
-                if pt[1] is not new_path_template:
-                    if pt[1] == new_path_template:
-                        conflicting_path_templates.append(pt[1].run_number)
-            else:
-                if pt[1] == new_path_template:
-                    conflicting_path_templates.append(pt[1].run_number)
-
-        return max(conflicting_path_templates) + 1
+        index = self.get_model_root()._path_template_index
+        return index.get_max_run_number(new_path_template,
+                                        exclude_current) + 1
 
     def get_path_templates(self):
         """
@@ -323,15 +368,8 @@ class QueueModel(HardwareObject):
 
         :returns: True if there is a potential path collision.
         """
-        result = False
-        path_template_list = self.get_path_templates()
-        
-        for pt in path_template_list:
-            if pt[1] is not new_path_template:
-                if new_path_template.intersection(pt[1]):
-                    result = True
-
-        return result
+        index = self.get_model_root()._path_template_index
+        return index.has_collision(new_path_template)
 
     def copy_node(self, node):
         """
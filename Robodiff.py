@@ -82,7 +82,9 @@ class Robodiff(MiniDiff.MiniDiff):
                                                                    self.getBeamPosX(), self.getBeamPosY(),
                                                                    chi_angle=-self.chiMotor.getPosition(),
                                                                    msg_cb=self.emitProgressMessage,
-                                                                   new_point_cb=lambda point: self.emit("newAutomaticCentringPoint", point))
+                                                                   new_point_cb=lambda point: self.emit("newAutomaticCentringPoint", point),
+                                                                   continuous_sweep=self.centring_continuous_sweep,
+                                                                   phi_range=self.centring_phi_range)
 
         self.currentCentringProcedure.link(self.autoCentringDone)
 
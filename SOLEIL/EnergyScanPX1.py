@@ -14,9 +14,8 @@ import os
 import time
 import types
 import math
-from xabs_lib import *
+import ElementDatabase
 #from simple_scan_class import *
-import string
 #MS 05.03.2013
 from PyTango import DeviceProxy
 import numpy
@@ -516,12 +515,7 @@ class EnergyScanPX1(Equipment):
         self.scanThread.start()
 
     def getEdgefromXabs(self, el, edge):
-        edge = string.upper(edge)
-        roi_center = McMaster[el]['edgeEnergies'][edge + '-alpha']
-        if edge == 'L':
-            edge = 'L3'
-        e_edge = McMaster[el]['edgeEnergies'][edge]
-        return (e_edge, roi_center)    
+        return ElementDatabase.get_database().get_edge(el, edge)
         
     def newPoint(self, x, y):
         logging.getLogger("HWR").debug('EnergyScan:newPoint')
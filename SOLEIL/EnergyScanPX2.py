@@ -10,8 +10,7 @@ import os
 import time
 import types
 import math
-from xabs_lib import *
-import string
+import ElementDatabase
 from PyTango import DeviceProxy
 import numpy
 import pickle
@@ -694,12 +693,7 @@ class EnergyScanPX2(Equipment):
         self.scanThread.start()
 
     def getEdgefromXabs(self, el, edge):
-        edge = string.upper(edge)
-        roi_center = McMaster[el]['edgeEnergies'][edge + '-alpha']
-        if edge == 'L':
-            edge = 'L3'
-        e_edge = McMaster[el]['edgeEnergies'][edge]
-        return (e_edge, roi_center)    
+        return ElementDatabase.get_database().get_edge(el, edge)
         
     def newPoint(self, x, y):
         logging.getLogger("HWR").debug('EnergyScan:newPoint')
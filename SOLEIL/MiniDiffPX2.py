@@ -169,6 +169,10 @@ class MiniDiffPX2(Equipment):
                 self.aperture = HardwareRepository.HardwareRepository().getHardwareObject(aperture_prop)
             except:
                 pass
+
+        # automatic centring: continuous phi sweep instead of n_points stops
+        self.centring_continuous_sweep = bool(self.getProperty("centring_continuous_sweep"))
+        self.centring_phi_range = self.getProperty("centring_phi_range") or 180
             
         if self.phiMotor is not None:
             self.connect(self.phiMotor, 'stateChanged', self.phiMotorStateChanged)
@@ -649,7 +653,9 @@ class MiniDiffPX2(Equipment):
                                                                    self.pixelsPerMmY, self.pixelsPerMmZ, 
                                                                    self.getBeamPosX(), self.getBeamPosY(), 
                                                                    msg_cb=self.emitProgressMessage,
-                                                                   new_point_cb=lambda point: self.emit("newAutomaticCentringPoint", point))
+                                                                   new_point_cb=lambda point: self.emit("newAutomaticCentringPoint", point),
+                                                                   continuous_sweep=self.centring_continuous_sweep,
+                                                                   phi_range=self.centring_phi_range)
        
         self.currentCentringProcedure.link(self.autoCentringDone)
 
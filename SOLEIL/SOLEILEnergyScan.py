@@ -3,8 +3,7 @@ from HardwareRepository.BaseHardwareObjects import Equipment
 from HardwareRepository.TaskUtils import *
 import logging
 import PyChooch
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_agg import FigureCanvasAgg
+import ChoochArchive
 import os
 import time
 import types
@@ -420,21 +419,6 @@ class SOLEILEnergyScan(Equipment):
                logging.getLogger("user_level_log").error( "Chooch. Archive path does not seem to be a valid directory (%s)" % dirname)
                return None
 
-        try:
-          fi=open(scanFile)
-          fo=open(archiveEfsFile, "w")
-        except:
-          import traceback
-          logging.getLogger("user_level_log").error( traceback.format_exc())
-          self.storeEnergyScan()
-          self.emit("energyScanFailed", ())
-          return None
-        else:
-          fo.write(fi.read())
-          fi.close()
-          fo.close()
-
-        logging.info('archive saved')
         self.scanInfo["peakEnergy"]=pk
         self.scanInfo["inflectionEnergy"]=ip
         self.scanInfo["remoteEnergy"]=rm
@@ -452,45 +436,26 @@ class SOLEILEnergyScan(Equipment):
         for i in range(len(chooch_graph_x)):
           chooch_graph_x[i]=chooch_graph_x[i]/1000.0
 
-        logging.getLogger("HWR").info("<chooch> Saving png" )
-        # prepare to save png files
         title="%10s  %6s  %6s\n%10s  %6.2f  %6.2f\n%10s  %6.2f  %6.2f" % ("energy", "f'", "f''", pk, fpPeak, fppPeak, ip, fpInfl, fppInfl) 
-        fig=Figure(figsize=(15, 11))
-        ax=fig.add_subplot(211)
-        ax.set_title("%s\n%s" % (scanFile, title))
-        ax.grid(True)
-        ax.plot(*(zip(*scanData)), **{"color":'black'})
-        ax.set_xlabel("Energy")
-        ax.set_ylabel("MCA counts")
-        ax2=fig.add_subplot(212)
-        ax2.grid(True)
-        ax2.set_xlabel("Energy")
-        ax2.set_ylabel("")
-        handles = []
-        handles.append(ax2.plot(chooch_graph_x, chooch_graph_y1, color='blue'))
-        handles.append(ax2.plot(chooch_graph_x, chooch_graph_y2, color='red'))
-        canvas=FigureCanvasAgg(fig)
 
         escan_png = os.path.extsep.join((scanFilePrefix, "png"))
         escan_archivepng = os.path.extsep.join((scanArchiveFilePrefix, "png")) 
         self.scanInfo["jpegChoochFileFullPath"]=str(escan_archivepng)
-        try:
-          logging.getLogger("HWR").info("Rendering energy scan and Chooch graphs to PNG file : %s", escan_png)
-          canvas.print_figure(escan_png, dpi=80)
-        except:
-          logging.getLogger("HWR").exception("could not print figure")
-        try:
-          logging.getLogger("HWR").info("Saving energy scan to archive directory for ISPyB : %s", escan_archivepng)
-          canvas.print_figure(escan_archivepng, dpi=80)
-        except:
-          logging.getLogger("HWR").exception("could not save figure")
-
-        self.storeEnergyScan()
-        self.scanInfo=None
 
         logging.getLogger("HWR").info("<chooch> returning" )
         self.emit('chooch_finished', (pk, fppPeak, fpPeak, ip, fppInfl, fpInfl, rm, chooch_graph_x, chooch_graph_y1, chooch_graph_y2, title))
         self.choochResults = pk, fppPeak, fpPeak, ip, fppInfl, fpInfl, rm, chooch_graph_x, chooch_graph_y1, chooch_graph_y2, title
+
+        # efs and png files are written by the archive workers, the raw
+        # file has already been saved by the xanes scan
+        archive_job = ChoochArchive.ArchiveJob(scanData, chooch_graph_x, chooch_graph_y1, chooch_graph_y2, title, scanFile)
+        archive_job.efs_copies = [archiveEfsFile]
+        archive_job.png_filenames = [escan_png, escan_archivepng]
+        self.archive_task = archive_job.submit()
+
+        self.storeEnergyScan()
+        self.scanInfo=None
+
         return pk, fppPeak, fpPeak, ip, fppInfl, fpInfl, rm, chooch_graph_x, chooch_graph_y1, chooch_graph_y2, title
 
     def scanStatusChanged(self,status):
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Columnar store for energy scan and fluorescence spectrum data.
+
+Every scan point is a row: the energy, one value per named column (roi
+counts, count rates, monitors ...) and optionally the full MCA spectrum.
+Columns are preallocated numpy arrays and spectra are rows of one 2-D
+array, so that normalisation and ROI sums are computed on whole columns.
+Points can be flushed in chunks to an HDF5 file (appending to resizable
+datasets) or saved at the end as numpy arrays (.npz). These files come in
+addition to the ones the scans already write (.raw, .pck ...), which keep
+their formats for existing readers.
+"""
+
+import logging
+import numpy
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+class ScanDataStore(object):
+    def __init__(self, num_points, columns=(), chunk_size=32):
+        self.columns = ['energy'] + [name for name in columns
+                                     if name != 'energy']
+        self.chunk_size = chunk_size
+        self.size = 0
+        self.attributes = {}
+        # calibrated energy of each spectrum channel, if known
+        self.channel_energies = None
+
+        self.__data = {}
+        for name in self.columns:
+            self.__data[name] = numpy.zeros(max(num_points, 1))
+        self.__spectra = None
+        self.__h5_file = None
+        self.__flushed = 0
+
+    def __len__(self):
+        return self.size
+
+    def __grow(self):
+        capacity = 2 * self.__data['energy'].size
+        for name in self.columns:
+            self.__data[name] = numpy.resize(self.__data[name], capacity)
+        if self.__spectra is not None:
+            spectra = numpy.zeros((capacity, self.__spectra.shape[1]),
+                                  self.__spectra.dtype)
+            spectra[:self.size] = self.__spectra[:self.size]
+            self.__spectra = spectra
+
+    def add_column(self, name):
+        if name not in self.columns:
+            self.columns.append(name)
+            self.__data[name] = numpy.zeros(self.__data['energy'].size)
+
+    def add_point(self, energy, spectrum=None, **values):
+        """
+        Descript. : appends a point. Values of unknown columns are
+                    stored in new columns
+        Return    : index of the point
+        """
+        if self.size == self.__data['energy'].size:
+            self.__grow()
+
+        index = self.size
+        self.__data['energy'][index] = energy
+        for name, value in values.items():
+            self.add_column(name)
+            self.__data[name][index] = value
+
+        if spectrum is not None:
+            spectrum = numpy.asarray(spectrum)
+            if self.__spectra is None:
+                self.__spectra = numpy.zeros((self.__data['energy'].size,
+                                              spectrum.size), spectrum.dtype)
+            self.__spectra[index] = spectrum
+
+        self.size += 1
+        if self.__h5_file is not None and \
+           self.size - self.__flushed >= self.chunk_size:
+            self.flush()
+        return index
+
+    def set_column(self, name, values):
+        self.add_column(name)
+        self.__data[name][:self.size] = values
+
+    def get_column(self, name):
+        """
+        Return    : view on the filled part of the column name. The view
+                    is not updated when the store grows, copy it to keep it
+        """
+        return self.__data[name][:self.size]
+
+    def get_point(self, index):
+        return dict((name, self.__data[name][index]) for name in self.columns)
+
+    def get_spectra(self):
+        if self.__spectra is None:
+            return None
+        return self.__spectra[:self.size]
+
+    def get_spectrum(self, index):
+        if self.__spectra is not None:
+            return self.__spectra[index]
+
+    def roi_sum(self, first_channel, last_channel):
+        """
+        Descript. : sums the spectrum channels [first_channel, last_channel[
+                    of every point
+        """
+        spectra = self.get_spectra()
+        if spectra is None:
+            return numpy.zeros(self.size)
+        return spectra[:, first_channel:last_channel].sum(axis=1)
+
+    def normalise(self, name, monitor_name):
+        """
+        Descript. : returns column name divided by column monitor_name,
+                    points with no monitor counts are set to 0
+        """
+        values = self.get_column(name).astype(float)
+        monitor = self.get_column(monitor_name)
+        result = numpy.zeros(self.size)
+        numpy.divide(values, monitor, out=result, where=monitor != 0)
+        return result
+
+    def open_file(self, filename):
+        """
+        Descript. : appends the points to the HDF5 file filename in chunks
+                    of chunk_size points while the scan is running.
+        Return    : True if the file was opened, False if h5py is missing
+        """
+        if h5py is None:
+            return False
+
+        self.__h5_file = h5py.File(filename, 'w')
+        self.__flushed = 0
+        return True
+
+    def __h5_append(self, name, data):
+        # a column added after the first flush is written from its start
+        if name not in self.__h5_file:
+            self.__h5_file.create_dataset(name, data=data[:self.size],
+                maxshape=(None, ) + data.shape[1:],
+                chunks=(self.chunk_size, ) + data.shape[1:])
+        else:
+            dataset = self.__h5_file[name]
+            dataset.resize(self.size, axis=0)
+            dataset[self.__flushed:self.size] = data[self.__flushed:self.size]
+
+    def flush(self):
+        """
+        Descript. : writes the points added since the last flush
+        """
+        if self.__h5_file is None:
+            return
+
+        for name in self.columns:
+            self.__h5_append(name, self.__data[name])
+        if self.__spectra is not None:
+            self.__h5_append('spectra', self.__spectra)
+        self.__flushed = self.size
+        self.__h5_file.flush()
+
+    def close(self):
+        if self.__h5_file is not None:
+            self.flush()
+            if self.channel_energies is not None:
+                self.__h5_file.create_dataset('channel_energies',
+                                              data=self.channel_energies)
+            for key, value in self.attributes.items():
+                try:
+                    self.__h5_file.attrs[key] = value
+                except:
+                    logging.getLogger("HWR").warning(\
+                        "ScanDataStore: could not store attribute %s" % key)
+            self.__h5_file.close()
+            self.__h5_file = None
+
+    def save(self, filename):
+        """
+        Descript. : saves the columns, spectra and attributes as numpy
+                    arrays in the file filename (.npz)
+        """
+        arrays = dict(self.attributes)
+        arrays.update((name, self.get_column(name)) for name in self.columns)
+        if self.__spectra is not None:
+            arrays['spectra'] = self.get_spectra()
+        if self.channel_energies is not None:
+            arrays['channel_energies'] = self.channel_energies
+        numpy.savez(filename, **arrays)
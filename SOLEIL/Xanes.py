@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from xabs_lib import McMaster
+import ElementDatabase
 import time
 import threading
 import logging
@@ -11,9 +11,12 @@ import commands
 import pickle
 import math
 import os
+from ScanDataStore import ScanDataStore
 
 class xanes(object):
     cutoff = 4
+    columns = ('point', 'roiCounts', 'inputCountRate00', 'outputCountRate00',
+               'eventsInRun', 'diode1', 'diode3', 'diode5', 'cvd')
     
     def __init__(self, parent,
                  element,
@@ -296,13 +299,7 @@ class xanes(object):
         self.wait(Attenuator)
 
     def getEdgefromXabs(self, element, edge):
-        edge = edge.upper()
-        roi_center = McMaster[element]['edgeEnergies'][edge + '-alpha']
-        if edge == 'L':
-            edge = 'L3'
-        e_edge = McMaster[element]['edgeEnergies'][edge]
-
-        return e_edge, roi_center
+        return ElementDatabase.get_database().get_edge(element, edge)
 
     def _pointsToStrings(self, points):
         return [str(e) for e in points] 
@@ -459,13 +456,13 @@ class xanes(object):
         self.results['bles_strings'] = self.bles_strings
         self.results['BleVsEn'] = self.BleVsEn
         self.results['BleVsEnStrings'] = self.BleVsEnStrings
-        self.results['observations'] = {}
         self.results['roiwidth'] = self.roiwidth
         self.results['roi_center'] = self.roi_center
         #self.results['roi_debut'] = self.roi_debut
         #self.results['roi_fin'] = self.roi_fin
+        self.data = ScanDataStore(len(self.ens_strings), self.columns)
+        self.h5_file_opened = self.save and self.data.open_file(os.path.join(self.directory, '{prefix}_{element}_{edge}.h5'.format(**self.results)))
         self.runningScan = {'ens': [], 'points': []}
-        self.results['raw'] = self.runningScan
         
         if self.test is True:
             print 'self.testData.keys()', self.testData.keys()
@@ -483,6 +480,7 @@ class xanes(object):
             
         #self.closeSafetyShutter()
         self.results['duration'] = time.time() - self.results['timestamp']
+        self.data.attributes['duration'] = self.results['duration']
         self.cleanUp()
         if self.plot:
             plt.ioff()
@@ -502,32 +500,32 @@ class xanes(object):
         logging.info('takePoint %s' % en)
         # readout
         if self.test:
-            self.results['observations'][en] = {'point': self.testData[en]}
-            self.parent.newPoint(float(en), float(self.results['observations'][en]['point']))
+            self.data.add_point(float(en), point=self.testData[en])
+            self.parent.newPoint(float(en), float(self.testData[en]))
             return
         # measurement
-        self.results['observations'][en] = {'roiCounts': self.fluodet.roi00_01,
-                                            'inputCountRate00': self.fluodet.inputCountRate00,
-                                            'outputCountRate00': self.fluodet.outputCountRate00,
-                                            'eventsInRun': self.fluodet.eventsInRun00,
-                                            'spectrum': self.fluodet.channel00,
-                                            'diode1': self.diode1.intensity,
-                                            'diode3': self.diode3.intensity,
-                                            'diode5': self.diode5.intensity,
-                                            'cvd': self.cvd.intensity}
-        uptoendroi = self.results['observations'][en]['spectrum'][50: self.channel_fin]
-        uptostartroi = self.results['observations'][en]['spectrum'][50: self.channel_debut]
-        self.results['observations'][en]['uptoendroi'] = sum(uptoendroi)
-        self.results['observations'][en]['uptostartroi'] = sum(uptostartroi)
-        #logging.info('self.results[\'observations\'][en] %s' % self.results['observations'][en])
-        self.results['observations'][en]['point'] = float(self.results['observations'][en]['roiCounts']) / self.results['observations'][en]['cvd']
-        #self.results['observations'][en]['point'] = float(self.results['observations'][en]['roiCounts']) / self.results['observations'][en]['eventsInRun']
-        #self.results['observations'][en]['point'] = float(self.results['observations'][en]['roiCounts']) / self.results['observations'][en]['uptostartroi']
-        self.parent.newPoint(float(en), float(self.results['observations'][en]['point']))
+        roiCounts = self.fluodet.roi00_01
+        cvd = self.cvd.intensity
+        point = float(roiCounts) / cvd
+        #point = float(roiCounts) / eventsInRun
+        #point = float(roiCounts) / uptostartroi
+        self.data.add_point(float(en),
+                            spectrum=self.fluodet.channel00,
+                            point=point,
+                            roiCounts=roiCounts,
+                            inputCountRate00=self.fluodet.inputCountRate00,
+                            outputCountRate00=self.fluodet.outputCountRate00,
+                            eventsInRun=self.fluodet.eventsInRun00,
+                            diode1=self.diode1.intensity,
+                            diode3=self.diode3.intensity,
+                            diode5=self.diode5.intensity,
+                            cvd=cvd)
+        self.parent.newPoint(float(en), point)
             
     def updateRunningScan(self, en):
-        self.runningScan['ens'].append(float(en))
-        self.runningScan['points'].append(self.results['observations'][en]['point'])
+        # copies, views on the data store go stale when it grows
+        self.runningScan['ens'] = self.data.get_column('energy').copy()
+        self.runningScan['points'] = self.data.get_column('point').copy()
         
 
     def setMiddleTransmission(self):
@@ -546,15 +544,14 @@ class xanes(object):
             '# Counts on the fluorescence detector: all channels\n')
         f.write(
             '# Counts on the fluorescence detector: channels up to end of ROI\n')
-        for en in self.results['ens_strings']:
-            normalized_intensity=self.results['observations'][en][
-                'roiCounts'] / self.results['observations'][en]['cvd']
+        normalized_intensity = self.data.normalise('roiCounts', 'cvd')
+        for k in range(len(self.data)):
             f.write(
-                ' {en} {normalized_intensity} {roiCounts} {diode1} {eventsInRun}\n'.format(**{'en': en,
-                                                                                              'normalized_intensity': normalized_intensity,
-                                                                                              'roiCounts': self.results['observations'][en]['roiCounts'],
-                                                                                              'diode1': self.results['observations'][en]['cvd'],
-                                                                                              'eventsInRun': self.results['observations'][en]['eventsInRun']}))
+                ' {en} {normalized_intensity} {roiCounts} {diode1} {eventsInRun}\n'.format(**{'en': self.ens_strings[k],
+                                                                                              'normalized_intensity': normalized_intensity[k],
+                                                                                              'roiCounts': self.data.get_column('roiCounts')[k],
+                                                                                              'diode1': self.data.get_column('cvd')[k],
+                                                                                              'eventsInRun': self.data.get_column('eventsInRun')[k]}))
         f.write('# Duration: {duration}\n'.format(**self.results))
         f.close()
 
@@ -565,23 +562,44 @@ class xanes(object):
         f = open(os.path.join(self.directory, '{prefix}_{element}_{edge}.raw'.format(**self.results)), 'w')
         f.write('Proxima 2A, Escan, {date}\n'.format(**{'date': time.ctime(self.results['timestamp'])}))
         f.write('{nbPoints}\n'.format(**{'nbPoints': len(self.results['points'])}))
-        self.raw = []
-        for en in self.ens_strings:
-            en_float = float(en)
-            x = en_float < 1e3 and en_float*1e3 or en_float
-            point = self.results['observations'][en]['point']
-            f.write('{en} {point}\n'.format(**{'en': x, 'point': point}))
-            self.raw.append((x, point))
+        ens = self.data.get_column('energy')
+        ens = numpy.where(ens < 1e3, ens * 1e3, ens)
+        self.raw = zip(ens, self.data.get_column('point'))
+        f.write(''.join(['{en} {point}\n'.format(**{'en': x, 'point': point}) for x, point in self.raw]))
         f.close()
         time.sleep(3)
 
     def saveResults(self):
         logging.info('saveResults')
+        if not self.test and hasattr(self, 'channel_fin'):
+            self.data.set_column('uptoendroi', self.data.roi_sum(50, self.channel_fin))
+            self.data.set_column('uptostartroi', self.data.roi_sum(50, self.channel_debut))
+        self.data.close()
+        if not self.h5_file_opened:
+            self.data.save(os.path.join(self.directory, '{prefix}_{element}_{edge}_results.npz'.format(**self.results)))
+        # the pickle keeps its per energy layout for existing readers
+        self.results['observations'] = self.getObservations()
+        self.results['raw'] = {'ens': [float(en) for en in self.runningScan['ens']],
+                               'points': [float(point) for point in self.runningScan['points']]}
         f = open(os.path.join(self.directory, '{prefix}_{element}_{edge}_results.pck'.format(**self.results)), 'w')
         #f = open('{prefix}_{element}_{edge}.pck'.format(**self.results), 'w')
         pickle.dump(self.results, f)
         f.close()
 
+    def getObservations(self):
+        observations = {}
+        if self.test:
+            names = ['point']
+        else:
+            names = [name for name in self.data.columns if name != 'energy']
+        for k in range(len(self.data)):
+            point = self.data.get_point(k)
+            observation = dict((name, float(point[name])) for name in names)
+            if not self.test:
+                observation['spectrum'] = self.data.get_spectrum(k).copy()
+            observations[self.ens_strings[k]] = observation
+        return observations
+
     def parse_chooch_output(self, output):
         logging.info('parse_chooch_output')
         table = output[output.find('Table of results'):]
@@ -637,15 +655,7 @@ class xanes(object):
         plt.draw()
         
     def getRunningScan(self):
-        ens = []
-        points = []
-        for en in self.results['ens']:
-            en = round(en, self.cutoff)
-            if self.results.has_key(en):
-                ens.append(en)
-                normalized_intensity = self.results['observations'][en]['roiCounts'] / self.results['observations'][en]['diode1']
-                points.append(normalized_intensity)
-        return ens, points
+        return self.data.get_column('energy').copy(), self.data.normalise('roiCounts', 'diode1')
     
     def getTestData(self):
         logging.info('getTestData')
@@ -10,7 +10,8 @@ import numpy
 import os
 import pickle
 import math
-from xabs_lib import *
+import ElementDatabase
+from ScanDataStore import ScanDataStore
 
 class XfeCollect(object):
     def __init__(self, integrationTime = .64, directory = '/tmp', prefix = 'test', sessionId = None, sampleId = None, test=False, optimize=False):
@@ -90,12 +91,7 @@ class XfeCollect(object):
         self.wait(self.ble)
             
     def getEdgefromXabs(self, el, edge):
-        edge = edge.upper()
-        roi_center = McMaster[el]['edgeEnergies'][edge + '-alpha']
-        if edge == 'L':
-            edge = 'L3'
-        e_edge = McMaster[el]['edgeEnergies'][edge]
-        return (e_edge, roi_center)    
+        return ElementDatabase.get_database().get_edge(el, edge)
         
     def optimizeTransmission(self, element, edge):
         if self.test == True: return 0
@@ -260,11 +256,18 @@ class XfeCollect(object):
         return self.getXvals(), self.getSpectrum()
 
     def saveData(self):
-        f = open(self.filename[:-4]  + '.pck', 'w')
         x = self.getXvals()
         y = self.getSpectrum()
         energies = self.get_calibrated_energies()
         cal = self.get_calibration()
+        data = ScanDataStore(1)
+        data.channel_energies = energies
+        data.attributes['x'] = x
+        data.attributes['calibration'] = cal
+        data.add_point(self.monodevice.energy, spectrum=y)
+        data.save(self.filename[:-4] + '.npz')
+        # the pickle is kept for the existing readers
+        f = open(self.filename[:-4]  + '.pck', 'w')
         pickle.dump({'x': x, 'energies': energies, 'calibration': cal, 'y': y}, f)
         f.close()
         #self.plotSpectrum()
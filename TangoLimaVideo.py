@@ -8,13 +8,14 @@ from Qub.CTools import pixmaptools
 import gevent
 import logging
 import os
-import time
 import sys
 import PyTango
 from PyTango.gevent import DeviceProxy
 import numpy
 import struct
 
+from VideoFrameRing import VideoFrameRing
+
 class TangoLimaVideo(BaseHardwareObjects.Device):
     def __init__(self, name):
         BaseHardwareObjects.Device.__init__(self, name)
@@ -24,6 +25,7 @@ class TangoLimaVideo(BaseHardwareObjects.Device):
         self.__gammaExists = False
         self.__polling = None
         self.scaling = pixmaptools.LUT.Scaling()
+        self.frame_ring = VideoFrameRing()
         
     def init(self):
         self.device = None
@@ -47,26 +49,56 @@ class TangoLimaVideo(BaseHardwareObjects.Device):
     def imageType(self):
         return BayerType("RG16")
 
-    def _get_last_image(self):
+    def grab_frame(self):
+        """Reads last video image and stores a new frame in the frame ring
+        as read-only numpy view, without any conversion
+
+        Returns last VideoFrame or None
+        """
         img_data = self.device.video_last_image
         if img_data[0]=="VIDEO_IMAGE":
             header_fmt = ">IHHqiiHHHH"
             _, ver, img_mode, frame_number, width, height, _, _, _, _ = struct.unpack(header_fmt, img_data[1][:struct.calcsize(header_fmt)])
-            raw_buffer = numpy.fromstring(img_data[1][32:], numpy.uint16)
-            self.scaling.autoscale_min_max(raw_buffer, width, height, pixmaptools.LUT.Scaling.BAYER_RG16)
-            validFlag, qimage = pixmaptools.LUT.raw_video_2_image(raw_buffer,
-                                                                  width, height,
-                                                                  pixmaptools.LUT.Scaling.BAYER_RG16,
-                                                                  self.scaling)
-            if validFlag:
-                return qimage
+            raw_array = numpy.frombuffer(img_data[1], numpy.uint16,
+                                         offset=struct.calcsize(header_fmt)).\
+                        reshape(height, width)
+            frame = self.frame_ring.add_frame(raw_array, frame_number)
+            if frame is not None:
+                self.emit("frameReceived", frame)
+        return self.frame_ring.get_last_frame()
+
+    def get_last_frame(self):
+        """Returns last VideoFrame from the frame ring"""
+        return self.frame_ring.get_last_frame()
+
+    def _frame_to_qimage(self, frame):
+        self.scaling.autoscale_min_max(frame.raw_array, frame.width, frame.height, pixmaptools.LUT.Scaling.BAYER_RG16)
+        validFlag, qimage = pixmaptools.LUT.raw_video_2_image(frame.raw_array,
+                                                              frame.width, frame.height,
+                                                              pixmaptools.LUT.Scaling.BAYER_RG16,
+                                                              self.scaling)
+        if validFlag:
+            return qimage
+
+    def _frame_to_array(self, frame):
+        return (frame.raw_array * (255.0 / max(frame.raw_array.max(), 1))).\
+               astype(numpy.uint8)
+
+    def _get_last_image(self):
+        frame = self.grab_frame()
+        if frame is not None:
+            return frame.get_conversion("qimage", self._frame_to_qimage)
 
     def _do_polling(self, sleep_time):
+        emitted_frame_number = None
         while True:
             qimage = self._get_last_image()
-   	    self.emit("imageReceived", qimage, qimage.width(), qimage.height(), False)
+            frame = self.frame_ring.get_last_frame()
+            if qimage is not None and frame.frame_number != emitted_frame_number:
+                emitted_frame_number = frame.frame_number
+                self.emit("imageReceived", qimage, qimage.width(), qimage.height(), False)
 
-            time.sleep(sleep_time)
+            gevent.sleep(sleep_time)
 
     def connectNotify(self, signal):
         if signal=="imageReceived":
@@ -118,6 +150,19 @@ class TangoLimaVideo(BaseHardwareObjects.Device):
         else:
             return True
 
+    def get_snapshot(self, bw=None, return_as_array=True):
+        """Returns last frame as numpy array without file or QImage
+
+        Bayer RG16 frame is returned as raw mosaic scaled to 8 bits,
+        which is good enough for loop detection
+        """
+        if not return_as_array:
+            return self._get_last_image()
+
+        frame = self.grab_frame()
+        if frame is not None:
+            return frame.get_conversion("array", self._frame_to_array)
+
     def setLive(self, mode):
         """tango"""
         if mode:
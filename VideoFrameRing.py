@@ -0,0 +1,73 @@
+"""
+Frame ring shared by the video hardware objects.
+
+Video HO stores each new raw frame once as a read-only numpy view. Frames
+are kept in a small ring with frame number and timestamp. Conversions
+(QImage, mirroring, grayscale arrays, scaling) are done lazily on demand
+and cached with the frame, so GUI, centring and beam detection share the
+same decoded frame instead of converting it again.
+"""
+
+import time
+import collections
+
+
+class VideoFrame(object):
+    """
+    Descript. : one raw camera frame with lazily computed conversions
+    """
+    def __init__(self, raw_array, frame_number, timestamp=None):
+        raw_array.flags.writeable = False
+        self.raw_array = raw_array
+        self.frame_number = frame_number
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.__conversions = {}
+
+    @property
+    def width(self):
+        return self.raw_array.shape[1]
+
+    @property
+    def height(self):
+        return self.raw_array.shape[0]
+
+    def get_conversion(self, key, convert_method):
+        """
+        Descript. : returns conversion of the frame identified by key.
+                    convert_method(frame) is called only the first time
+        """
+        if key not in self.__conversions:
+            self.__conversions[key] = convert_method(self)
+        return self.__conversions[key]
+
+
+class VideoFrameRing(object):
+    """
+    Descript. : keeps last frames in a fixed size ring
+    """
+    def __init__(self, size=4):
+        self.__frames = collections.deque(maxlen=size)
+
+    def add_frame(self, raw_array, frame_number, timestamp=None):
+        """
+        Descript. : adds new frame if frame number has changed
+        Return.   : VideoFrame if frame was added, otherwise None
+        """
+        last_frame = self.get_last_frame()
+        if last_frame is not None and last_frame.frame_number == frame_number:
+            return None
+        frame = VideoFrame(raw_array, frame_number, timestamp)
+        self.__frames.append(frame)
+        return frame
+
+    def get_last_frame(self):
+        if self.__frames:
+            return self.__frames[-1]
+
+    def get_frame(self, frame_number):
+        for frame in self.__frames:
+            if frame.frame_number == frame_number:
+                return frame
+
+    def clear(self):
+        self.__frames.clear()
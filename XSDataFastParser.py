@@ -0,0 +1,247 @@
+"""
+Fast parser backend for the EDNA XSData result files.
+
+The generated XSData bindings parse with xml.dom.minidom, which builds
+the full DOM before the bindings walk it. This module offers two faster
+alternatives:
+
+ - parse_file / parse_string build the same XSData objects from an
+   ElementTree (lxml if available), through light nodes that provide
+   the part of the DOM interface used by the generated build methods.
+ - parse_dozor_file reads the images of a ResultControlDozor file with
+   iterparse straight into numpy arrays, without any XSData object.
+   Elements are released as soon as they have been read.
+
+Running the module benchmarks the parsers on generated Dozor result files:
+    python XSDataFastParser.py [images_num ...]
+"""
+
+import os
+import sys
+import time
+import logging
+from xml.dom import Node
+
+import numpy
+
+try:
+    from lxml import etree
+except ImportError:
+    try:
+        import xml.etree.cElementTree as etree
+    except ImportError:
+        import xml.etree.ElementTree as etree
+
+
+DOZOR_INTEGER_FIELDS = ("number", "spots_num_of")
+DOZOR_DOUBLE_FIELDS = ("spots_int_aver", "spots_resolution", "score",
+                       "powder_wilson_scale", "powder_wilson_bfactor",
+                       "powder_wilson_resolution", "powder_wilson_correlation",
+                       "powder_wilson_rfactor")
+
+
+def _local_name(tag):
+    if tag[0] == "{":
+        return tag[tag.index("}") + 1:]
+    return tag
+
+
+class TextNode(object):
+    """
+    Descript. : text of an element seen as a DOM text node
+    """
+    nodeType = Node.TEXT_NODE
+    nodeName = "#text"
+    childNodes = ()
+    firstChild = None
+
+    def __init__(self, text):
+        self.nodeValue = text
+
+    def toxml(self):
+        return self.nodeValue
+
+
+class ElementNode(object):
+    """
+    Descript. : ElementTree element seen as a DOM element, children are
+                created when they are accessed
+    """
+    nodeType = Node.ELEMENT_NODE
+    nodeValue = None
+
+    def __init__(self, element):
+        self.element = element
+        self.nodeName = _local_name(element.tag)
+        self.__child_nodes = None
+
+    @property
+    def childNodes(self):
+        if self.__child_nodes is None:
+            nodes = []
+            if self.element.text:
+                nodes.append(TextNode(self.element.text))
+            for child in self.element:
+                if callable(child.tag):
+                    # comments and processing instructions
+                    continue
+                nodes.append(ElementNode(child))
+                if child.tail:
+                    nodes.append(TextNode(child.tail))
+            self.__child_nodes = nodes
+        return self.__child_nodes
+
+    @property
+    def firstChild(self):
+        if self.element.text:
+            return TextNode(self.element.text)
+        child_nodes = self.childNodes
+        if child_nodes:
+            return child_nodes[0]
+        return None
+
+    def toxml(self):
+        return etree.tostring(self.element)
+
+
+def build(xsdata_class, root_element):
+    """
+    Descript. : builds an xsdata_class object from the root element
+    """
+    root_obj = xsdata_class()
+    root_obj.build(ElementNode(root_element))
+    return root_obj
+
+
+def parse_file(xsdata_class, file_name):
+    """
+    Descript. : same as xsdata_class.parseFile(file_name) without DOM
+    Return    : xsdata_class object
+    """
+    return build(xsdata_class, etree.parse(file_name).getroot())
+
+
+def parse_string(xsdata_class, xml_string):
+    """
+    Descript. : same as xsdata_class.parseString(xml_string) without DOM
+    Return    : xsdata_class object
+    """
+    return build(xsdata_class, etree.fromstring(xml_string))
+
+
+def parse_dozor_file(file_name):
+    """
+    Descript. : reads the imageDozor elements of a ResultControlDozor file
+    Return    : dictionary of numpy arrays, one per field of the image
+                (number, spots_num_of, spots_int_aver, spots_resolution,
+                score and powder_wilson_*) and "image" (list of paths).
+                Images without a number are dropped with a warning,
+                other missing values are -1 (integers) or nan (doubles)
+    """
+    columns = dict((field, []) for field in \
+                   DOZOR_INTEGER_FIELDS + DOZOR_DOUBLE_FIELDS)
+    images = []
+
+    for event, element in etree.iterparse(file_name, events=("end", )):
+        if _local_name(element.tag) != "imageDozor":
+            continue
+        values = {}
+        image = None
+        for child in element:
+            if callable(child.tag):
+                continue
+            name = _local_name(child.tag)
+            if name == "image":
+                image = child.findtext("path/value")
+            else:
+                values[name] = child.findtext("value")
+        if not values.get("number"):
+            # the number is used as an index, no sentinel value
+            logging.getLogger("HWR").warning("Dozor result file %s: " \
+                "image %s has no number, skipped" % (file_name, image))
+            element.clear()
+            continue
+        for field, column in columns.items():
+            column.append(values.get(field))
+        images.append(image)
+        element.clear()
+
+    result = {"image": images}
+    for field in DOZOR_INTEGER_FIELDS:
+        result[field] = numpy.array([int(value) if value else -1 \
+                                     for value in columns[field]], dtype=int)
+    for field in DOZOR_DOUBLE_FIELDS:
+        result[field] = numpy.array([float(value) if value else numpy.nan \
+                                     for value in columns[field]], dtype=float)
+    return result
+
+
+def write_dozor_file(file_name, images_num):
+    """
+    Descript. : writes a ResultControlDozor file of images_num images
+                with random values (benchmark data)
+    """
+    values = numpy.random.random((images_num, 4))
+    f = open(file_name, "w")
+    f.write('<?xml version="1.0" ?>\n<XSDataResultControlDozor>\n')
+    for index in range(images_num):
+        f.write("    <imageDozor>\n"
+            "        <image><path><value>/data/mesh_1_%05d.cbf</value></path></image>\n"
+            "        <number><value>%d</value></number>\n"
+            "        <spots_num_of><value>%d</value></spots_num_of>\n"
+            "        <spots_int_aver><value>%f</value></spots_int_aver>\n"
+            "        <spots_resolution><value>%f</value></spots_resolution>\n"
+            "        <score><value>%f</value></score>\n"
+            "    </imageDozor>\n" % (index + 1, index + 1,
+                int(values[index, 0] * 100), values[index, 1] * 1000,
+                1 + values[index, 2] * 3, values[index, 3] * 50))
+    f.write("</XSDataResultControlDozor>\n")
+    f.close()
+
+
+def __benchmark(method, file_name):
+    """
+    Descript. : runs method(file_name) in a child process
+    Return    : (parse time [s], peak memory of the child [kB])
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        start = time.time()
+        method(file_name)
+        os.write(write_fd, repr(time.time() - start).encode())
+        os._exit(0)
+    os.close(write_fd)
+    elapsed = float(os.read(read_fd, 64))
+    os.close(read_fd)
+    rusage = os.wait4(pid, 0)[2]
+    return elapsed, rusage.ru_maxrss
+
+
+if __name__ == '__main__':
+    import tempfile
+    from XSDataControlDozorv1_1 import XSDataResultControlDozor
+
+    methods = (("noop", lambda file_name: None),
+               ("minidom", XSDataResultControlDozor.parseFile),
+               ("etree", lambda file_name: \
+                    parse_file(XSDataResultControlDozor, file_name)),
+               ("dozor arrays", parse_dozor_file))
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]
+
+    print("%10s %14s %10s %14s" % ("images", "parser", "time [s]",
+                                   "memory [kB]"))
+    for images_num in sizes:
+        file_name = os.path.join(tempfile.gettempdir(),
+                                 "ResultControlDozor_benchmark.xml")
+        write_dozor_file(file_name, images_num)
+        baseline = None
+        for name, method in methods:
+            elapsed, max_rss = __benchmark(method, file_name)
+            if baseline is None:
+                baseline = max_rss
+                continue
+            print("%10d %14s %10.3f %14d" % (images_num, name, elapsed,
+                                             max_rss - baseline))
+        os.remove(file_name)
@@ -1,33 +1,31 @@
 import os
 import sys
 import logging
-import subprocess
+import JobScheduler
+
+def processing_options(params):
+    residues = params.get('residues', 0)
+    anomalous = params.get('anomalous', False)
+    spacegroup = params.get('spacegroup')
+    unit_cell_constants = params.get('cell')
+
+    options = ['-residues', str(residues), '-anomalous', str(anomalous)]
+    if spacegroup:
+        options += ['-sg', str(spacegroup)]
+    if unit_cell_constants:
+        options += ['-cell', str(unit_cell_constants)]
+    # + (param_dict["inverse_beam"] and ['-inverse'] or [])
+    return options
 
 def grouped_processing(processEvent, params):
-    endOfLineToExecute = ''
+    arguments = []
 
     for param_dict in params:
         dataCollectionId = param_dict.get('collect_id')
-        residues = param_dict.get('residues', 0)
-        anomalous = param_dict.get('anomalous', False)
-        spacegroup = param_dict.get('spacegroup')
-
-        if spacegroup: 
-            sg_opt = ' -sg {0}'.format(spacegroup)
-        else:
-            sg_opt = ''
-
-        unit_cell_constants = param_dict.get('cell')
-        if unit_cell_constants:
-            cell_opt = ' -cell "{0}"'.format(unit_cell_constants)
-        else:
-            cell_opt = ''
-
-        endOfLineToExecute += ' -mode %s -collect %d:%s' % (processEvent, dataCollectionId, param_dict["xds_dir"])
-        endOfLineToExecute += ' -residues ' + str(residues) + ' -anomalous ' + str(anomalous) + \
-                              sg_opt + cell_opt
-        # + (param_dict["inverse_beam"] and ' -inverse' or '')
-    return endOfLineToExecute
+        arguments += ['-mode', processEvent,
+                      '-collect', '%d:%s' % (dataCollectionId, param_dict["xds_dir"])]
+        arguments += processing_options(param_dict)
+    return arguments
 
 def start(programs, processEvent, paramsDict):
     for program in programs["program"]:
@@ -38,35 +36,17 @@ def start(programs, processEvent, paramsDict):
 		
                 if os.path.isfile(executable):
                     if processEvent == "end_multicollect":
-                        endOfLineToExecute = grouped_processing("end_multicollect", paramsDict)
+                        arguments = grouped_processing("end_multicollect", paramsDict)
                     elif os.path.isdir(paramsDict["xds_dir"]):
                         dataCollectionId = paramsDict.get('datacollect_id')
-                        residues = paramsDict.get('residues', 0)
-                        anomalous = paramsDict.get('anomalous', False)
-                        spacegroup = paramsDict.get('spacegroup')
-                        if spacegroup: 
-                            sg_opt = ' -sg {0}'.format(spacegroup)
-                        else:
-                            sg_opt = ''
-
-                        unit_cell_constants = paramsDict.get('cell')
-                        if unit_cell_constants:
-                            cell_opt = ' -cell "{0}"'.format(unit_cell_constants)
-                        else:
-                            cell_opt = ''
-
-                        endOfLineToExecute = ' -path ' + paramsDict["xds_dir"] +\
-					     ' -mode ' + processEvent +\
-					     ' -datacollectionID ' + str(dataCollectionId) +\
-					     ' -residues ' + str(residues) +\
-					     ' -anomalous ' + str(anomalous) +\
-					     sg_opt + cell_opt #+\
-					     #(paramsDict["inverse_beam"] and ' -inverse' or '')
-                    lineToExecute = executable + endOfLineToExecute + ' 2>&1 > /dev/null &'
-                    logging.info("Process event %s, executing %s" % (processEvent,str(lineToExecute)))
+                        arguments = ['-path', paramsDict["xds_dir"],
+                                     '-mode', processEvent,
+                                     '-datacollectionID', str(dataCollectionId)]
+                        arguments += processing_options(paramsDict)
+                    argv = [executable] + arguments
+                    logging.info("Process event %s, executing %s" % (processEvent," ".join(argv)))
 
-                    subprocess.Popen(str(lineToExecute), shell=True, stdin=None,
-                                     stdout=None, stderr=None, close_fds=True)
+                    JobScheduler.get_scheduler().submit(argv, "autoprocessing")
                 else:
                     logging.getLogger().error("No program to execute found (%s)",executable)
         except:
@@ -78,5 +58,9 @@ def startInducedRadDam(datacollect_params, old={"xds_dir":None}):
         eda_dirs=filter(os.path.isdir, [os.path.join(datacollect_params['EDNA_files_dir'], x) for x in os.listdir(datacollect_params['EDNA_files_dir']) if x.startswith("EDA")])
         eda_dirs.sort()
         EDApplication = eda_dirs[-1]
-        os.system("export TCL_LIBRARY=/usr/share/tcl8.4;/opt/pxsoft/bin/InducedRadDam.py -i -e %s -p %s &" % (EDApplication, datacollect_params["xds_dir"]))
+        JobScheduler.get_scheduler().submit(["/opt/pxsoft/bin/InducedRadDam.py", "-i",
+                                             "-e", EDApplication,
+                                             "-p", datacollect_params["xds_dir"]],
+                                            "radiation_damage",
+                                            env={"TCL_LIBRARY": "/usr/share/tcl8.4"})
     return True
@@ -5,9 +5,34 @@ the QueueModel.
 """
 import copy
 import os
+import bisect
 import logging
 import queue_model_enumerables_v1 as queue_model_enumerables
 
+class PathTemplateHolder(object):
+    """
+    Base of the objects with a path_template attribute. Replacing the
+    path template of an object whose template is in a PathTemplateIndex
+    moves the index entry to the new template, so that the index does not
+    keep the replaced one.
+    """
+    def __setattr__(self, name, value):
+        if name != 'path_template':
+            object.__setattr__(self, name, value)
+            return
+
+        old_path_template = self.__dict__.get('path_template')
+        object.__setattr__(self, name, value)
+
+        if old_path_template is not None and old_path_template is not value:
+            index = old_path_template.__dict__.get('_path_template_index')
+
+            if index is not None:
+                index.remove(old_path_template)
+
+                if value is not None:
+                    index.add(value)
+
 class TaskNode(object):
     """
     Objects that inherit TaskNode can be added to and handled by
@@ -184,6 +209,10 @@ class RootNode(TaskNode):
         TaskNode.__init__(self)
         self._name = 'root'
         self._total_node_count = 0
+        # Maps node id to node for every node in the tree, maintained
+        # by QueueModel
+        self._node_index = {}
+        self._path_template_index = PathTemplateIndex()
 
 
 class TaskGroup(TaskNode):
@@ -787,7 +816,7 @@ class CharacterisationParameters(object):
         return s
 
 
-class EnergyScan(TaskNode):
+class EnergyScan(TaskNode, PathTemplateHolder):
     def __init__(self, sample = None, path_template = None, cpos = None):
         TaskNode.__init__(self)
         self.element_symbol = None
@@ -878,7 +907,7 @@ class EnergyScanResult(object):
         self.title = None
 
 
-class XRFSpectrum(TaskNode):
+class XRFSpectrum(TaskNode, PathTemplateHolder):
     """
     Descript. : Class represents XRF spectrum task
     """ 
@@ -1009,7 +1038,7 @@ class SampleCentring(TaskNode):
     def get_kappa_phi(self):
         return self.kappa_phi
 
-class Acquisition(object):
+class Acquisition(PathTemplateHolder):
     def __init__(self):
         object.__init__(self)
 
@@ -1043,6 +1072,12 @@ class Acquisition(object):
 
 
 class PathTemplate(object):
+    # Attributes that define the files written by the template, changing
+    # one of them updates the PathTemplateIndex the template belongs to
+    INDEXED_ATTRIBUTES = ('directory', 'base_prefix', 'mad_prefix',
+                          'reference_image_prefix', 'wedge_prefix',
+                          'run_number', 'start_num', 'num_files')
+
     @staticmethod
     def set_data_base_path(base_directory):
         # os.path.abspath returns path without trailing slash, if any
@@ -1073,6 +1108,30 @@ class PathTemplate(object):
         self.start_num = int()
         self.num_files = int()
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+
+        index = self.__dict__.get('_path_template_index')
+        if index is not None and name in PathTemplate.INDEXED_ATTRIBUTES:
+            index.update(self)
+
+    def __getstate__(self):
+        # Copies of a path template are not part of the index
+        d = dict(self.__dict__)
+        d.pop('_path_template_index', None)
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+
+    def get_index_key(self):
+        """
+        :returns: The key used to group path templates that write
+                  files with the same name pattern.
+        :rtype: tuple
+        """
+        return (os.path.normpath(self.directory), self.get_prefix())
+
     def as_dict(self):
         return {"directory" : self.directory,
                 "process_directory" : self.process_directory,
@@ -1227,6 +1286,152 @@ class PathTemplate(object):
     def copy(self):
         return copy.deepcopy(self)
 
+
+class PathTemplateIndex(object):
+    """
+    Index of the path templates in a model. Path templates are grouped by
+    normalised directory and prefix, and within a group by run number,
+    each run holding the image intervals sorted by start number. The next
+    run number and path collisions are looked up in the group of the
+    template instead of comparing it with every template in the model.
+    """
+    def __init__(self):
+        object.__init__(self)
+        # id(path_template) -> [path_template, reference count]
+        self._templates = {}
+        # id(path_template) -> (key, run_number, interval) as indexed
+        self._entries = {}
+        # key -> sorted list of run numbers
+        self._run_numbers = {}
+        # (key, run_number) -> sorted list of (start, end, id)
+        self._intervals = {}
+
+    def __contains__(self, path_template):
+        return id(path_template) in self._templates
+
+    def add(self, path_template):
+        """
+        Adds <path_template> to the index, a template shared by several
+        nodes is indexed once and reference counted.
+
+        :param path_template: The path template to add.
+        :type path_template: PathTemplate
+        """
+        pt_id = id(path_template)
+
+        if pt_id in self._templates:
+            self._templates[pt_id][1] += 1
+        else:
+            self._templates[pt_id] = [path_template, 1]
+            self._insert(path_template)
+            path_template._path_template_index = self
+
+    def remove(self, path_template):
+        """
+        Removes <path_template> from the index.
+
+        :param path_template: The path template to remove.
+        :type path_template: PathTemplate
+        """
+        pt_id = id(path_template)
+
+        if pt_id in self._templates:
+            self._templates[pt_id][1] -= 1
+
+            if self._templates[pt_id][1] <= 0:
+                del self._templates[pt_id]
+                self._discard(pt_id)
+                path_template.__dict__.pop('_path_template_index', None)
+
+    def update(self, path_template):
+        """
+        Re-indexes <path_template> after one of its attributes changed.
+        """
+        pt_id = id(path_template)
+
+        if pt_id in self._templates:
+            self._discard(pt_id)
+            self._insert(path_template)
+
+    def clear(self):
+        for path_template, count in self._templates.values():
+            path_template.__dict__.pop('_path_template_index', None)
+
+        self._templates = {}
+        self._entries = {}
+        self._run_numbers = {}
+        self._intervals = {}
+
+    def _insert(self, path_template):
+        pt_id = id(path_template)
+        key = path_template.get_index_key()
+        run_number = path_template.run_number
+        interval = (path_template.start_num,
+                    path_template.start_num + path_template.num_files,
+                    pt_id)
+
+        intervals = self._intervals.setdefault((key, run_number), [])
+        if not intervals:
+            bisect.insort(self._run_numbers.setdefault(key, []), run_number)
+        bisect.insort(intervals, interval)
+        self._entries[pt_id] = (key, run_number, interval)
+
+    def _discard(self, pt_id):
+        key, run_number, interval = self._entries.pop(pt_id)
+        intervals = self._intervals[(key, run_number)]
+        del intervals[bisect.bisect_left(intervals, interval)]
+
+        if not intervals:
+            del self._intervals[(key, run_number)]
+            run_numbers = self._run_numbers[key]
+            del run_numbers[bisect.bisect_left(run_numbers, run_number)]
+
+            if not run_numbers:
+                del self._run_numbers[key]
+
+    def get_max_run_number(self, path_template, exclude_current=True):
+        """
+        :returns: The highest run number used by the templates that
+                  have the same directory and prefix as <path_template>,
+                  0 if there are none.
+        :rtype: int
+        """
+        key = path_template.get_index_key()
+        pt_id = id(path_template)
+
+        for run_number in reversed(self._run_numbers.get(key, [])):
+            intervals = self._intervals[(key, run_number)]
+
+            if not exclude_current or len(intervals) > 1 or \
+                   intervals[0][2] != pt_id:
+                return run_number
+
+        return 0
+
+    def has_collision(self, path_template):
+        """
+        :returns: True if an other template in the index writes (some of)
+                  the files written by <path_template>.
+        :rtype: bool
+        """
+        key = path_template.get_index_key()
+        intervals = self._intervals.get((key, path_template.run_number))
+
+        if not intervals:
+            return False
+
+        pt_id = id(path_template)
+        start = path_template.start_num
+        end = path_template.start_num + path_template.num_files
+
+        # Only intervals starting before the end of this one can overlap
+        for index in range(bisect.bisect_left(intervals, (end, )) - 1, -1, -1):
+            interval = intervals[index]
+            if interval[2] != pt_id and interval[1] > start:
+                return True
+
+        return False
+
 class AcquisitionParameters(object):
     def __init__(self):
         object.__init__(self)
@@ -1371,7 +1576,7 @@ class CentredPosition(object):
     def get_kappa_phi_value(self):
         return self.kappa_phi
 
-class Workflow(TaskNode):
+class Workflow(TaskNode, PathTemplateHolder):
     def __init__(self):
         TaskNode.__init__(self)
         self.path_template = PathTemplate()
@@ -9,7 +9,10 @@ import tempfile
 
 try:
   import lucid2 as lucid
+  #lucid2 accepts numpy arrays, lucid only image files
+  LUCID_ACCEPTS_ARRAY = True
 except ImportError:
+  LUCID_ACCEPTS_ARRAY = False
   try:
       import lucid
   except ImportError:
@@ -249,6 +252,17 @@ def center(phi, phiy, phiz,
     move_motors(SAVED_INITIAL_POSITIONS)
     raise
 
+  return calc_centred_position(phi, phiy, phiz, sampx, sampy,
+                               pixelsPerMm_Hor, pixelsPerMm_Ver,
+                               beam_xc, beam_yc, chi_angle,
+                               X, Y, phi_positions)
+
+def calc_centred_position(phi, phiy, phiz,
+                          sampx, sampy,
+                          pixelsPerMm_Hor, pixelsPerMm_Ver,
+                          beam_xc, beam_yc,
+                          chi_angle,
+                          X, Y, phi_positions):
   #logging.info("X=%s,Y=%s", X, Y)
   chi_angle = math.radians(chi_angle)
   chiRotMatrix = numpy.matrix([[math.cos(chi_angle), -math.sin(chi_angle)],
@@ -299,7 +313,9 @@ def start_auto(camera,  centring_motors_dict,
                chi_angle = 0,
                n_points = 3,
                msg_cb=None,
-               new_point_cb=None):    
+               new_point_cb=None,
+               continuous_sweep=False,
+               phi_range=180):    
     global CURRENT_CENTRING
 
     phi, phiy, phiz, sampx, sampy = prepare(centring_motors_dict)
@@ -312,14 +328,33 @@ def start_auto(camera,  centring_motors_dict,
                                     beam_xc, beam_yc, 
                                     chi_angle,
                                     n_points,
-                                    msg_cb, new_point_cb)
+                                    msg_cb, new_point_cb,
+                                    continuous_sweep,
+                                    phi_range)
     return CURRENT_CENTRING
 
-def find_loop(camera, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb):
+def take_snapshot(camera):
+  """Returns last camera frame as grayscale numpy array if camera and
+     lucid allow it, otherwise saves snapshot in a temporary file and
+     returns its name"""
+  if LUCID_ACCEPTS_ARRAY and hasattr(camera, "get_snapshot"):
+    image = camera.get_snapshot(bw=True, return_as_array=True)
+    if image is not None:
+      if image.ndim == 3:
+        image = numpy.dot(image[..., :3], [0.299, 0.587, 0.114])
+      if image.dtype != numpy.uint8:
+        image = numpy.clip(image, 0, 255).astype(numpy.uint8)
+      return image
+
   snapshot_filename = os.path.join(tempfile.gettempdir(), "mxcube_sample_snapshot.png")
   camera.takeSnapshot(snapshot_filename, bw=True)
-  
-  info, x, y = lucid.find_loop(snapshot_filename,IterationClosing=6)
+  return snapshot_filename
+
+def find_loop(camera, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb):
+  return find_loop_in_snapshot(take_snapshot(camera), msg_cb, new_point_cb)
+
+def find_loop_in_snapshot(snapshot, msg_cb, new_point_cb):
+  info, x, y = lucid.find_loop(snapshot,IterationClosing=6)
   
   try:
     x = float(x)
@@ -334,6 +369,11 @@ def find_loop(camera, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb):
         
   return x, y
 
+def wait_end_of_move(motor, timeout=None):
+  with gevent.Timeout(timeout):
+    while not ready(motor):
+      gevent.sleep(0.01)
+
 def auto_center(camera, 
                 phi, phiy, phiz,
                 sampx, sampy, 
@@ -341,7 +381,9 @@ def auto_center(camera,
                 beam_xc, beam_yc, 
                 chi_angle, 
                 n_points,
-                msg_cb, new_point_cb):
+                msg_cb, new_point_cb,
+                continuous_sweep=False,
+                phi_range=180):
     imgWidth = camera.getWidth()
     imgHeight = camera.getHeight()
  
@@ -359,47 +401,127 @@ def auto_center(camera,
     for k in range(3):
       if callable(msg_cb):
             msg_cb("Doing automatic centring")
-            
-      centring_greenlet = gevent.spawn(center,
-                                       phi, phiy, phiz,
-                                       sampx, sampy, 
-                                       pixelsPerMm_Hor, pixelsPerMm_Ver, 
-                                       beam_xc, beam_yc, 
-                                       chi_angle, 
-                                       n_points)
 
-      for a in range(n_points):
-            x, y = find_loop(camera, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb) 
-            #logging.info("in autocentre, x=%f, y=%f",x,y)
-            if x < 0 or y < 0:
-              for i in range(1,18):
-                #logging.info("loop not found - moving back %d" % i)
-                phi.syncMoveRelative(5)
-                x, y = find_loop(camera, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb)
-                if -1 in (x, y):
-                    continue
-                if x >=0:
-                  if y < imgHeight/2:
-                    y = 0
-                    if callable(new_point_cb):
-                        new_point_cb((x,y))
-                    user_click(x,y,wait=True)
-                    break
-                  else:
-                    y = imgHeight
-                    if callable(new_point_cb):
-                        new_point_cb((x,y))
-                    user_click(x,y,wait=True)
-                    break
-              if -1 in (x,y):
-                centring_greenlet.kill()
-                raise RuntimeError("Could not centre sample automatically.")
-              phi.syncMoveRelative(-i*5)
-            else:
-              user_click(x,y,wait=True)
-
-      centred_pos = centring_greenlet.get()
+      if continuous_sweep:
+        X, Y, phi_positions = collect_loop_points_sweep(camera, phi,
+             pixelsPerMm_Hor, pixelsPerMm_Ver, phi_range,
+             msg_cb, new_point_cb)
+      else:
+        X, Y, phi_positions = collect_loop_points(camera, phi,
+             pixelsPerMm_Hor, pixelsPerMm_Ver, n_points, phi_range,
+             imgHeight, msg_cb, new_point_cb)
+
+      centred_pos = calc_centred_position(phi, phiy, phiz,
+                                          sampx, sampy,
+                                          pixelsPerMm_Hor, pixelsPerMm_Ver,
+                                          beam_xc, beam_yc,
+                                          chi_angle,
+                                          X, Y, phi_positions)
       end(centred_pos)
                  
     return centred_pos
-    
+
+def collect_loop_points(camera, phi,
+                        pixelsPerMm_Hor, pixelsPerMm_Ver,
+                        n_points, phi_range, imgHeight,
+                        msg_cb, new_point_cb):
+    """Takes n_points snapshots phi_range/(n_points-1) degrees apart.
+       Move to the next angle starts as soon as the snapshot is taken,
+       so the rotation overlaps with the loop detection"""
+    X, Y, phi_positions = [], [], []
+    phi_angle = phi_range/(n_points-1)
+
+    try:
+      for a in range(n_points):
+        wait_end_of_move(phi)
+        snapshot = take_snapshot(camera)
+        phi_position = phi.getPosition()
+        if a != n_points-1:
+          phi.moveRelative(phi.direction*phi_angle)
+
+        x, y = find_loop_in_snapshot(snapshot, msg_cb, new_point_cb)
+        if x < 0 or y < 0:
+          #Loop lost: goes back to the angle of the snapshot and
+          #searches for the loop in 5 degree steps, the point is
+          #recorded at the angle where the loop was found
+          wait_end_of_move(phi)
+          phi.syncMove(phi_position)
+          x, y, phi_position = search_loop(camera, phi, imgHeight,
+                                           msg_cb, new_point_cb)
+          if a != n_points-1:
+            phi.moveRelative(phi.direction*phi_angle)
+
+        X.append(x / float(pixelsPerMm_Hor))
+        Y.append(y / float(pixelsPerMm_Ver))
+        phi_positions.append(phi.direction*math.radians(phi_position))
+      wait_end_of_move(phi)
+    except:
+      logging.exception("Exception while centring")
+      move_motors(SAVED_INITIAL_POSITIONS)
+      raise
+    return X, Y, phi_positions
+
+def search_loop(camera, phi, imgHeight, msg_cb, new_point_cb):
+    """Rotates phi in 5 degree steps until the loop is found, y is set
+       to the image border. Phi is moved back at the end.
+       Returns x, y and the phi position where the loop was found"""
+    for i in range(1,18):
+      phi.syncMoveRelative(5)
+      phi_position = phi.getPosition()
+      x, y = find_loop_in_snapshot(take_snapshot(camera), msg_cb, new_point_cb)
+      if -1 in (x, y):
+        continue
+      if x >=0:
+        if y < imgHeight/2:
+          y = 0
+        else:
+          y = imgHeight
+        if callable(new_point_cb):
+          new_point_cb((x,y))
+        break
+    phi.syncMoveRelative(-i*5)
+    if -1 in (x,y):
+      raise RuntimeError("Could not centre sample automatically.")
+    return x, y, phi_position
+
+def collect_loop_points_sweep(camera, phi,
+                              pixelsPerMm_Hor, pixelsPerMm_Ver,
+                              phi_range, msg_cb, new_point_cb):
+    """Rotates phi continuously over phi_range and detects the loop on
+       frames taken on the fly. Snapshots where the loop is not found
+       are skipped and all found points are used in the fit"""
+    X, Y, phi_positions = [], [], []
+    phi_start = phi.getPosition()
+
+    phi_end = phi_start + phi.direction*phi_range
+
+    try:
+      phi.move(phi_end)
+      # right after the move command phi can still be reported ready
+      # at its start position, wait for the sweep to begin
+      with gevent.Timeout(3, RuntimeError("Phi did not start moving")):
+        while ready(phi) and abs(phi.getPosition() - phi_start) < 0.01:
+          gevent.sleep(0.01)
+      moving = False
+      sweep_done = False
+      while not sweep_done:
+        # the sweep is done at the end position, or when phi stopped
+        # before it after having been seen moving
+        moving = moving or not ready(phi)
+        sweep_done = abs(phi.getPosition() - phi_end) < 0.01 or \
+                     (moving and ready(phi))
+        snapshot = take_snapshot(camera)
+        phi_position = phi.getPosition()
+        x, y = find_loop_in_snapshot(snapshot, msg_cb, new_point_cb)
+        if x >= 0 and y >= 0:
+          X.append(x / float(pixelsPerMm_Hor))
+          Y.append(y / float(pixelsPerMm_Ver))
+          phi_positions.append(phi.direction*math.radians(phi_position))
+    except:
+      logging.exception("Exception while centring")
+      move_motors(SAVED_INITIAL_POSITIONS)
+      raise
+
+    if len(X) < 3:
+      raise RuntimeError("Could not centre sample automatically.")
+    return X, Y, phi_positions
@@ -72,6 +72,7 @@ class Cats90(SampleChanger):
         self._selected_sample = None
         self._selected_basket = None
         self._scIsCharging = None
+        self._lidsOpen = []
         self._startLoad =False # add flag to disable Load or UnLoad/Exchange Button immediately after 1 click (Avoid Click multiple times)
 
         # add support for CATS dewars with variable number of lids
@@ -122,6 +123,18 @@ class Cats90(SampleChanger):
 
         self._initSCContents()
 
+        # channel updates mark the parts of the info to update, polling is only a safety net
+        self._connectUpdateChannel(self._chnState, "state")
+        self._connectUpdateChannel(self._chnPathRunning, "state")
+        self._connectUpdateChannel(self._chnSampleIsDetected, "state")
+        self._connectUpdateChannel(self._chnLidLoadedSample, "loaded_sample")
+        self._connectUpdateChannel(self._chnNumLoadedSample, "loaded_sample")
+        self._connectUpdateChannel(self._chnSampleBarcode, "barcode")
+        for basket_index in range(Cats90.NO_OF_BASKETS):
+            self._connectUpdateChannel(getattr(self, "_chnBasket%dState" % (basket_index + 1)), ("basket", basket_index))
+        for lid_channel in (self._lidStatus, self._lid1State, self._lid2State, self._lid3State):
+            self._connectUpdateChannel(lid_channel, "lid")
+
         # SampleChanger.init must be called _after_ initialization of the Cats because it starts the update methods which access
         # the device server's status attributes
         SampleChanger.init(self)   
@@ -135,6 +148,15 @@ class Cats90(SampleChanger):
         """
         return (Pin.__HOLDER_LENGTH_PROPERTY__,)
 
+    def getLidsState(self):
+        """
+        Get the open state of the lids, as last updated by the lid channels
+
+        :returns: one flag per lid, True if the lid is open
+        :rtype: list
+        """
+        return list(self._lidsOpen)
+
     def getBasketList(self):
         basket_list = []
         for basket in self.getComponents():
@@ -158,6 +180,27 @@ class Cats90(SampleChanger):
         # self._updateSelection()
         self._updateState()               
         self._updateLoadedSample()
+
+    def _doUpdateParts(self, parts):
+        """
+        Updates the parts of the sample changer status marked dirty by the channel updates:
+        'state', 'lid', 'loaded_sample', 'barcode' and ('basket', basket_index)
+
+        :returns: None
+        :rtype: None
+        """
+        for part in parts:
+            if isinstance(part, tuple) and part[0] == "basket":
+                self._updateBasketContents(part[1])
+        if "loaded_sample" in parts:
+            self._updateLoadedSample()
+        elif "barcode" in parts and self.getLoadedSample() is not None:
+            self._updateSampleBarcode(self.getLoadedSample())
+        if "lid" in parts:
+            self._updateLidState()
+        # the state depends on the loaded sample and on the lids
+        if "state" in parts or "loaded_sample" in parts or "lid" in parts:
+            self._updateState()
                     
     def _doChangeMode(self,mode):
         """
@@ -373,8 +416,20 @@ class Cats90(SampleChanger):
 
     #########################           PRIVATE           #########################        
 
+    def _updateLidState(self):
+        """
+        Updates the open state of the lids and the charging mode
+
+        :returns: None
+        :rtype: None
+        """
+        self._lidsOpen = [bool(lid_channel.getValue()) for lid_channel in (self._lid1State, self._lid2State, self._lid3State)]
+        if self._lidStatus is not None:
+            self._scIsCharging = not self._lidStatus.getValue()
+
     def _updateOperationMode(self, value):
         self._scIsCharging = not value
+        self._markDirty("state")
 
     def _executeServerTask(self, method, *args):
         """
@@ -602,38 +657,47 @@ class Cats90(SampleChanger):
         :rtype: None
         """
         for basket_index in range(Cats90.NO_OF_BASKETS):            
-            # get presence information from the device server
-            newBasketPresence = getattr(self, "_chnBasket%dState" % (basket_index + 1)).getValue()
-            # get saved presence information from object's internal bookkeeping
-            basket=self.getComponents()[basket_index]
-           
-            # check if the basket was newly mounted or removed from the dewar
-            if newBasketPresence ^ basket.isPresent():
-                # import pdb; pdb.set_trace()
-                # a mounting action was detected ...
-                if newBasketPresence:
-                    # basket was mounted
-                    present = True
-                    scanned = False
-                    datamatrix = None
-                    basket._setInfo(present, datamatrix, scanned)
+            self._updateBasketContents(basket_index)
+
+    def _updateBasketContents(self, basket_index):
+        """
+        Updates the presence of one basket and of its samples.
+
+        :returns: None
+        :rtype: None
+        """
+        # get presence information from the device server
+        newBasketPresence = getattr(self, "_chnBasket%dState" % (basket_index + 1)).getValue()
+        # get saved presence information from object's internal bookkeeping
+        basket=self.getComponents()[basket_index]
+
+        # check if the basket was newly mounted or removed from the dewar
+        if newBasketPresence ^ basket.isPresent():
+            # import pdb; pdb.set_trace()
+            # a mounting action was detected ...
+            if newBasketPresence:
+                # basket was mounted
+                present = True
+                scanned = False
+                datamatrix = None
+                basket._setInfo(present, datamatrix, scanned)
+            else:
+                # basket was removed
+                present = False
+                scanned = False
+                datamatrix = None
+                basket._setInfo(present, datamatrix, scanned)
+            # set the information for all dependent samples
+            for sample_index in range(Basket.NO_OF_SAMPLES_PER_PUCK):
+                sample = self.getComponentByAddress(Pin.getSampleAddress((basket_index + 1), (sample_index + 1)))
+                present = sample.getContainer().isPresent()
+                if present:
+                    datamatrix = '          '   
                 else:
-                    # basket was removed
-                    present = False
-                    scanned = False
                     datamatrix = None
-                    basket._setInfo(present, datamatrix, scanned)
-                # set the information for all dependent samples
-                for sample_index in range(Basket.NO_OF_SAMPLES_PER_PUCK):
-                    sample = self.getComponentByAddress(Pin.getSampleAddress((basket_index + 1), (sample_index + 1)))
-                    present = sample.getContainer().isPresent()
-                    if present:
-                        datamatrix = '          '   
-                    else:
-                        datamatrix = None
-                    scanned = False
-                    sample._setInfo(present, datamatrix, scanned)
-                    # forget about any loaded state in newly mounted or removed basket)
-                    loaded = has_been_loaded = False
-                    sample._setLoaded(loaded, has_been_loaded)
+                scanned = False
+                sample._setInfo(present, datamatrix, scanned)
+                # forget about any loaded state in newly mounted or removed basket)
+                loaded = has_been_loaded = False
+                sample._setLoaded(loaded, has_been_loaded)
 
@@ -125,6 +125,7 @@ class Component(object):
         """
         Clears all sample info (also in components if object is a container)
         """        
+        former_id, former_present = self.id, self.present
         changed=False
         if self.id!=None:
             self.id=None
@@ -135,10 +136,13 @@ class Component(object):
         if self.scanned:
             self.scanned=False
             changed=True
-        if changed: self._setDirty()
+        if changed: 
+            self._setDirty()
+            self._infoChanged(former_id, former_present)
             
     #########################           PROTECTED           #########################    
     def _setInfo(self, present=False, id=None, scanned = False):
+        former_id, former_present = self.id, self.present
         changed=False
         if self.id!=id:
             self.id=id
@@ -153,7 +157,9 @@ class Component(object):
         if self.scanned!=scanned:
             self.scanned=scanned
             changed=True
-        if changed: self._setDirty()
+        if changed: 
+            self._setDirty()
+            self._infoChanged(former_id, former_present)
 
     def _setSelected(self, selected):
         if (selected):
@@ -161,7 +167,26 @@ class Component(object):
                 c._setSelected(False)
             if self.getContainer() is not None:
                 self.getContainer()._setSelected(True)
-        self.selected=selected
+        if self.selected!=selected:
+            self.selected=selected
+            for container in self._getIndexingContainers():
+                container._componentSelectionChanged(self)
+
+    def _infoChanged(self, former_id, former_present):
+        for container in self._getIndexingContainers():
+            container._componentInfoChanged(self, former_id, former_present)
+
+    def _getIndexingContainers(self):
+        """
+        Returns the containers holding this element in their indexes: the
+        parent, its parent ... as long as each one has been added to its parent
+        """
+        containers = []
+        component, container = self, self.getContainer()
+        while container is not None and component in container._component_set:
+            containers.append(container)
+            component, container = container, container.getContainer()
+        return containers
         
         
     def _isDirty(self):
@@ -9,6 +9,14 @@ class Container(Component):
         super(Container, self).__init__(container, address, scannable)
         self.type = type
         self.components = []     
+        # indexes of all the components under this container (recursivelly),
+        # maintained by _addComponent, _setInfo and _setSelected
+        self._component_set = set()
+        self._address_index = {}
+        self._id_index = {}
+        self._present_samples = set()
+        self._selected_samples = set()
+        self._sample_list = None
     
     
     #########################           PUBLIC           #########################
@@ -41,15 +49,18 @@ class Container(Component):
     def getSampleList(self):
         """
         Returns the list of all Sample objects under of this container (recursivelly)
+        The list is cached until a component is added or removed.
         :rtype: list 
         """        
-        samples=[]
-        for c in self.getComponents():
-            if isinstance(c,Sample):
-                samples.append(c)
-            else:
-                samples.extend(c.getSampleList())
-        return samples
+        if self._sample_list is None:
+            samples=[]
+            for c in self.getComponents():
+                if isinstance(c,Sample):
+                    samples.append(c)
+                else:
+                    samples.extend(c.getSampleList())
+            self._sample_list = samples
+        return self._sample_list
 
     def getBasketList(self):
         basket_list = []
@@ -64,33 +75,25 @@ class Container(Component):
         :rtype: list 
         """        
         ret = []
-        for sample in self.getSampleList():
-            if sample.isPresent():
-                ret.append(sample)
+        if self._present_samples:
+            for sample in self.getSampleList():
+                if sample in self._present_samples:
+                    ret.append(sample)
+        return ret
 
     def isEmpty(self):
         """
         Returns true if there is no sample present sample under this container
         :rtype: bool 
         """        
-        for s in self.getSampleList():
-            if s.isPresent():
-                return False
-        return True
+        return not self._present_samples
 
     def getComponentByAddress(self, address):
         """
         Returns a component through its slot address or None if address is invalid
         :rtype: Component 
         """        
-        for c in self.getComponents():
-            if c.getAddress() == address:
-                return c            
-            if isinstance(c,Container):
-                aux=c.getComponentByAddress(address)
-                if aux is not None:
-                    return aux
-        return None
+        return self._address_index.get(address)
 
     def hasComponentAddress(self, address):
         """
@@ -104,6 +107,13 @@ class Container(Component):
         Returns a component through its id or None if id is invalid
         :rtype: Component 
         """        
+        if id is not None:
+            components = self._id_index.get(id)
+            if not components:
+                return None
+            if len(components) == 1:
+                return next(iter(components))
+        # several components share the id (or id is None): first one found
         for c in self.getComponents():
             if c.getID() == id:
                 return c            
@@ -122,6 +132,10 @@ class Container(Component):
         return self.getComponentById(id) is not None
     
     def getSelectedSample(self):
+        if len(self._selected_samples) < 2:
+            for s in self._selected_samples:
+                return s
+            return None
         for s in self.getSampleList():
             if s.isSelected():
                 return s
@@ -142,12 +156,78 @@ class Container(Component):
     
     def _addComponent(self, c):
         self.components.append(c)
+        self._component_set.add(c)
+        components = [c]
+        if isinstance(c, Container):
+            components.extend(c._iterComponents())
+        for container in [self] + self._getIndexingContainers():
+            container._indexComponents(components)
 
     def _removeComponent(self, c):
         self.components.remove(c)
+        self._component_set.discard(c)
+        components = [c]
+        if isinstance(c, Container):
+            components.extend(c._iterComponents())
+        for container in [self] + self._getIndexingContainers():
+            container._unindexComponents(components)
 
     def _clearComponents(self):
-        self.components = []     
+        for c in list(self.components):
+            self._removeComponent(c)
+
+    def _iterComponents(self):
+        for c in self.components:
+            yield c
+            if isinstance(c, Container):
+                for aux in c._iterComponents():
+                    yield aux
+
+    def _indexComponents(self, components):
+        self._sample_list = None
+        for c in components:
+            self._address_index.setdefault(c.getAddress(), c)
+            if c.getID() is not None:
+                self._id_index.setdefault(c.getID(), set()).add(c)
+            if c.isLeaf():
+                if c.isPresent():
+                    self._present_samples.add(c)
+                if c.isSelected():
+                    self._selected_samples.add(c)
+
+    def _unindexComponents(self, components):
+        self._sample_list = None
+        for c in components:
+            if self._address_index.get(c.getAddress()) is c:
+                del self._address_index[c.getAddress()]
+            self._unindexId(c, c.getID())
+            self._present_samples.discard(c)
+            self._selected_samples.discard(c)
+
+    def _unindexId(self, c, id):
+        components = self._id_index.get(id)
+        if components is not None:
+            components.discard(c)
+            if not components:
+                del self._id_index[id]
+
+    def _componentInfoChanged(self, c, former_id, former_present):
+        if former_id != c.getID():
+            self._unindexId(c, former_id)
+            if c.getID() is not None:
+                self._id_index.setdefault(c.getID(), set()).add(c)
+        if c.isLeaf():
+            if c.isPresent():
+                self._present_samples.add(c)
+            else:
+                self._present_samples.discard(c)
+
+    def _componentSelectionChanged(self, c):
+        if c.isLeaf():
+            if c.isSelected():
+                self._selected_samples.add(c)
+            else:
+                self._selected_samples.discard(c)
 
     def _resetDirty(self):
         Component._resetDirty(self)
@@ -155,11 +235,11 @@ class Container(Component):
             c._resetDirty()  
 
     def _setSelectedSample(self,sample):
-        for s in self.getSampleList():
-            if s==sample:
-                s._setSelected(True)
-            else:
+        for s in list(self._selected_samples):
+            if s!=sample:
                 s._setSelected(False)
+        if sample is not None and self._address_index.get(sample.getAddress()) is sample:
+            sample._setSelected(True)
     
     def _setSelectedComponent(self, component):
         if component is None:
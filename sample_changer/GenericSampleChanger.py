@@ -93,12 +93,26 @@ class SampleChanger(Container,Equipment):
         self._token=None
         self._timer_update_inverval = 5 # defines the interval in periods of 100 ms
         self._timer_update_counter = 0            
+        self._update_coalesce_delay = 0.05
+        self._safety_update_interval = 100 # polling interval when all update channels send updates
+        self._dirty_parts = set()
+        self._dirty_parts_task = None
+        self._update_callbacks = []
+        self._update_channels = []
 
     def init(self):
         use_update_timer = self.getProperty("useUpdateTimer")
         if use_update_timer is None:
             use_update_timer = True
 
+        update_timer_interval = self.getProperty("updateTimerInterval")
+        if update_timer_interval is not None:
+            self._setTimerUpdateInterval(int(update_timer_interval))
+        elif self._update_channels and \
+             all(map(self._channelSendsUpdates, self._update_channels)):
+            # channel updates keep the info up to date, polling is only a safety net
+            self._setTimerUpdateInterval(self._safety_update_interval)
+
         if use_update_timer:
             task1s=self.__timer_1s_task(wait=False)
             task1s.link(self._onTimer1sExit)
@@ -131,7 +145,7 @@ class SampleChanger(Container,Equipment):
             try:
                 if self.isEnabled():
                     self._timer_update_counter += 1
-                    if (self._timer_update_counter >= self._timer_update_counter):
+                    if (self._timer_update_counter >= self._timer_update_inverval):
                         self._onTimerUpdate()
                         self._timer_update_counter = 0
             except:
@@ -144,6 +158,56 @@ class SampleChanger(Container,Equipment):
     def _onTimerUpdate(self):        
         #if not self.isExecutingTask():
             self.updateInfo()  
+
+#########################           EVENTS           #########################
+    def _connectUpdateChannel(self, channel, *parts):
+        """
+        Descript. : marks parts of the sample changer info as dirty each
+                    time channel is updated
+        """
+        if channel is None:
+            return
+        self._update_channels.append(channel)
+        if not self._channelSendsUpdates(channel):
+            logging.getLogger("HWR").debug("Sample changer: channel %s " \
+                "is neither polled nor event driven, info is polled" % \
+                channel.name())
+        def channel_updated(*args):
+            self._markDirty(*parts)
+        # dispatcher keeps weak references to the receivers
+        self._update_callbacks.append(channel_updated)
+        channel.connectSignal("update", channel_updated)
+
+    @staticmethod
+    def _channelSendsUpdates(channel):
+        """
+        Descript. : True if channel emits "update" by itself. Tango
+                    channels only do so when polled or event driven
+        """
+        if hasattr(channel, "polling"):
+            return bool(channel.polling)
+        return True
+
+    def _markDirty(self, *parts):
+        """
+        Descript. : schedules the update of parts. Parts marked dirty
+                    within the coalesce delay are updated together
+        """
+        self._dirty_parts.update(parts)
+        if self._dirty_parts_task is None:
+            self._dirty_parts_task = gevent.spawn_later(\
+                self._update_coalesce_delay, self._updateDirtyParts)
+
+    def _updateDirtyParts(self):
+        self._dirty_parts_task = None
+        parts = self._dirty_parts
+        self._dirty_parts = set()
+        if parts:
+            try:
+                self.updateInfo(parts)
+            except:
+                logging.getLogger("HWR").exception(\
+                    "Sample changer: could not update %s" % ", ".join(map(str, parts)))
              
     def _onTimer1s(self):
         pass        
@@ -279,11 +343,16 @@ class SampleChanger(Container,Equipment):
                 self.task_error=None
         
 
-    def updateInfo(self):
+    def updateInfo(self, parts=None):
         """
+        Descript. : updates the sample changer info, only the given parts
+                    if parts is not None
         """
         former_loaded = self.getLoadedSample()
-        self._doUpdateInfo()        
+        if parts is None:
+            self._doUpdateInfo()        
+        else:
+            self._doUpdateParts(parts)
         if self._isDirty():
             self._triggerInfoChangedEvent()
         
@@ -417,6 +486,13 @@ class SampleChanger(Container,Equipment):
     def _doUpdateInfo(self):
         return
 
+    def _doUpdateParts(self, parts):
+        """
+        Updates the parts of the info marked dirty by _markDirty, the whole
+        info is updated unless the sample changer implements it
+        """
+        self._doUpdateInfo()
+
     @abc.abstractmethod
     def _doChangeMode(self,mode):
         return